@@ -0,0 +1,55 @@
+""" Encode and decode throughput of the binary wire protocol.
+
+Usage: python benchmarks/protocol.py [hands]
+"""
+import sys, time
+
+from tcp_ip_poker import Deck
+from tcp_ip_poker.protocol import Decoder, Encoder
+
+PLAYERS = ['10.0.0.1:50001', '10.0.0.2:50002', '10.0.0.3:50003', '10.0.0.4:50004']
+
+
+def encode_hand(encoder: Encoder, deck: Deck):
+    """ Encodes the events one player receives during one hand """
+    encoder.players(PLAYERS)
+    encoder.deal(0, deck.get_cards(2))
+    board = deck.get_cards(5)
+    for street in (3, 4, 5):
+        encoder.board(board[:street])
+        for seat in range(len(PLAYERS)):
+            encoder.turn(seat)
+            encoder.checked(seat)
+    encoder.result(False, [1])
+
+
+def main(hands: int = 100000):
+    deck = Deck()
+    encoder = Encoder()
+    start = time.perf_counter()
+    chunks = []
+    for _ in range(hands):
+        deck.fill()
+        encode_hand(encoder, deck)
+        chunks.append(encoder.flush())
+    encode_time = time.perf_counter() - start
+    frames = 1 + 1 + 3 * (1 + 2 * len(PLAYERS)) + 1
+
+    decoder = Decoder()
+    decoded = 0
+    start = time.perf_counter()
+    for chunk in chunks:
+        decoder.feed(chunk)
+        for frame_type, body in decoder.frames():
+            decoded += 1
+    decode_time = time.perf_counter() - start
+    assert decoded == hands * frames
+
+    size = sum(len(chunk) for chunk in chunks)
+    print(f'{hands} hands, {frames} frames and {size / hands:.0f} bytes per hand')
+    print(f'encode {hands * frames / encode_time:,.0f} frames/s')
+    print(f'decode {hands * frames / decode_time:,.0f} frames/s')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,304 @@
+""" Benchmark suite of the engine, evaluator and wire protocol.
+
+Usage: python benchmarks/run.py [-k name] [--quick] [--output results.json]
+                                [--baseline baseline.json] [--tolerance 0.1]
+
+Every benchmark runs a fixed workload from a fixed seed so runs are comparable.
+Speed is the best of several repeats reported as operations per second. The
+workload is then run once more under tracemalloc to report the peak traced memory
+and the memory blocks still allocated afterwards per operation, which catch
+accidental copies and leaks that timing noise hides.
+
+With --output the results are written as JSON and with --baseline they are
+compared against an earlier output. A benchmark slower than the baseline by more
+than the tolerance is flagged and the exit status is 1, so a baseline kept next to
+the code can be checked before merging:
+
+    python benchmarks/run.py --output benchmarks/baseline.json
+    python benchmarks/run.py --baseline benchmarks/baseline.json
+"""
+from __future__ import annotations
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import argparse, gc, json, platform, random, sys, time, tracemalloc
+
+from tcp_ip_poker import Card, Deck, TexasHoldem, VictoryCombination, evaluator, simulation
+from tcp_ip_poker.protocol import Decoder, Encoder
+from tcp_ip_poker.tournament import Tournament
+
+import protocol as protocol_benchmark
+
+SEED = 1234
+REPEATS = 5
+TOLERANCE = 0.1
+
+# Benchmark name, function building the workload and the operations it runs
+_BENCHMARKS: List[Tuple[str, Callable[[int], Callable[[], None]], int]] = []
+
+
+def benchmark(operations: int):
+    """ Registers a function that prepares a workload of given operations from a seed
+    and returns a callable running it.
+    """
+    def register(prepare: Callable[[int], Callable[[], None]]):
+        _BENCHMARKS.append((prepare.__name__, prepare, operations))
+        return prepare
+    return register
+
+
+def _random_hands(rng: random.Random, count: int, size: int) -> List[List[Card]]:
+    cards = [Card.from_id(card_id) for card_id in range(Card.IDS)]
+    return [rng.sample(cards, size) for _ in range(count)]
+
+
+@benchmark(20000)
+def evaluate_7(operations: int) -> Callable[[], None]:
+    """ Random 7 card hands through the scalar evaluator """
+    masks = [sum(card.mask for card in hand) for hand in _random_hands(random.Random(SEED), operations, 7)]
+    evaluate = evaluator.evaluate_mask
+
+    def run():
+        for mask in masks:
+            evaluate(mask)
+    return run
+
+
+@benchmark(5000)
+def best_combination(operations: int) -> Callable[[], None]:
+    """ Random 7 card hands through determine_best_combination """
+    hands = _random_hands(random.Random(SEED), operations, 7)
+
+    def run():
+        for hand in hands:
+            VictoryCombination.determine_best_combination(hand)
+    return run
+
+
+@benchmark(5000)
+def deal(operations: int) -> Callable[[], None]:
+    """ Refill, shuffle and deal four hands and a board """
+    deck = Deck()
+
+    def run():
+        random.seed(SEED)
+        for _ in range(operations):
+            deck.fill()
+            deck.shuffle()
+            for _ in range(4):
+                deck.get_cards(2)
+            deck.get_cards(5)
+    return run
+
+
+def _play_hand(game: TexasHoldem):
+    game.start()
+    while game.active:
+        game.check(game.players_turn)
+
+
+@benchmark(1000)
+def showdown(operations: int) -> Callable[[], None]:
+    """ Full four player hands from start to showdown """
+    def run():
+        random.seed(SEED)
+        for _ in range(operations):
+            game = TexasHoldem()
+            for idx in range(TexasHoldem.MAXIMUM_PLAYERS):
+                game.add_player(f'NPC{idx}')
+            _play_hand(game)
+    return run
+
+
+@benchmark(10000)
+def snapshot(operations: int) -> Callable[[], None]:
+    """ Snapshot and restore of a four player hand after the flop """
+    random.seed(SEED)
+    game = TexasHoldem()
+    for idx in range(TexasHoldem.MAXIMUM_PLAYERS):
+        game.add_player(f'NPC{idx}')
+    game.start()
+    players = game.players
+
+    def run():
+        for _ in range(operations):
+            TexasHoldem.restore(game.snapshot(), players)
+    return run
+
+
+@benchmark(100000)
+def replay(operations: int) -> Callable[[], None]:
+    """ Replay of recorded four player hands, operations are events """
+    random.seed(SEED)
+    hosts = [f'NPC{idx}' for idx in range(TexasHoldem.MAXIMUM_PLAYERS)]
+    hands = []
+    events = 0
+    while events < operations:
+        game = TexasHoldem()
+        for host in hosts:
+            game.add_player(host)
+        _play_hand(game)
+        hands.append(list(game.events)[:operations - events])
+        events += len(hands[-1])
+
+    def run():
+        for hand in hands:
+            TexasHoldem.replay(hand, hosts)
+    return run
+
+
+@benchmark(1000)
+def many_tables(operations: int) -> Callable[[], None]:
+    """ Hands on 100 tables advanced one action at a time in turn, like a server does """
+    tables = 100
+
+    def run():
+        random.seed(SEED)
+        games = []
+        for table in range(tables):
+            game = TexasHoldem()
+            for idx in range(2 + table % (TexasHoldem.MAXIMUM_PLAYERS - 1)):
+                game.add_player(f'NPC{table}-{idx}')
+            game.start()
+            games.append(game)
+        hands = 0
+        while hands < operations:
+            for idx, game in enumerate(games):
+                if game.active:
+                    game.check(game.players_turn)
+                    continue
+                hands += 1
+                players = [player.host for player in game.players]
+                game = games[idx] = TexasHoldem()
+                for host in players:
+                    game.add_player(host)
+                game.start()
+    return run
+
+
+@benchmark(2000)
+def tournament(operations: int) -> Callable[[], None]:
+    """ Tournament played to the last entrant in one process, operations are entrants """
+    def run():
+        Tournament(operations, seed=SEED).run(processes=1)
+    return run
+
+
+@benchmark(10000)
+def simulate_hands(operations: int) -> Callable[[], None]:
+    """ Headless four player hands in one process """
+    def run():
+        for _ in simulation.hands(operations, seed=SEED, processes=1):
+            pass
+    return run
+
+
+@benchmark(2000)
+def protocol_encode(operations: int) -> Callable[[], None]:
+    """ Binary frames of whole hands encoded and decoded """
+    deck = Deck()
+    encoder = Encoder()
+    decoder = Decoder()
+
+    def run():
+        random.seed(SEED)
+        for _ in range(operations):
+            deck.fill()
+            deck.shuffle()
+            protocol_benchmark.encode_hand(encoder, deck)
+            decoder.feed(encoder.flush())
+            for _ in decoder.frames():
+                pass
+    return run
+
+
+try:
+    import numpy as np
+    from tcp_ip_poker import batch
+except ImportError:
+    np = None
+else:
+    @benchmark(200000)
+    def evaluate_batch(operations: int) -> Callable[[], None]:
+        """ Random 7 card hands through the NumPy batch evaluator """
+        rng = np.random.default_rng(SEED)
+        hands = np.argsort(rng.random((operations, Card.IDS)), axis=1)[:, :7].astype(np.int8)
+
+        def run():
+            batch.evaluate_batch(hands)
+        return run
+
+
+def measure(prepare: Callable[[int], Callable[[], None]], operations: int, repeats: int) -> Dict[str, float]:
+    """ Returns ops per second, peak traced bytes and blocks left allocated per operation """
+    run = prepare(operations)
+    run()
+    best = float('inf')
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    run()
+    gc.collect()
+    peak = tracemalloc.get_traced_memory()[1]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+    return {
+        'ops_per_sec': operations / best,
+        'peak_bytes': peak,
+        'blocks_per_op': blocks / operations
+    }
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """ Returns the names of benchmarks slower than the baseline by more than tolerance """
+    return [name for name, result in results.items()
+            if name in baseline and result['ops_per_sec'] < baseline[name]['ops_per_sec'] * (1 - tolerance)]
+
+
+def main(args: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-k', dest='names', action='append', help='run only benchmarks containing this')
+    parser.add_argument('--quick', action='store_true', help='tenth of the workload and one repeat')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='compare against results JSON in this file')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help='allowed slowdown, default 0.1')
+    options = parser.parse_args(args)
+
+    baseline = {}
+    if options.baseline:
+        with open(options.baseline) as file:
+            baseline = json.load(file)['benchmarks']
+    results = {}
+    for name, prepare, operations in _BENCHMARKS:
+        if options.names and not any(part in name for part in options.names):
+            continue
+        if options.quick:
+            operations = max(operations // 10, 1)
+        result = results[name] = measure(prepare, operations, 1 if options.quick else REPEATS)
+        line = (f'{name:<18} {result["ops_per_sec"]:>14,.0f} ops/s {result["peak_bytes"] / 1024:>10,.0f} KB peak'
+                f' {result["blocks_per_op"]:>8.2f} blocks/op')
+        if name in baseline:
+            line += f' {result["ops_per_sec"] / baseline[name]["ops_per_sec"] - 1:>+8.1%}'
+        print(line, flush=True)
+
+    if options.output:
+        with open(options.output, 'w') as file:
+            json.dump({
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'benchmarks': results
+            }, file, indent=2)
+    regressions = compare(results, baseline, options.tolerance)
+    for name in regressions:
+        print(f'REGRESSION {name} is more than {options.tolerance:.0%} slower than baseline')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -29,7 +29,11 @@ setup(
     tests_requires=[
         'pytest==6.1.2'
     ],
-    extras_require={},
+    extras_require={
+        'batch': ['numpy'],
+    },
     package_data={},
-    entry_points={}
+    entry_points={
+        'console_scripts': ['tcp-ip-poker=tcp_ip_poker.server:main'],
+    }
 )
\ No newline at end of file
@@ -1 +1,41 @@
-from tcp_ip_poker.poker import Suit, Card, Deck, Player, TexasHoldem, VictoryCombination
\ No newline at end of file
+""" TCP/IP poker server and Texas Hold'em engine.
+
+The public API is loaded on first access so importing the package, which every
+worker process does, costs next to nothing until a name is used.
+"""
+import importlib
+
+# typing alone takes longer to import than the rest of the package root
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from tcp_ip_poker.poker import (
+        Action, Suit, Card, CardSet, Deck, EventType, GameEvent, Player, TexasHoldem, VictoryCombination
+    )
+
+_EXPORTS = {
+    'Action': 'tcp_ip_poker.poker',
+    'Suit': 'tcp_ip_poker.poker',
+    'Card': 'tcp_ip_poker.poker',
+    'CardSet': 'tcp_ip_poker.poker',
+    'Deck': 'tcp_ip_poker.poker',
+    'EventType': 'tcp_ip_poker.poker',
+    'GameEvent': 'tcp_ip_poker.poker',
+    'Player': 'tcp_ip_poker.poker',
+    'TexasHoldem': 'tcp_ip_poker.poker',
+    'VictoryCombination': 'tcp_ip_poker.poker'
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
@@ -0,0 +1,3 @@
+from tcp_ip_poker.server import main
+
+main()
@@ -0,0 +1,196 @@
+""" Vectorized hand evaluation with NumPy.
+
+Hands are given as an integer array of card ids (see Card.id) with one hand per
+row and five to seven cards per row. The strengths returned are the same integers
+evaluator.evaluate returns, so categories and comparisons are consistent with
+VictoryCombination.
+
+Every card adds its rank into a 3 bit counter of a 64 bit key, so summing the
+columns of a row gives the rank counts of the hand without sorting. The counts
+are turned into a dense perfect hash (the position of the rank multiset in
+quinary order) with one table for the low seven ranks and one for the high six,
+which is then used to index the strength table. Flushes use the 13 bit rank mask
+of each suit like the scalar evaluator, summed the same way into 16 bit fields.
+The tables are arrays over a memory-mapped table file (see tcp_ip_poker.tables)
+so processes evaluating batches share them.
+
+Requires NumPy which is installed with the 'batch' extra.
+"""
+from __future__ import annotations
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+import itertools
+
+import numpy as np
+
+from tcp_ip_poker import evaluator, tables
+
+CHUNK_SIZE = 1 << 14
+SUITS = 4
+MAX_COUNT = 4
+COUNT_BITS = 3
+SUIT_SHIFT = 16
+LOW_RANKS = 7
+LOW_KEY_MASK = (1 << (COUNT_BITS * LOW_RANKS)) - 1
+TABLES_VERSION = 1
+
+_ways: Sequence[Sequence[int]] = []
+_tables: Dict[str, np.ndarray] = {}
+
+
+def evaluate_batch(cards: np.ndarray) -> np.ndarray:
+    """ Returns the strength of each hand (row) in given array of card ids. Rows must
+    have from 5 to 7 distinct cards.
+    """
+    cards = np.asarray(cards)
+    if cards.ndim != 2 or not evaluator.HAND_SIZE <= cards.shape[1] <= evaluator.MAX_CARDS:
+        raise ValueError('Cards must be an array of shape (hands, 5 to 7)')
+    if cards.size and (cards.min() < 0 or cards.max() >= SUITS * evaluator.RANKS):
+        raise ValueError('Invalid card id')
+    if not _tables:
+        load_tables()
+    low = _tables['low']
+    high = _tables[f'high{cards.shape[1]}']
+    strengths = _tables[f'strengths{cards.shape[1]}']
+    flushes = _tables['flush']
+    result = np.empty(len(cards), dtype=np.int32)
+    for start in range(0, len(cards), CHUNK_SIZE):
+        columns = np.ascontiguousarray(cards[start:start + CHUNK_SIZE].T)
+        counts = _sum_rows(_COUNT_BIT_OF_ID[columns])
+        masks = _sum_rows(_SUIT_BIT_OF_ID[columns])
+        index = high[counts >> (COUNT_BITS * LOW_RANKS)]
+        index += low[counts & LOW_KEY_MASK]
+        chunk = strengths[index]
+        for suit in range(SUITS):
+            suit_mask = (masks >> (SUIT_SHIFT * suit)) & evaluator.SUIT_MASK
+            np.maximum(chunk, flushes[suit_mask], out=chunk)
+        result[start:start + len(chunk)] = chunk
+    return result
+
+
+def categories(strengths: np.ndarray) -> np.ndarray:
+    """ Returns the VictoryCombination value of each strength """
+    return np.asarray(strengths) >> evaluator.CATEGORY_SHIFT
+
+
+def deal_orders(
+        decks: int,
+        cards: int = SUITS * evaluator.RANKS,
+        live: Optional[Sequence[int]] = None,
+        rng: Optional[np.random.Generator] = None
+    ) -> np.ndarray:
+    """ Returns the first cards dealt from each of given number of independently shuffled
+    decks as rows of card ids. Decks hold the live card ids, all 52 cards by default.
+    Only the dealt positions are shuffled (a partial Fisher-Yates shuffle), one column
+    at a time for every deck at once.
+    """
+    live = np.arange(SUITS * evaluator.RANKS, dtype=np.int8) if live is None else np.asarray(live, dtype=np.int8)
+    if not 0 <= cards <= len(live):
+        raise ValueError('Can not deal more cards than the deck has')
+    rng = rng if rng is not None else np.random.default_rng()
+    deals = np.tile(live, (decks, 1))
+    rows = np.arange(decks)
+    for column in range(cards):
+        picks = rng.integers(column, len(live), size=decks)
+        picked = deals[rows, picks]
+        deals[rows, picks] = deals[:, column]
+        deals[:, column] = picked
+    return deals[:, :cards]
+
+
+def to_array(hands: Iterable[Sequence]) -> np.ndarray:
+    """ Returns an array of card ids from hands given as sequences of cards """
+    return np.array([[card.id for card in hand] for hand in hands], dtype=np.int8)
+
+
+def load_tables():
+    """ Maps the evaluation tables, building the table file if needed. Called on the
+    first evaluation.
+    """
+    arrays = tables.load('batch', TABLES_VERSION, _build_tables)
+    _tables.update((name, np.frombuffer(array, dtype=np.int32)) for name, array in arrays.items())
+
+# --- Private functions ---
+
+def _sum_rows(rows: np.ndarray) -> np.ndarray:
+    total = rows[0].copy()
+    for row in rows[1:]:
+        total += row
+    return total
+
+
+def _build_tables() -> Dict[str, np.ndarray]:
+    arrays = {'flush': np.array(evaluator.flush_strengths(), dtype=np.int32), 'low': _low_hashes()}
+    for size in range(evaluator.HAND_SIZE, evaluator.MAX_CARDS + 1):
+        arrays[f'high{size}'], arrays[f'strengths{size}'] = _high_hashes(size, arrays['low'])
+    return arrays
+
+
+def _multisets(ranks: int, cards: int) -> int:
+    """ Returns the number of ways to spread given cards over given ranks """
+    if not _ways:
+        ways = [[0] * (evaluator.MAX_CARDS + 1) for _ in range(evaluator.RANKS + 1)]
+        ways[0][0] = 1
+        for r in range(1, evaluator.RANKS + 1):
+            for n in range(evaluator.MAX_CARDS + 1):
+                ways[r][n] = sum(ways[r - 1][n - c] for c in range(min(MAX_COUNT, n) + 1))
+        _ways[:] = ways
+    return _ways[ranks][cards]
+
+
+def _partial_hash(counts: Sequence[int], low_rank: int, remaining: int) -> int:
+    """ Returns the hash part of given counts starting from low_rank. Ranks are numbered
+    from the highest down, each count skips the multisets where that rank has fewer
+    of the remaining cards.
+    """
+    result = 0
+    for rank in range(low_rank + len(counts) - 1, low_rank - 1, -1):
+        count = counts[rank - low_rank]
+        result += sum(_multisets(rank, remaining - c) for c in range(count))
+        remaining -= count
+    return result
+
+
+def _count_key(counts: Sequence[int]) -> int:
+    return sum(count << (COUNT_BITS * rank) for rank, count in enumerate(counts))
+
+
+def _low_hashes() -> np.ndarray:
+    """ Returns the hash part of the low ranks indexed by their count key. The cards
+    left for the low ranks are exactly the ones counted there so it does not depend
+    on the hand size.
+    """
+    table = np.zeros(LOW_KEY_MASK + 1, dtype=np.int32)
+    for counts in itertools.product(range(MAX_COUNT + 1), repeat=LOW_RANKS):
+        total = sum(counts)
+        if total <= evaluator.MAX_CARDS:
+            table[_count_key(counts)] = _partial_hash(counts, 0, total)
+    return table
+
+
+def _high_hashes(size: int, low: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """ Returns the hash part of the high ranks indexed by their count key and the
+    strength table indexed by the full hash for hands of given size.
+    """
+    high_ranks = evaluator.RANKS - LOW_RANKS
+    table = np.zeros(1 << (COUNT_BITS * high_ranks), dtype=np.int32)
+    for counts in itertools.product(range(MAX_COUNT + 1), repeat=high_ranks):
+        if sum(counts) <= size:
+            table[_count_key(counts)] = _partial_hash(counts, LOW_RANKS, size)
+    strengths = np.zeros(_multisets(evaluator.RANKS, size), dtype=np.int32)
+    for combination in itertools.combinations_with_replacement(range(evaluator.RANKS), size):
+        counts = [0] * evaluator.RANKS
+        for rank in combination:
+            counts[rank] += 1
+        if max(counts) > MAX_COUNT:
+            continue
+        key = _count_key(counts)
+        index = table[key >> (COUNT_BITS * LOW_RANKS)] + low[key & LOW_KEY_MASK]
+        strengths[index] = evaluator.evaluate_ranks(counts)
+    return table, strengths
+
+_COUNT_BIT_OF_ID = np.array(
+    [1 << (COUNT_BITS * (card_id % evaluator.RANKS)) for card_id in range(SUITS * evaluator.RANKS)],
+    dtype=np.int64)
+_SUIT_BIT_OF_ID = np.array(
+    [1 << (card_id % evaluator.RANKS + SUIT_SHIFT * (card_id // evaluator.RANKS))
+     for card_id in range(SUITS * evaluator.RANKS)], dtype=np.int64)
@@ -0,0 +1,207 @@
+""" Monte Carlo equity of hole cards against random opponent hands.
+
+The unknown cards (rest of the board and the opponents' hole cards) are sampled
+from the Deck without the known cards. Samples are run in batches that are spread
+over a process pool. Batch n always uses its own random stream derived from the
+seed and batch results are combined in batch order, so a seeded run gives the
+same result regardless of how many processes run it. Sampling stops once the
+confidence interval of the equity is narrower than the requested margin.
+
+When NumPy is installed batches are sampled and evaluated with the batch
+evaluator, otherwise with the scalar evaluator one sample at a time.
+"""
+from __future__ import annotations
+from concurrent.futures import Executor
+from typing import Iterable, NamedTuple, Optional, Sequence, Tuple
+import contextlib, math, random, statistics
+
+from tcp_ip_poker import evaluator, isomorphism, pool
+from tcp_ip_poker.isomorphism import LRUCache
+from tcp_ip_poker.poker import Card, CardSet, Deck
+
+try:
+    import numpy as np
+    from tcp_ip_poker import batch
+except ImportError:
+    np = None
+    batch = None
+
+HOLE_CARDS = 2
+BOARD_CARDS = 5
+BATCH_SIZE = 10000
+
+
+class Equity(NamedTuple):
+    """ Result of equity calculation. Win, tie and lose are shares of samples and equity
+    is the expected share of the pot with ties split between the tied players.
+    """
+    win: float
+    tie: float
+    lose: float
+    equity: float
+    samples: int
+    margin: float
+
+
+def equity(
+        hole: Iterable[Card],
+        board: Iterable[Card] = (),
+        opponents: int = 1,
+        margin: float = 0.005,
+        confidence: float = 0.95,
+        max_samples: int = 1000000,
+        seed: Optional[int] = None,
+        processes: Optional[int] = None,
+        executor: Optional[Executor] = None,
+        batch_size: int = BATCH_SIZE,
+        cache: Optional[LRUCache] = None
+    ) -> Equity:
+    """ Returns the equity of given hole cards against given number of opponents with
+    given known board cards. Sampling stops when the half width of the confidence
+    interval is at most margin or after max_samples. Batches are run on given executor
+    or on a new process pool of given size (all cores by default). Processes 1 runs
+    everything in the calling process. With a cache (e.g. isomorphism.CACHE) results
+    are computed for the suit canonical form of the cards and reused for every hand
+    and board isomorphic to it.
+    """
+    hole = CardSet(hole)
+    board = CardSet(board)
+    if len(hole) != HOLE_CARDS:
+        raise ValueError('Hole must have 2 distinct cards')
+    if len(board) > BOARD_CARDS or not hole.isdisjoint(board):
+        raise ValueError('Board must have at most 5 cards distinct from the hole cards')
+    if not 0 < opponents <= (Deck.MAX_DECK_SIZE - HOLE_CARDS - BOARD_CARDS) // HOLE_CARDS:
+        raise ValueError('Invalid amount of opponents')
+    if not 0 < confidence < 1 or margin <= 0 or max_samples < 1 or batch_size < 1:
+        raise ValueError('Invalid sampling parameters')
+    if cache is not None:
+        hole_mask, board_mask = isomorphism.canonical_masks(hole.mask, board.mask)
+        key = ('equity', hole_mask, board_mask, opponents, margin, confidence, max_samples, seed, batch_size)
+        return cache.get_or_compute(key, lambda: equity(
+            CardSet(hole_mask), CardSet(board_mask), opponents, margin, confidence, max_samples, seed,
+            processes, executor, batch_size))
+    if seed is None:
+        seed = random.randrange(1 << 63)
+
+    z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+    batches = math.ceil(max_samples / batch_size)
+    jobs = ((hole.mask, board.mask, opponents, min(batch_size, max_samples - idx * batch_size), seed, idx)
+            for idx in range(batches))
+
+    totals = [0, 0, 0, 0.0, 0.0]
+    half_width = 1.0
+    with contextlib.closing(pool.run(simulate, jobs, processes, executor)) as results:
+        for result in results:
+            for idx, value in enumerate(result):
+                totals[idx] += value
+            samples = totals[0] + totals[1] + totals[2]
+            mean = totals[3] / samples
+            variance = max(totals[4] / samples - mean * mean, 0.0)
+            half_width = z * math.sqrt(variance / samples)
+            if half_width <= margin:
+                break
+    wins, ties, losses, share, _ = totals
+    samples = wins + ties + losses
+    return Equity(wins / samples, ties / samples, losses / samples, share / samples, samples, half_width)
+
+
+def simulate(
+        hole: int,
+        board: int,
+        opponents: int,
+        samples: int,
+        seed: int,
+        stream: int
+    ) -> Tuple[int, int, int, float, float]:
+    """ Runs one batch of samples for card masks of hole and board cards. Returns wins,
+    ties, losses and the sum and sum of squares of the pot share.
+    """
+    deck = Deck()
+    deck.remove(CardSet(hole | board))
+    live = [card.id for card in deck.card_set]
+    missing = BOARD_CARDS - len(CardSet(board))
+    if batch is not None:
+        return _simulate_batch(hole, board, opponents, samples, seed, stream, live, missing)
+    return _simulate_scalar(hole, board, opponents, samples, seed, stream, live, missing)
+
+# --- Private functions ---
+
+def _simulate_scalar(
+        hole: int,
+        board: int,
+        opponents: int,
+        samples: int,
+        seed: int,
+        stream: int,
+        live: Sequence[int],
+        missing: int
+    ) -> Tuple[int, int, int, float, float]:
+    rng = random.Random(f'{seed}/{stream}')
+    evaluate = evaluator.evaluate_mask
+    wins = ties = losses = 0
+    share = square = 0.0
+    need = missing + HOLE_CARDS * opponents
+    for _ in range(samples):
+        drawn = rng.sample(live, need)
+        table = board
+        for card_id in drawn[:missing]:
+            table |= 1 << card_id
+        own = evaluate(hole | table)
+        best = 0
+        tied = 0
+        for idx in range(missing, need, HOLE_CARDS):
+            strength = evaluate(table | (1 << drawn[idx]) | (1 << drawn[idx + 1]))
+            if strength > best:
+                best, tied = strength, 1
+            elif strength == best:
+                tied += 1
+        if own > best:
+            wins += 1
+            share += 1.0
+            square += 1.0
+        elif own == best:
+            ties += 1
+            share += 1.0 / (tied + 1)
+            square += 1.0 / (tied + 1) ** 2
+        else:
+            losses += 1
+    return wins, ties, losses, share, square
+
+
+def _simulate_batch(
+        hole: int,
+        board: int,
+        opponents: int,
+        samples: int,
+        seed: int,
+        stream: int,
+        live: Sequence[int],
+        missing: int
+    ) -> Tuple[int, int, int, float, float]:
+    rng = np.random.default_rng([seed, stream])
+    need = missing + HOLE_CARDS * opponents
+    deals = batch.deal_orders(samples, need, live, rng)
+
+    known = [card.id for card in CardSet(board)]
+    table = np.empty((samples, BOARD_CARDS), dtype=np.int8)
+    table[:, :len(known)] = known
+    table[:, len(known):] = deals[:, :missing]
+    hand = np.empty((samples, HOLE_CARDS + BOARD_CARDS), dtype=np.int8)
+    hand[:, HOLE_CARDS:] = table
+
+    hand[:, :HOLE_CARDS] = [card.id for card in CardSet(hole)]
+    own = batch.evaluate_batch(hand)
+    best = np.zeros(samples, dtype=np.int32)
+    tied = np.zeros(samples, dtype=np.int32)
+    for column in range(missing, need, HOLE_CARDS):
+        hand[:, :HOLE_CARDS] = deals[:, column:column + HOLE_CARDS]
+        strength = batch.evaluate_batch(hand)
+        tied = np.where(strength > best, 1, tied + (strength == best))
+        np.maximum(best, strength, out=best)
+
+    won = own > best
+    tie = own == best
+    share = np.where(won, 1.0, np.where(tie, 1.0 / (tied + 1), 0.0))
+    wins = int(won.sum())
+    ties = int(tie.sum())
+    return wins, ties, samples - wins - ties, float(share.sum()), float((share * share).sum())
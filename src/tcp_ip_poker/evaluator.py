@@ -0,0 +1,332 @@
+""" Lookup table based hand evaluator.
+
+Every hand of one to seven cards is reduced to a single integer strength where a
+bigger number is always a better hand. The category (see VictoryCombination) is
+stored in the top bits and the five ranks that make up the hand, ordered by
+multiplicity and then by rank, are packed below it four bits each. Because the
+kickers are part of the number two hands can be compared with plain integer
+comparison.
+
+Ranks used in this module go from 0 (two) to 12 (ace). Aces also play low in
+the A-2-3-4-5 straight. Sets of cards can also be given as a mask where bit
+suit index * 13 + rank is set for each card, the layout used by Card.id and
+CardSet.
+
+Non-flush hands are looked up from a table keyed by the product of one prime
+per rank, which is unique for every multiset of ranks. Flushes are looked up
+from a table indexed by the 13 bit rank mask of the flush suit. The tables are
+loaded on first use from a table file (see tcp_ip_poker.tables), which is built
+the first time any process needs it.
+"""
+from __future__ import annotations
+from typing import Dict, Iterable, List, Sequence, Tuple
+import array, itertools
+
+from tcp_ip_poker import tables
+
+RANKS = 13
+MAX_CARDS = 7
+HAND_SIZE = 5
+CATEGORY_SHIFT = 20
+SUIT_MASK = (1 << RANKS) - 1
+PRIMES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)
+TABLES_VERSION = 1
+
+HIGH_CARD = 0
+PAIR = 1
+TWO_PAIRS = 2
+THREE_OF_A_KIND = 3
+STRAIGHT = 4
+FLUSH = 5
+FULL_HOUSE = 6
+FOUR_OF_A_KIND = 7
+STRAIGHT_FLUSH = 8
+
+# Straight masks from ace high down to the wheel and the rank that tops each one
+_STRAIGHTS = [(0b11111 << low, low + 4) for low in range(RANKS - 5, -1, -1)]
+_STRAIGHTS.append(((1 << 12) | 0b1111, 3))
+
+_RANK_SHIFTS = tuple(range(CATEGORY_SHIFT - 4, -1, -4))
+
+_rank_table: Dict[int, int] = {}
+_flush_table: List[int] = []
+_prime_products: List[int] = []
+
+
+def rank_of_value(value: int) -> int:
+    """ Converts Card.value (ace is 1, king is 13) to evaluator rank (two is 0, ace is 12) """
+    return (value - 2) % RANKS
+
+
+def value_of_rank(rank: int) -> int:
+    """ Converts evaluator rank back to Card.value """
+    return (rank + 1) % RANKS + 1
+
+
+def category(strength: int) -> int:
+    """ Returns the category of given strength as VictoryCombination value """
+    return strength >> CATEGORY_SHIFT
+
+
+def ranks(strength: int) -> Sequence[int]:
+    """ Returns the ranks that make up the hand of given strength in order of importance """
+    return [(strength >> shift) & 0xF for shift in _RANK_SHIFTS]
+
+
+def evaluate(cards: Iterable) -> int:
+    """ Returns the strength of the best five card hand in given cards. Accepts up to
+    seven cards, fewer than five cards are ranked as they are (e.g. a pocket pair).
+    """
+    mask = 0
+    for card in cards:
+        mask |= 1 << card.id
+    return evaluate_mask(mask)
+
+
+def evaluate_mask(mask: int) -> int:
+    """ Returns the strength of the best five card hand in given card mask """
+    if not _rank_table:
+        _load_tables()
+    spades = mask & SUIT_MASK
+    clubs = (mask >> RANKS) & SUIT_MASK
+    hearts = (mask >> 2 * RANKS) & SUIT_MASK
+    diamonds = mask >> 3 * RANKS
+    products = _prime_products
+    strength = _rank_table.get(
+        products[spades] * products[clubs] * products[hearts] * products[diamonds])
+    if strength is None or diamonds > SUIT_MASK:
+        raise ValueError(f'Can evaluate from 1 to {MAX_CARDS} cards')
+    flushes = _flush_table
+    return max(strength, flushes[spades], flushes[clubs], flushes[hearts], flushes[diamonds])
+
+
+def evaluate_ranks(rank_counts: Sequence[int], flush_mask: int = 0) -> int:
+    """ Returns the strength from rank counts and rank mask of the flush suit. Used by
+    callers that already keep track of the counts instead of cards.
+    """
+    if not _rank_table:
+        _load_tables()
+    product = 1
+    for rank, count in enumerate(rank_counts):
+        if count:
+            product *= PRIMES[rank] ** count
+    return max(_rank_table[product], _flush_table[flush_mask])
+
+
+class HandState:
+    """ Strength of a growing set of cards kept up to date as cards are added. Holds the
+    prime product of the ranks, the rank mask of each suit and the best flush so far so
+    adding a card is one multiplication and two table lookups, and the strength of two
+    disjoint states together (e.g. hole cards and board) is one more lookup.
+    """
+    __slots__ = ('_mask', '_count', '_product', '_suits', '_flush', '_strength')
+
+    def __init__(self, mask: int = 0):
+        if not _rank_table:
+            _load_tables()
+        suits = [(mask >> shift) & SUIT_MASK for shift in (0, RANKS, 2 * RANKS, 3 * RANKS)]
+        self._mask = mask
+        self._count = bin(mask).count('1')
+        if mask >> 4 * RANKS or self._count > MAX_CARDS:
+            raise ValueError(f'Can evaluate from 1 to {MAX_CARDS} cards')
+        products = _prime_products
+        self._product = products[suits[0]] * products[suits[1]] * products[suits[2]] * products[suits[3]]
+        self._suits = suits
+        flushes = _flush_table
+        self._flush = max(flushes[suits[0]], flushes[suits[1]], flushes[suits[2]], flushes[suits[3]])
+        self._strength = max(_rank_table[self._product], self._flush) if mask else 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    # --- Properties ---
+
+    @property
+    def mask(self) -> int:
+        return self._mask
+
+    @property
+    def strength(self) -> int:
+        """ Returns the strength of the best five card hand in the cards so far """
+        return self._strength
+
+    @property
+    def category(self) -> int:
+        return self._strength >> CATEGORY_SHIFT
+
+    # --- Public methods ---
+
+    def add(self, card_id: int) -> int:
+        """ Adds the card of given id and returns the new strength """
+        bit = 1 << card_id
+        if self._mask & bit or not 0 <= card_id < 4 * RANKS:
+            raise ValueError('Invalid or duplicate card')
+        if self._count == MAX_CARDS:
+            raise ValueError(f'Can evaluate from 1 to {MAX_CARDS} cards')
+        self._mask |= bit
+        self._count += 1
+        suit, rank = divmod(card_id, RANKS)
+        self._product *= PRIMES[rank]
+        suits = self._suits
+        suits[suit] |= 1 << rank
+        flush = _flush_table[suits[suit]]
+        if flush > self._flush:
+            self._flush = flush
+        strength = _rank_table[self._product]
+        self._strength = strength if strength > self._flush else self._flush
+        return self._strength
+
+    def strength_with(self, other: HandState) -> int:
+        """ Returns the strength of the cards of both states which must not overlap """
+        if self._mask & other._mask or self._count + other._count > MAX_CARDS:
+            raise ValueError(f'Can evaluate from 1 to {MAX_CARDS} distinct cards')
+        ours, theirs = self._suits, other._suits
+        flushes = _flush_table
+        return max(_rank_table[self._product * other._product],
+                   flushes[ours[0] | theirs[0]], flushes[ours[1] | theirs[1]],
+                   flushes[ours[2] | theirs[2]], flushes[ours[3] | theirs[3]])
+
+    def copy(self) -> HandState:
+        state = HandState.__new__(HandState)
+        state._mask = self._mask
+        state._count = self._count
+        state._product = self._product
+        state._suits = self._suits[:]
+        state._flush = self._flush
+        state._strength = self._strength
+        return state
+
+
+def rank(strengths: Sequence[int]) -> List[List[int]]:
+    """ Returns the indexes of given strengths grouped by equal strength from the best
+    group to the worst. Tied indexes keep their order.
+    """
+    order = sorted(range(len(strengths)), key=strengths.__getitem__, reverse=True)
+    groups: List[List[int]] = []
+    previous = None
+    for idx in order:
+        if strengths[idx] != previous:
+            groups.append([])
+            previous = strengths[idx]
+        groups[-1].append(idx)
+    return groups
+
+
+def flush_strengths() -> Sequence[int]:
+    """ Returns the flush table indexed by the rank mask of one suit """
+    if not _rank_table:
+        _load_tables()
+    return _flush_table
+
+
+def rank_strengths() -> Dict[int, int]:
+    """ Returns the non-flush table keyed by the product of the primes of the ranks """
+    if not _rank_table:
+        _load_tables()
+    return _rank_table
+
+
+def prime_products() -> Sequence[int]:
+    """ Returns the product of the primes of the ranks indexed by the rank mask of a suit """
+    if not _rank_table:
+        _load_tables()
+    return _prime_products
+
+# --- Private functions ---
+
+def _pack(category: int, hand: Sequence[int]) -> int:
+    strength = category
+    for idx in range(HAND_SIZE):
+        strength = (strength << 4) | (hand[idx] if idx < len(hand) else 0)
+    return strength
+
+
+def _straight_top(mask: int) -> int:
+    """ Returns the top rank of the best straight in rank mask or -1 """
+    for straight, top in _STRAIGHTS:
+        if mask & straight == straight:
+            return top
+    return -1
+
+
+def _straight_ranks(top: int) -> Tuple[int, ...]:
+    if top == 3:
+        return (3, 2, 1, 0, 12)
+    return tuple(range(top, top - 5, -1))
+
+
+def _strength_of_counts(counts: Sequence[int]) -> int:
+    """ Returns the strength of the best hand made from rank counts ignoring flushes """
+    by_count = sorted(((count, rank) for rank, count in enumerate(counts) if count),
+                      reverse=True)
+    present = [rank for count, rank in by_count]
+    mask = 0
+    for rank in present:
+        mask |= 1 << rank
+
+    def kickers(exclude: Sequence[int], amount: int) -> List[int]:
+        return sorted((r for r in present if r not in exclude), reverse=True)[:amount]
+
+    top_count, top_rank = by_count[0]
+    if top_count == 4:
+        return _pack(FOUR_OF_A_KIND, [top_rank] * 4 + kickers([top_rank], 1))
+    pairs = [rank for count, rank in by_count[1:] if count >= 2]
+    if top_count == 3 and pairs:
+        return _pack(FULL_HOUSE, [top_rank] * 3 + [max(pairs)] * 2)
+    straight = _straight_top(mask)
+    if straight >= 0:
+        return _pack(STRAIGHT, _straight_ranks(straight))
+    if top_count == 3:
+        return _pack(THREE_OF_A_KIND, [top_rank] * 3 + kickers([top_rank], 2))
+    if top_count == 2 and pairs:
+        high, low = top_rank, max(pairs)
+        return _pack(TWO_PAIRS, [high] * 2 + [low] * 2 + kickers([high, low], 1))
+    if top_count == 2:
+        return _pack(PAIR, [top_rank] * 2 + kickers([top_rank], 3))
+    return _pack(HIGH_CARD, kickers([], HAND_SIZE))
+
+
+def _strength_of_flush(mask: int) -> int:
+    straight = _straight_top(mask)
+    if straight >= 0:
+        return _pack(STRAIGHT_FLUSH, _straight_ranks(straight))
+    top = [rank for rank in range(RANKS - 1, -1, -1) if mask & (1 << rank)]
+    return _pack(FLUSH, top[:HAND_SIZE])
+
+
+def _load_tables():
+    """ Fills the tables from the table file. Indexing lists is faster than indexing
+    the mapped arrays so the small tables are copied and the rank table is a dict.
+    """
+    arrays = tables.load('evaluator', TABLES_VERSION, _build_tables)
+    _flush_table[:] = arrays['flush']
+    _prime_products[:] = arrays['products']
+    _rank_table.update(zip(arrays['rank_keys'], arrays['rank_values']))
+
+
+def _build_tables() -> Dict[str, array.array]:
+    rank_table = {}
+    for size in range(1, MAX_CARDS + 1):
+        for combination in itertools.combinations_with_replacement(range(RANKS), size):
+            counts = [0] * RANKS
+            product = 1
+            for rank in combination:
+                counts[rank] += 1
+                product *= PRIMES[rank]
+            if max(counts) > 4:
+                continue
+            rank_table[product] = _strength_of_counts(counts)
+    flush_table = [0] * (1 << RANKS)
+    prime_products = [1] * (1 << RANKS)
+    for mask in range(1 << RANKS):
+        if bin(mask).count('1') >= HAND_SIZE:
+            flush_table[mask] = _strength_of_flush(mask)
+        for rank in range(RANKS):
+            if mask & (1 << rank):
+                prime_products[mask] *= PRIMES[rank]
+    return {
+        'flush': array.array('i', flush_table),
+        'products': array.array('q', prime_products),
+        'rank_keys': array.array('q', rank_table),
+        'rank_values': array.array('i', rank_table.values())
+    }
@@ -0,0 +1,377 @@
+""" Append-only binary log of finished hands.
+
+A log is three files. The log itself (path) is a header followed by fixed size
+records, so hand number n is at HEADER.size + n * RECORD.size:
+
+    time f64, table u32, players u8,
+    host id u32 * 4, previous hand of the host + 1 u64 * 4 (0 = none),
+    hole cards u8 * 8, board u8 * 5, action count u8, action u8 * 16
+    (seat << 1 | Action), winner seats bit mask u8, strength u32
+
+Missing cards are 0xFF. Host names are stored once in path.hosts, one per line
+with the line number as the host id, and path.heads holds the last hand + 1 of
+every host id as u64. Following the previous hand fields back from the head walks
+through every hand of a host, newest first, without any other index.
+
+HistoryWriter packs records into a buffer that a background thread appends to the
+files in batches, so recording a hand never waits for the disk. A batch is handed
+over when it reaches batch_size or when its oldest record is flush_interval
+seconds old, checked on every record and, when recording from an event loop, by
+a timer on that loop, so the hands of a quiet server are not held back either. HistoryReader
+memory-maps the log so any hand is read in place and a log far larger than memory
+can be queried.
+"""
+from __future__ import annotations
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
+import asyncio, mmap, os, queue, struct, sys, threading, time
+
+from tcp_ip_poker.poker import Action, TexasHoldem, VictoryCombination
+
+MAGIC = b'TPHH'
+VERSION = 1
+HEADER = struct.Struct('<4sHH')
+SEATS = TexasHoldem.MAXIMUM_PLAYERS
+MAX_ACTIONS = 16
+RECORD = struct.Struct(f'<dIB{SEATS}I{SEATS}Q{2 * SEATS}s5sB{MAX_ACTIONS}sBI')
+BATCH_SIZE = 1 << 16
+FLUSH_INTERVAL = 0.5
+NO_CARD = 0xFF
+NO_HOST = 0xFFFFFFFF
+
+_HEAD = struct.Struct('<Q')
+_HOST_IDS_OFFSET = struct.calcsize('<dIB')
+
+
+class HandRecord(NamedTuple):
+    """ One finished hand. Cards are card ids and seats index hosts """
+    hand: int
+    time: float
+    table: int
+    hosts: Tuple[str, ...]
+    holes: Tuple[Tuple[int, ...], ...]
+    board: Tuple[int, ...]
+    actions: Tuple[Tuple[int, Action], ...]
+    winners: Tuple[int, ...]
+    strength: int
+
+    @property
+    def tie(self) -> bool:
+        return len(self.winners) > 1
+
+    @property
+    def combination(self) -> Optional[VictoryCombination]:
+        """ Returns the winning combination or None if the hand was won by folds """
+        return VictoryCombination.from_strength(self.strength) if self.strength else None
+
+    def replay(self) -> TexasHoldem:
+        """ Returns the hand played again from its cards and actions, e.g. to read its
+        events (see TexasHoldem.from_hand)
+        """
+        return TexasHoldem.from_hand(self.hosts, self.holes, self.board, self.actions, self.winners, self.strength)
+
+
+class HistoryWriter:
+    """ Appends finished hands to a log, continuing an existing one """
+
+    def __init__(
+            self,
+            path: Union[str, os.PathLike],
+            batch_size: int = BATCH_SIZE,
+            flush_interval: float = FLUSH_INTERVAL
+        ):
+        _check_byteorder()
+        self._path = os.fspath(path)
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._hosts: Dict[str, int] = {}
+        if os.path.exists(self._hosts_path):
+            with open(self._hosts_path, encoding='utf-8') as file:
+                for line in file:
+                    self._hosts[line.rstrip('\n')] = len(self._hosts)
+        self._heads: List[int] = [0] * len(self._hosts)
+        if os.path.exists(self._heads_path):
+            with open(self._heads_path, 'rb') as file:
+                data = file.read(_HEAD.size * len(self._hosts))
+            self._heads[:len(data) // _HEAD.size] = [head for head, in _HEAD.iter_unpack(data)]
+
+        self._log = open(self._path, 'ab')
+        size = self._log.tell()
+        if size == 0:
+            self._log.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+            self._log.flush()
+        elif _read_header(self._path) != RECORD.size:
+            self._log.close()
+            raise ValueError('Invalid hand history file')
+        else:
+            # Drop a record cut short by a crash
+            records = (size - HEADER.size) // RECORD.size
+            self._log.truncate(HEADER.size + records * RECORD.size)
+            self._log.seek(0, os.SEEK_END)
+        self._hands = (self._log.tell() - HEADER.size) // RECORD.size
+        self._hosts_file = open(self._hosts_path, 'a', encoding='utf-8')
+        self._heads_fd = os.open(self._heads_path, os.O_RDWR | os.O_CREAT, 0o644)
+
+        self._buffer = bytearray()
+        # When the oldest buffered record was added and the timer handing it over
+        self._oldest = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._new_hosts: List[str] = []
+        self._changed_heads: Dict[int, int] = {}
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._write, name='hand-history', daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> HistoryWriter:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self) -> int:
+        """ Returns the amount of hands recorded """
+        return self._hands
+
+    # --- Properties ---
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    # --- Public methods ---
+
+    def record(self, game: TexasHoldem, table: int = 0) -> int:
+        """ Adds a finished game and returns its hand number """
+        players = game.players
+        winner, tie = game.get_result()
+        winners = winner if tie else [winner]
+        holes = bytearray([NO_CARD] * (2 * SEATS))
+        for seat, player in enumerate(players):
+            hand = player.hand
+            holes[2 * seat:2 * seat + len(hand)] = bytes(card.id for card in hand)
+        board = bytes(card.id for card in game.table).ljust(5, bytes((NO_CARD,)))
+        actions = bytes(seat << 1 | action for seat, action in game.actions[:MAX_ACTIONS])
+        return self.append(
+            table,
+            [player.host for player in players],
+            bytes(holes),
+            board,
+            actions,
+            sum(1 << players.index(player) for player in winners),
+            game.strength
+        )
+
+    def append(
+            self,
+            table: int,
+            hosts: Sequence[str],
+            holes: bytes,
+            board: bytes,
+            actions: bytes,
+            winners: int,
+            strength: int
+        ) -> int:
+        """ Adds one hand given in the record layout and returns its hand number """
+        if self._error is not None:
+            raise OSError('Hand history writer failed') from self._error
+        hand = self._hands
+        host_ids = [NO_HOST] * SEATS
+        previous = [0] * SEATS
+        for seat, host in enumerate(hosts):
+            host_id = self._hosts.get(host)
+            if host_id is None:
+                host_id = self._hosts[host] = len(self._hosts)
+                self._heads.append(0)
+                self._new_hosts.append(host)
+            host_ids[seat] = host_id
+            previous[seat] = self._heads[host_id]
+            self._heads[host_id] = self._changed_heads[host_id] = hand + 1
+        now = time.monotonic()
+        if not self._buffer:
+            self._oldest = now
+            self._schedule()
+        self._buffer += RECORD.pack(time.time(), table, len(hosts), *host_ids, *previous,
+                                    holes, board, len(actions), actions, winners, strength)
+        self._hands += 1
+        if len(self._buffer) >= self._batch_size or now - self._oldest >= self._flush_interval:
+            self._submit()
+        return hand
+
+    def flush(self, wait: bool = True):
+        """ Hands the buffered records to the writer thread and waits until written """
+        self._submit()
+        if wait:
+            done = threading.Event()
+            self._queue.put(done)
+            done.wait()
+            if self._error is not None:
+                raise OSError('Hand history writer failed') from self._error
+
+    def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._thread.is_alive():
+            self.flush()
+            self._queue.put(None)
+            self._thread.join()
+            self._log.close()
+            self._hosts_file.close()
+            os.close(self._heads_fd)
+
+    # --- Private methods ---
+
+    @property
+    def _hosts_path(self) -> str:
+        return self._path + '.hosts'
+
+    @property
+    def _heads_path(self) -> str:
+        return self._path + '.heads'
+
+    def _schedule(self):
+        """ Hands the buffer over after flush_interval on the running event loop, if any """
+        if self._timer is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._timer = loop.call_later(self._flush_interval, self._expire)
+
+    def _expire(self):
+        self._timer = None
+        if self._thread.is_alive():
+            self._submit()
+
+    def _submit(self):
+        if self._buffer or self._new_hosts:
+            self._queue.put((bytes(self._buffer), self._new_hosts, self._changed_heads))
+            self._buffer.clear()
+            self._new_hosts = []
+            self._changed_heads = {}
+
+    def _write(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if isinstance(item, threading.Event):
+                item.set()
+                continue
+            if self._error is not None:
+                continue
+            records, hosts, heads = item
+            try:
+                # Hosts and records first so heads never point past written data
+                self._hosts_file.write(''.join(host + '\n' for host in hosts))
+                self._hosts_file.flush()
+                self._log.write(records)
+                self._log.flush()
+                for host_id, head in heads.items():
+                    os.pwrite(self._heads_fd, _HEAD.pack(head), host_id * _HEAD.size)
+            except OSError as e:
+                self._error = e
+
+
+class HistoryReader:
+    """ Read-only memory-mapped view of a log as it was when opened """
+
+    def __init__(self, path: Union[str, os.PathLike]):
+        _check_byteorder()
+        path = os.fspath(path)
+        if _read_header(path) != RECORD.size:
+            raise ValueError('Invalid hand history file')
+        # Heads are written after the records they point to so read them first
+        with open(path + '.heads', 'rb') as file:
+            self._heads = file.read()
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._hands = (len(self._mmap) - HEADER.size) // RECORD.size
+        with open(path + '.hosts', encoding='utf-8') as file:
+            self._hosts = [line.rstrip('\n') for line in file]
+        self._host_ids = {host: host_id for host_id, host in enumerate(self._hosts)}
+
+    def __enter__(self) -> HistoryReader:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self) -> int:
+        return self._hands
+
+    def __getitem__(self, hand: int) -> HandRecord:
+        if hand < 0:
+            hand += self._hands
+        if not 0 <= hand < self._hands:
+            raise IndexError('No such hand')
+        (played, table, players, *fields) = RECORD.unpack_from(self._mmap, HEADER.size + hand * RECORD.size)
+        host_ids = fields[:players]
+        holes, board, action_count, actions, winners, strength = fields[2 * SEATS:]
+        return HandRecord(
+            hand,
+            played,
+            table,
+            tuple(self._hosts[host_id] for host_id in host_ids),
+            tuple(tuple(card for card in holes[2 * seat:2 * seat + 2] if card != NO_CARD)
+                  for seat in range(players)),
+            tuple(card for card in board if card != NO_CARD),
+            tuple((action >> 1, Action(action & 1)) for action in actions[:action_count]),
+            tuple(seat for seat in range(players) if winners >> seat & 1),
+            strength
+        )
+
+    def __iter__(self) -> Iterator[HandRecord]:
+        for hand in range(self._hands):
+            yield self[hand]
+
+    # --- Properties ---
+
+    @property
+    def hosts(self) -> Sequence[str]:
+        """ Returns every host that has played """
+        return list(self._hosts)
+
+    # --- Public methods ---
+
+    def hands_of(self, host: str) -> Iterator[HandRecord]:
+        """ Yields the hands played by given host, newest first """
+        host_id = self._host_ids.get(host)
+        if host_id is None or (host_id + 1) * _HEAD.size > len(self._heads):
+            return
+        hand = _HEAD.unpack_from(self._heads, host_id * _HEAD.size)[0] - 1
+        while hand >= 0:
+            yield self[hand]
+            hand = self._previous(hand, host_id)
+
+    def close(self):
+        self._mmap.close()
+
+    # --- Private methods ---
+
+    def _previous(self, hand: int, host_id: int) -> int:
+        """ Returns the previous hand of the host before given hand or -1 """
+        offset = HEADER.size + hand * RECORD.size + _HOST_IDS_OFFSET
+        host_ids = struct.unpack_from(f'<{SEATS}I', self._mmap, offset)
+        previous = struct.unpack_from(f'<{SEATS}Q', self._mmap, offset + 4 * SEATS)
+        return previous[host_ids.index(host_id)] - 1
+
+# --- Private functions ---
+
+
+def _check_byteorder():
+    if sys.byteorder != 'little':
+        raise OSError('Hand history requires a little endian host')
+
+
+def _read_header(path: str) -> int:
+    """ Returns the record size of the log file at path """
+    with open(path, 'rb') as file:
+        header = file.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise ValueError('Invalid hand history file')
+    magic, version, record_size = HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('Invalid hand history file')
+    return record_size
@@ -0,0 +1,149 @@
+""" Suit isomorphism and a bounded cache for results that only depend on it.
+
+Suits have no rank in poker so two sets of cards that only differ by a relabelling
+of suits, like A♠K♠ and A♡K♡, are worth the same. canonical_masks maps card masks
+to one representative of their isomorphism class by ordering the suits by the
+cards they hold, applying the same relabelling to every mask given so hole cards
+and board stay consistent with each other. Results holding cards, like outs, are
+mapped back to the suits of the caller with restore.
+
+LRUCache holds a bounded number of results keyed by canonical forms, evicting the
+least recently used, and counts hits and misses. CACHE is the instance shared by
+the analysis functions that accept a cache, equity.equity and outs.analyze. The
+scalar evaluator itself is a single table lookup which is cheaper than
+canonicalizing, so it is not cached.
+"""
+from __future__ import annotations
+from typing import Callable, Hashable, Iterable, Optional, Sequence, Tuple, TypeVar
+import collections
+
+from tcp_ip_poker import evaluator
+from tcp_ip_poker.poker import Card, CardSet
+
+SUITS = 4
+DEFAULT_SIZE = 1 << 16
+
+T = TypeVar('T')
+
+
+def canonical_order(*masks: int) -> Tuple[int, ...]:
+    """ Returns the suits in canonical order for given card masks, canonical suit n
+    being suit order[n]. Suits are ordered by their rank masks in the first mask,
+    then in the second and so on. Suits that tie hold the same cards in every mask,
+    so either order gives the same canonical form.
+    """
+    keys = [tuple((mask >> evaluator.RANKS * suit) & evaluator.SUIT_MASK for mask in masks)
+            for suit in range(SUITS)]
+    return tuple(sorted(range(SUITS), key=keys.__getitem__, reverse=True))
+
+
+def relabel(mask: int, order: Sequence[int]) -> int:
+    """ Returns a card mask with suit order[n] moved to suit n """
+    result = 0
+    for suit, original in enumerate(order):
+        result |= ((mask >> evaluator.RANKS * original) & evaluator.SUIT_MASK) << evaluator.RANKS * suit
+    return result
+
+
+def restore(mask: int, order: Sequence[int]) -> int:
+    """ Reverses relabel, e.g. for results computed from canonical masks """
+    result = 0
+    for suit, original in enumerate(order):
+        result |= ((mask >> evaluator.RANKS * suit) & evaluator.SUIT_MASK) << evaluator.RANKS * original
+    return result
+
+
+def canonical_masks(*masks: int) -> Tuple[int, ...]:
+    """ Returns the given card masks with suits relabelled to the canonical order, so
+    isomorphic inputs give equal outputs.
+    """
+    order = canonical_order(*masks)
+    return tuple(relabel(mask, order) for mask in masks)
+
+
+def canonical(cards: Iterable[Card], *others: Iterable[Card]) -> Tuple[CardSet, ...]:
+    """ Returns the canonical forms of given sets of cards relabelled together """
+    masks = canonical_masks(CardSet(cards).mask, *(CardSet(other).mask for other in others))
+    return tuple(CardSet(mask) for mask in masks)
+
+
+def isomorphic(first: Iterable[Card], second: Iterable[Card]) -> bool:
+    """ Returns True if the card sets only differ by a relabelling of suits """
+    return canonical_masks(CardSet(first).mask) == canonical_masks(CardSet(second).mask)
+
+
+class LRUCache:
+    """ Size bounded mapping that evicts the least recently used entry """
+
+    def __init__(self, maxsize: int = DEFAULT_SIZE):
+        if maxsize < 1:
+            raise ValueError('Cache size must be positive')
+        self._maxsize = maxsize
+        self._entries: collections.OrderedDict = collections.OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    # --- Properties ---
+
+    @property
+    def maxsize(self) -> int:
+        return self._maxsize
+
+    @property
+    def hits(self) -> int:
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        return self._misses
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self._hits + self._misses
+        return self._hits / lookups if lookups else 0.0
+
+    # --- Public methods ---
+
+    def get(self, key: Hashable, default: Optional[T] = None) -> Optional[T]:
+        """ Returns the value of key and marks it recently used, counting a hit or miss """
+        entries = self._entries
+        if key in entries:
+            entries.move_to_end(key)
+            self._hits += 1
+            return entries[key]
+        self._misses += 1
+        return default
+
+    def put(self, key: Hashable, value):
+        entries = self._entries
+        entries[key] = value
+        entries.move_to_end(key)
+        if len(entries) > self._maxsize:
+            entries.popitem(last=False)
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], T]) -> T:
+        """ Returns the cached value of key or computes and stores it """
+        entries = self._entries
+        if key in entries:
+            entries.move_to_end(key)
+            self._hits += 1
+            return entries[key]
+        self._misses += 1
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def clear(self):
+        """ Removes every entry and resets the counters """
+        self._entries.clear()
+        self._hits = 0
+        self._misses = 0
+
+
+CACHE = LRUCache()
@@ -0,0 +1,384 @@
+""" Load test that drives a server with bot clients over real sockets.
+
+    python -m tcp_ip_poker.loadtest --connections 2000 --duration 30 --output report.json
+
+starts a server in a child process on a free local port (a lobby with --workers),
+connects the bots and lets them play for the given time. With --connect
+HOST:PORT an already running server is used instead and its CPU is not reported.
+
+Bots speak the binary protocol. They are seated a table at a time: the first bot
+of a table joins any table and the others join its table, and seats left over when
+connections do not divide evenly into the tables are given to NPC players, so
+every table is full and nobody else is seated there. After a think time drawn from
+an exponential distribution around --think a bot checks, or folds with
+probability --fold, on its turn, and the first seat of each table starts the next
+hand once a hand ends.
+
+The round trip of an action is the time from sending it to its OK reply. The
+report gives its p50, p99 and p999 in seconds, hands per second over all tables,
+the CPU seconds and utilisation of the server, worker processes included, and of
+the bots, measured after a --warmup period so connecting is not counted:
+
+    {"python": ..., "machine": ..., "config": {...}, "connections": ...,
+     "tables": ..., "seconds": ..., "actions": ..., "errors": ...,
+     "latency": {"p50": ..., "p99": ..., "p999": ..., "max": ...},
+     "hands": ..., "hands_per_second": ...,
+     "server_cpu_seconds": ..., "server_cpu": ..., "client_cpu_seconds": ...}
+
+Server CPU is read from /proc and is null where that is not available.
+"""
+from __future__ import annotations
+from typing import Dict, List, NamedTuple, Optional, Sequence
+import argparse, asyncio, json, logging, math, os, platform, random, signal, socket, subprocess, sys, time
+
+from tcp_ip_poker import protocol
+from tcp_ip_poker.poker import TexasHoldem
+from tcp_ip_poker.protocol import FrameType
+from tcp_ip_poker.server import raise_file_limit
+
+CONNECTIONS = 400
+THINK = 0.05
+FOLD = 0.1
+DURATION = 10.0
+WARMUP = 1.0
+CONNECT_CONCURRENCY = 256
+STARTUP_TIMEOUT = 10.0
+JOIN_RETRY = 0.02
+JOIN_ATTEMPTS = 100
+
+logger = logging.getLogger(__name__)
+
+
+class Options(NamedTuple):
+    connections: int = CONNECTIONS
+    tables: Optional[int] = None
+    think: float = THINK
+    fold: float = FOLD
+    duration: float = DURATION
+    warmup: float = WARMUP
+    workers: int = 0
+    seed: int = 0
+
+
+class _Stats:
+    __slots__ = ('latencies', 'actions', 'errors', 'hands', 'recording')
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.actions = 0
+        self.errors = 0
+        self.hands = 0
+        self.recording = False
+
+    def reset(self):
+        self.latencies.clear()
+        self.actions = self.errors = self.hands = 0
+
+
+class Bot:
+    """ One client playing checks and folds on its turn """
+
+    def __init__(self, stats: _Stats, options: Options, rng: random.Random):
+        self._stats = stats
+        self._options = options
+        self._rng = rng
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._encoder = protocol.Encoder()
+        self._host = ''
+        self._seat = -1
+        self._players = 0
+        self._reply: Optional[asyncio.Future] = None
+        self._sent: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    # --- Public methods ---
+
+    async def connect(self, host: str, port: int):
+        self._reader, self._writer = await asyncio.open_connection(host, port)
+        sock = self._writer.get_extra_info('socket')
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        address, port = self._writer.get_extra_info('sockname')[:2]
+        self._host = f'{address}:{port}'
+        self._task = asyncio.get_running_loop().create_task(self._receive())
+        self._encoder.hello()
+        await self._request()
+
+    async def join(self, table: int = 0) -> int:
+        """ Joins given table or any table and returns its id. A table the lobby has not
+        heard of yet is retried for a while.
+        """
+        for _ in range(JOIN_ATTEMPTS):
+            self._encoder.join(table)
+            try:
+                return await self._request()
+            except Exception as e:
+                if str(e) != 'No such table':
+                    raise
+            await asyncio.sleep(JOIN_RETRY)
+        raise Exception(f'Table {table} not found')
+
+    async def add_npc(self):
+        self._encoder.command(FrameType.NPC)
+        await self._request()
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+
+    # --- Private methods ---
+
+    async def _request(self) -> int:
+        self._reply = asyncio.get_running_loop().create_future()
+        self._send()
+        return await self._reply
+
+    def _send(self):
+        if not self._writer.is_closing():
+            self._writer.write(self._encoder.flush())
+
+    async def _receive(self):
+        try:
+            while True:
+                length, = protocol.HEADER.unpack(await self._reader.readexactly(protocol.HEADER.size))
+                frame = memoryview(await self._reader.readexactly(length))
+                self._handle(frame[0], frame[1:])
+        except (asyncio.IncompleteReadError, ConnectionError):
+            if self._reply is not None and not self._reply.done():
+                self._reply.set_exception(ConnectionError('Server closed the connection'))
+
+    def _handle(self, frame_type: int, body: memoryview):
+        if frame_type in (FrameType.OK, FrameType.ERROR, FrameType.HELLO):
+            if frame_type == FrameType.ERROR:
+                self._stats.errors += self._stats.recording
+            if self._sent is not None and frame_type != FrameType.HELLO:
+                if self._stats.recording:
+                    self._stats.latencies.append(time.perf_counter() - self._sent)
+                    self._stats.actions += 1
+                self._sent = None
+            elif self._reply is not None and not self._reply.done():
+                if frame_type == FrameType.ERROR:
+                    self._reply.set_exception(Exception(protocol.decode_error(body)))
+                else:
+                    self._reply.set_result(protocol.decode_ok(body)[1] if frame_type == FrameType.OK else 0)
+        elif frame_type == FrameType.PLAYERS:
+            hosts = protocol.decode_players(body)
+            self._seat = hosts.index(self._host) if self._host in hosts else -1
+            self._players = len(hosts)
+        elif frame_type == FrameType.TURN:
+            if protocol.decode_seat(body) == self._seat:
+                self._later(self._act)
+        elif frame_type == FrameType.RESULT:
+            if self._seat == 0:
+                self._stats.hands += self._stats.recording
+                self._later(self._start)
+
+    def _later(self, action):
+        delay = self._rng.expovariate(1 / self._options.think) if self._options.think > 0 else 0
+        asyncio.get_running_loop().call_later(delay, action)
+
+    def _act(self):
+        self._encoder.command(FrameType.FOLD if self._rng.random() < self._options.fold else FrameType.CHECK)
+        self._sent = time.perf_counter()
+        self._send()
+
+    def _start(self):
+        self._encoder.command(FrameType.START)
+        self._sent = time.perf_counter()
+        self._send()
+
+
+async def run(options: Options, host: str, port: int, server_pid: Optional[int] = None) -> Dict[str, object]:
+    """ Plays the load of options against the server on given address and returns the
+    report. CPU of the server is reported when its process id is given.
+    """
+    tables = options.tables or math.ceil(options.connections / TexasHoldem.MAXIMUM_PLAYERS)
+    if not 1 <= tables <= options.connections / TexasHoldem.MINIMUM_PLAYERS:
+        raise ValueError(f'{options.connections} connections can not fill {tables} tables')
+    rng = random.Random(options.seed)
+    stats = _Stats()
+    bots = [Bot(stats, options, random.Random(rng.random())) for _ in range(options.connections)]
+    limit = asyncio.Semaphore(CONNECT_CONCURRENCY)
+
+    async def connect(bot: Bot):
+        async with limit:
+            await bot.connect(host, port)
+
+    try:
+        await asyncio.gather(*(connect(bot) for bot in bots))
+        # Tables are seated one after another so the first bot of a table never joins
+        # a table still being seated
+        for group in range(tables):
+            seated = bots[group::tables]
+            table = await seated[0].join()
+            for bot in seated[1:]:
+                await bot.join(table)
+            for _ in range(TexasHoldem.MAXIMUM_PLAYERS - len(seated)):
+                await seated[0].add_npc()
+        await asyncio.sleep(options.warmup)
+
+        stats.reset()
+        stats.recording = True
+        server_cpu = _cpu_seconds(server_pid)
+        client_cpu = time.process_time()
+        started = time.perf_counter()
+        await asyncio.sleep(options.duration)
+        stats.recording = False
+        seconds = time.perf_counter() - started
+        client_cpu = time.process_time() - client_cpu
+        if server_cpu is not None:
+            server_cpu = _cpu_seconds(server_pid) - server_cpu
+    finally:
+        for bot in bots:
+            bot.close()
+
+    latencies = sorted(stats.latencies)
+    return {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'config': options._asdict(),
+        'connections': options.connections,
+        'tables': tables,
+        'seconds': seconds,
+        'actions': stats.actions,
+        'errors': stats.errors,
+        'latency': {
+            'p50': _quantile(latencies, 0.5),
+            'p99': _quantile(latencies, 0.99),
+            'p999': _quantile(latencies, 0.999),
+            'max': latencies[-1] if latencies else None
+        },
+        'hands': stats.hands,
+        'hands_per_second': stats.hands / seconds,
+        'server_cpu_seconds': server_cpu,
+        'server_cpu': None if server_cpu is None else server_cpu / seconds,
+        'client_cpu_seconds': client_cpu
+    }
+
+
+def text(report: Dict[str, object]) -> str:
+    """ Returns the report as a readable summary """
+    latency = report['latency']
+    lines = [
+        f'{report["connections"]} connections at {report["tables"]} tables for {report["seconds"]:.1f} s',
+        f'{report["actions"]:>10} actions  {report["errors"]} errors',
+        f'{report["hands_per_second"]:>10.1f} hands/s'
+    ]
+    if latency['p50'] is not None:
+        lines.append(f'latency p50 {latency["p50"] * 1e3:.2f} ms  p99 {latency["p99"] * 1e3:.2f} ms'
+                     f'  p999 {latency["p999"] * 1e3:.2f} ms  max {latency["max"] * 1e3:.2f} ms')
+    if report['server_cpu'] is not None:
+        lines.append(f'server cpu {report["server_cpu_seconds"]:.1f} s ({report["server_cpu"]:.0%})')
+    lines.append(f'client cpu {report["client_cpu_seconds"]:.1f} s')
+    return ''.join(line + '\n' for line in lines)
+
+
+def main(args: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='tcp_ip_poker.loadtest', description=__doc__.splitlines()[0])
+    parser.add_argument('--connections', type=int, default=CONNECTIONS, help='bot clients')
+    parser.add_argument('--tables', type=int, help='tables to seat them at, default as few as possible')
+    parser.add_argument('--think', type=float, default=THINK, help='mean think time of a bot in seconds')
+    parser.add_argument('--fold', type=float, default=FOLD, help='probability of folding on a turn')
+    parser.add_argument('--duration', type=float, default=DURATION, help='seconds to measure')
+    parser.add_argument('--warmup', type=float, default=WARMUP, help='seconds to play before measuring')
+    parser.add_argument('--workers', type=int, default=0, help='run the server as a lobby with this many workers')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--connect', metavar='HOST:PORT', help='load a running server instead of starting one')
+    parser.add_argument('--output', help='write the report as JSON to this file')
+    parsed = parser.parse_args(args)
+    options = Options(parsed.connections, parsed.tables, parsed.think, parsed.fold, parsed.duration,
+                      parsed.warmup, parsed.workers, parsed.seed)
+    logging.basicConfig(level=logging.INFO)
+    raise_file_limit()
+    if parsed.connect:
+        host, _, port = parsed.connect.rpartition(':')
+        report = asyncio.run(run(options, host or '127.0.0.1', int(port)))
+    else:
+        report = _run_local(options)
+    print(text(report), end='')
+    if parsed.output:
+        with open(parsed.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    return 0
+
+# --- Private functions ---
+
+def _run_local(options: Options) -> Dict[str, object]:
+    """ Runs the load against a server started in a child process """
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    package = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (package, os.environ.get('PYTHONPATH')))))
+    command = [sys.executable, '-m', 'tcp_ip_poker', '--host', '127.0.0.1', '--port', str(port)]
+    if options.workers:
+        command += ['--workers', str(options.workers)]
+    server = subprocess.Popen(command, env=env)
+    try:
+        _wait_listening(port, server)
+        return asyncio.run(run(options, '127.0.0.1', port, server.pid))
+    finally:
+        server.send_signal(signal.SIGINT)
+        try:
+            server.wait(STARTUP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+
+def _wait_listening(port: int, server: subprocess.Popen):
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while True:
+        if server.poll() is not None:
+            raise Exception(f'Server exited with status {server.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), 1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise Exception('Server did not start')
+            time.sleep(0.05)
+
+
+def _cpu_seconds(pid: Optional[int]) -> Optional[float]:
+    """ Returns the CPU time used so far by a process and every process below it,
+    including children that have already exited and been waited for
+    """
+    if pid is None:
+        return None
+    try:
+        ticks = os.sysconf('SC_CLK_TCK')
+        children: Dict[int, List[int]] = {}
+        times: Dict[int, int] = {}
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry}/stat') as file:
+                    fields = file.read().rpartition(')')[2].split()
+            except OSError:
+                continue
+            # Fields after the command: state, ppid, ... utime, stime, cutime and cstime are 11 to 14
+            children.setdefault(int(fields[1]), []).append(int(entry))
+            times[int(entry)] = sum(int(field) for field in fields[11:15])
+        total = 0
+        pending = [pid]
+        while pending:
+            current = pending.pop()
+            total += times.get(current, 0)
+            pending.extend(children.get(current, ()))
+        return total / ticks
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _quantile(values: Sequence[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,427 @@
+""" Lobby front end that spreads tables over worker processes.
+
+One server process runs every table on one core. The lobby listens for clients
+and runs N worker processes that each run a Server. A client talks to the lobby
+until it joins a table: the lobby picks the worker owning the table, or for a new
+table the worker with the fewest tables, and passes the client socket to that
+worker over a Unix socket together with any bytes already received. From then on
+the client talks to the worker directly, so the lobby never touches game traffic
+and capacity grows with the number of workers. Spectators who WATCH a table are
+handed to its worker the same way. Unix only.
+
+Before joining the lobby answers HELLO, QUIT and the text command STATS, which
+replies 'STATS <worker>:<tables>,...'. Other commands are refused.
+
+Workers report their tables (id, players, running hand) to the lobby at most every
+REPORT_INTERVAL. In between the lobby counts its own hand-offs, and reports carry
+the sequence number of the last hand-off the worker handled so hand-offs still in
+flight are not forgotten. A client that leaves a table stays on its worker and
+further joins are served by that worker's own tables, which get ids from
+(worker + 1) << 24 upwards so they never collide with tables of the lobby.
+"""
+from __future__ import annotations
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+import asyncio, collections, itertools, logging, multiprocessing, socket, struct
+
+from tcp_ip_poker import protocol
+from tcp_ip_poker.history import HistoryWriter
+from tcp_ip_poker.npc import NPCEngine
+from tcp_ip_poker.poker import TexasHoldem
+from tcp_ip_poker.protocol import FrameType
+from tcp_ip_poker.server import BACKLOG, DEFAULT_HOST, DEFAULT_PORT, MAX_LINE, Connection, Server
+
+REPORT_INTERVAL = 0.05
+REPORT_CHUNK = 4096
+HANDOFF_RETRY = 0.01
+
+logger = logging.getLogger(__name__)
+
+_HANDOFF = struct.Struct('<IIB')
+_REPORT = struct.Struct('<BI')
+_TABLE = struct.Struct('<IBB')
+_MESSAGE_SIZE = 1 << 16
+_FIRST = 1
+_FINAL = 2
+_BINARY = 1
+_WATCH = 2
+
+
+class Worker:
+    """ Lobby side of one worker process and the tables it owns """
+
+    def __init__(self, index: int, history: Optional[str] = None):
+        self._index = index
+        self._control, remote = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self._control.setblocking(False)
+        self._process = multiprocessing.get_context('spawn').Process(
+            target=_work, args=(remote, index, history), name=f'tcp_ip_poker-worker-{index}', daemon=True)
+        self._process.start()
+        remote.close()
+        self._sequence = 0
+        self._handoffs: Deque[Tuple[int, int]] = collections.deque()
+        self._received: Dict[int, Tuple[int, bool]] = {}
+        self.tables: Dict[int, Tuple[int, bool]] = {}
+
+    # --- Properties ---
+
+    @property
+    def index(self) -> int:
+        return self._index
+
+    @property
+    def control(self) -> socket.socket:
+        return self._control
+
+    # --- Public methods ---
+
+    def hand_off(self, sock: socket.socket, table_id: int, binary: bool, data: bytes, watch: bool = False):
+        """ Passes a client socket to the worker to join, or watch, given table. Raises
+        BlockingIOError when the worker does not keep up.
+        """
+        self._sequence = (self._sequence + 1) & 0xFFFFFFFF
+        flags = (_BINARY if binary else 0) | (_WATCH if watch else 0)
+        message = _HANDOFF.pack(self._sequence, table_id, flags) + data
+        socket.send_fds(self._control, [message], [sock.fileno()])
+        if not watch:
+            self._handoffs.append((self._sequence, table_id))
+            self._count(table_id)
+
+    def receive(self):
+        """ Reads the pending table reports of the worker """
+        while True:
+            try:
+                message = self._control.recv(_MESSAGE_SIZE)
+            except BlockingIOError:
+                return
+            if not message:
+                raise ConnectionError(f'Worker {self._index} exited')
+            flags, sequence = _REPORT.unpack_from(message)
+            if flags & _FIRST:
+                self._received = {}
+            for table_id, players, active in _TABLE.iter_unpack(message[_REPORT.size:]):
+                self._received[table_id] = (players, bool(active))
+            if flags & _FINAL:
+                self._apply(sequence)
+
+    def close(self):
+        self._control.close()
+        self._process.join(1)
+        if self._process.is_alive():
+            self._process.terminate()
+
+    # --- Private methods ---
+
+    def _apply(self, sequence: int):
+        reported, self._received = self._received, {}
+        while self._handoffs and self._handoffs[0][0] <= sequence:
+            self._handoffs.popleft()
+        self.tables = reported
+        for _, table_id in self._handoffs:
+            self._count(table_id)
+
+    def _count(self, table_id: int):
+        players, active = self.tables.get(table_id, (0, False))
+        self.tables[table_id] = (players + 1, active)
+
+
+class Lobby:
+    """ Accepts clients and hands them to the worker owning their table """
+
+    def __init__(self, workers: int, history: Optional[str] = None):
+        """ With a history path worker n records its hands to path.n """
+        if workers < 1:
+            raise ValueError('Lobby requires atleast 1 worker')
+        self._workers = [Worker(index, history) for index in range(workers)]
+        self._table_ids = itertools.count(1)
+        self._guests = 0
+
+    # --- Properties ---
+
+    @property
+    def workers(self) -> Sequence[Worker]:
+        return self._workers
+
+    @property
+    def table_counts(self) -> List[int]:
+        """ Returns the amount of tables of every worker """
+        return [len(worker.tables) for worker in self._workers]
+
+    @property
+    def guests(self) -> int:
+        """ Returns the amount of clients that have not joined a table yet """
+        return self._guests
+
+    # --- Public methods ---
+
+    async def serve(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> asyncio.AbstractServer:
+        """ Starts listening on given address and returns the asyncio server """
+        loop = asyncio.get_running_loop()
+        for worker in self._workers:
+            loop.add_reader(worker.control.fileno(), self._receive, worker)
+        return await loop.create_server(lambda: _Guest(self), host, port, backlog=BACKLOG)
+
+    def close(self):
+        """ Stops the workers, their clients are disconnected """
+        loop = asyncio.get_running_loop()
+        for worker in self._workers:
+            loop.remove_reader(worker.control.fileno())
+            worker.close()
+
+    def connected(self, guest: _Guest):
+        self._guests += 1
+
+    def disconnected(self, guest: _Guest):
+        self._guests -= 1
+
+    def route(self, table_id: Optional[int]) -> Tuple[Worker, int]:
+        """ Returns the worker and table to join. Without a table id the first table
+        with a free seat is used or a new table is opened on the least loaded worker.
+        """
+        if not self._workers:
+            raise Exception('No workers running')
+        if table_id is not None:
+            for worker in self._workers:
+                if table_id in worker.tables:
+                    return worker, table_id
+            raise Exception('No such table')
+        for worker in self._workers:
+            for table_id, (players, active) in worker.tables.items():
+                if players < TexasHoldem.MAXIMUM_PLAYERS and not active:
+                    return worker, table_id
+        worker = min(self._workers, key=lambda worker: len(worker.tables))
+        return worker, next(self._table_ids)
+
+    # --- Private methods ---
+
+    def _receive(self, worker: Worker):
+        try:
+            worker.receive()
+        except ConnectionError as e:
+            logger.error('%s', e)
+            asyncio.get_running_loop().remove_reader(worker.control.fileno())
+            self._workers.remove(worker)
+            worker.close()
+
+
+class _Guest(asyncio.BufferedProtocol):
+    """ Client connection in the lobby before it joins a table """
+
+    def __init__(self, lobby: Lobby):
+        self._lobby = lobby
+        self._transport: Optional[asyncio.Transport] = None
+        self._decoder = protocol.Decoder()
+        self._binary: Optional[bool] = None
+        self._encoder = None
+
+    # --- asyncio.BufferedProtocol ---
+
+    def connection_made(self, transport: asyncio.Transport):
+        self._transport = transport
+        self._lobby.connected(self)
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        return self._decoder.get_buffer(sizehint)
+
+    def buffer_updated(self, nbytes: int):
+        self._decoder.buffer_updated(nbytes)
+        if self._binary is None:
+            self._binary = self._decoder.peek() < 0x20
+            self._encoder = protocol.Encoder() if self._binary else protocol.TextEncoder()
+        try:
+            if self._binary:
+                self._receive_frames()
+            else:
+                self._receive_lines()
+        except protocol.ProtocolError as e:
+            logger.info('Protocol error from %s: %s', self._transport.get_extra_info('peername'), e)
+            self._transport.close()
+        self._flush()
+
+    def connection_lost(self, exc: Optional[Exception]):
+        self._lobby.disconnected(self)
+
+    # --- Private methods ---
+
+    def _flush(self):
+        if len(self._encoder) and not self._transport.is_closing():
+            self._transport.write(self._encoder.flush())
+
+    def _receive_frames(self):
+        for frame_type, body in self._decoder.frames():
+            if frame_type == FrameType.HELLO:
+                if protocol.decode_hello(body) != protocol.VERSION:
+                    self._encoder.error('Unsupported protocol version')
+                    self._flush()
+                    self._transport.close()
+                    return
+                self._encoder.hello()
+            elif frame_type in (FrameType.JOIN, FrameType.WATCH):
+                if self._join(protocol.decode_join(body) or None, frame_type == FrameType.WATCH):
+                    return
+            elif frame_type == FrameType.QUIT:
+                self._transport.close()
+                return
+            else:
+                self._encoder.error('Not at a table')
+
+    def _receive_lines(self):
+        for line in self._decoder.lines(MAX_LINE):
+            command, _, argument = str(line, 'utf-8', 'replace').strip().partition(' ')
+            command = command.upper()
+            if command in ('JOIN', 'WATCH'):
+                try:
+                    table_id = int(argument) if argument.strip() else None
+                except ValueError:
+                    self._encoder.error('Invalid table')
+                    continue
+                if self._join(table_id, command == 'WATCH'):
+                    return
+            elif command == 'STATS':
+                self._encoder.stats(self._lobby.table_counts)
+            elif command == 'QUIT':
+                self._flush()
+                self._transport.close()
+                return
+            elif command in ('START', 'CHECK', 'FOLD', 'NPC', 'LEAVE'):
+                self._encoder.error('Not at a table')
+            else:
+                self._encoder.error('Unknown command')
+
+    def _join(self, table_id: Optional[int], watch: bool = False) -> bool:
+        """ Stops reading and hands the client off once the replies so far are sent.
+        Returns False if there is no table to join or watch.
+        """
+        try:
+            if watch and table_id is None:
+                raise Exception('No such table')
+            worker, table_id = self._lobby.route(table_id)
+        except Exception as e:
+            self._encoder.error(str(e))
+            return False
+        self._transport.pause_reading()
+        self._flush()
+        self._hand_off(worker, table_id, bytes(self._decoder.pending()), watch)
+        return True
+
+    def _hand_off(self, worker: Worker, table_id: int, data: bytes, watch: bool):
+        if self._transport.is_closing():
+            return
+        loop = asyncio.get_running_loop()
+        if self._transport.get_write_buffer_size():
+            loop.call_later(HANDOFF_RETRY, self._hand_off, worker, table_id, data, watch)
+            return
+        try:
+            worker.hand_off(self._transport.get_extra_info('socket'), table_id, self._binary, data, watch)
+        except BlockingIOError:
+            loop.call_later(HANDOFF_RETRY, self._hand_off, worker, table_id, data, watch)
+            return
+        except OSError as e:
+            logger.error('Hand-off to worker %d failed: %s', worker.index, e)
+        # The worker holds its own copy of the socket so this does not disconnect
+        self._transport.abort()
+
+
+# --- Worker process ---
+
+def _work(control: socket.socket, index: int, history: Optional[str]):
+    writer = HistoryWriter(f'{history}.{index}') if history else None
+    try:
+        asyncio.run(_serve_worker(control, index, writer))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+async def _serve_worker(control: socket.socket, index: int, history: Optional[HistoryWriter]):
+    loop = asyncio.get_running_loop()
+    control.setblocking(False)
+    # Workers are daemon processes which can not start a process pool, NPCs decide on
+    # a thread so the clients of the worker are served meanwhile
+    npc = NPCEngine(threads=1)
+    npc.warm_up()
+    server = Server(itertools.count((index + 1) << 24), history, npc)
+    done = loop.create_future()
+    sequence = 0
+
+    def receive():
+        nonlocal sequence
+        while True:
+            try:
+                message, fds, _, _ = socket.recv_fds(control, _MESSAGE_SIZE, 1)
+            except BlockingIOError:
+                return
+            except ConnectionResetError:
+                # The lobby exited with reports left unread
+                message = b''
+            if not message:
+                loop.remove_reader(control.fileno())
+                if not done.done():
+                    done.set_result(None)
+                return
+            sequence, table_id, flags = _HANDOFF.unpack_from(message)
+            data = message[_HANDOFF.size:]
+            for fd in fds:
+                sock = socket.socket(fileno=fd)
+                loop.create_task(_adopt(server, sock, table_id, bool(flags & _BINARY), data, bool(flags & _WATCH)))
+
+    loop.add_reader(control.fileno(), receive)
+    reported = None
+    try:
+        while not done.done():
+            snapshot = (sequence, [(table.id, len(table.game.players), table.game.active)
+                                   for table in server.tables])
+            if snapshot != reported and _report(control, *snapshot):
+                reported = snapshot
+            await asyncio.wait([done], timeout=REPORT_INTERVAL)
+    finally:
+        npc.close()
+        control.close()
+
+
+async def _adopt(server: Server, sock: socket.socket, table_id: int, binary: bool, data: bytes, watch: bool):
+    loop = asyncio.get_running_loop()
+    connection = Connection(server)
+    try:
+        await loop.connect_accepted_socket(lambda: connection, sock)
+    except OSError as e:
+        logger.info('Could not adopt client: %s', e)
+        sock.close()
+        return
+    connection.set_binary(binary)
+    if watch:
+        try:
+            connection.events().ok(FrameType.WATCH, server.watch(connection, table_id))
+        except Exception as e:
+            connection.events().error(str(e))
+    else:
+        connection.events().ok(FrameType.JOIN, server.adopt(connection, table_id))
+    connection.feed(data)
+
+
+def _report(control: socket.socket, sequence: int, tables: Sequence[Tuple[int, int, bool]]) -> bool:
+    """ Sends the tables of a worker to the lobby and returns False if the lobby was
+    too busy to take all of it, in which case the report is sent again later.
+    """
+    for start in range(0, max(len(tables), 1), REPORT_CHUNK):
+        chunk = tables[start:start + REPORT_CHUNK]
+        flags = (_FIRST if start == 0 else 0) | (_FINAL if start + REPORT_CHUNK >= len(tables) else 0)
+        message = _REPORT.pack(flags, sequence) + b''.join(_TABLE.pack(*table) for table in chunk)
+        try:
+            control.send(message)
+        except BlockingIOError:
+            return False
+    return True
+
+
+async def run(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, workers: int = 1, history: Optional[str] = None):
+    lobby = Lobby(workers, history)
+    server = await lobby.serve(host, port)
+    logger.info('Lobby with %d workers listening on %s', workers,
+                ', '.join(str(sock.getsockname()) for sock in server.sockets))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        lobby.close()
@@ -0,0 +1,372 @@
+""" Opt-in runtime metrics of tables, the engine and the evaluator.
+
+Nothing is measured until enable() is called, and the instrumented functions are
+left untouched until then so disabled metrics cost nothing. enable() wraps:
+
+    TexasHoldem.hand_strength           hand_strength_seconds, evaluations only
+    TexasHoldem._handle_winner          showdown_seconds
+    Deck.shuffle, Deck.get_cards        shuffle_seconds, deal_seconds
+    Table._announce ... Table._act      turn_seconds, turn to action
+    Table.start ... Table._finish       hands per table since its first hand started
+
+and disable() puts the originals back. Latencies go to Histograms with fixed power
+of two buckets from 1 µs, so observing is a bisect and an increment. Hit rates of
+caches registered with watch_cache (isomorphism.CACHE by default) are read when
+the stats are.
+
+snapshot() returns everything as a dict, text() as a readable summary and
+prometheus() in the Prometheus text format. profile(table_id) runs cProfile only
+during the actions of one table so a slow table can be sampled in a running
+server. serve() answers these over HTTP:
+
+    GET /metrics                           prometheus()
+    GET /stats                             text()
+    GET /profile?table=<id>&seconds=<s>    profile of the table for given time
+"""
+from __future__ import annotations
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import asyncio, bisect, cProfile, io, pstats, time, urllib.parse, weakref
+
+from tcp_ip_poker import isomorphism
+from tcp_ip_poker.isomorphism import LRUCache
+from tcp_ip_poker.poker import Deck, TexasHoldem
+
+BUCKETS = tuple(1e-6 * 2 ** n for n in range(24))
+PREFIX = 'tcp_ip_poker'
+DEFAULT_PORT = 9777
+MAX_PROFILE_SECONDS = 60.0
+
+_patches: List[Tuple[type, str, object]] = []
+_histograms: Dict[str, Histogram] = {}
+_tables: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_turns: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_caches: Dict[str, LRUCache] = {'isomorphism': isomorphism.CACHE}
+_profiles: Dict[int, cProfile.Profile] = {}
+
+
+class Histogram:
+    """ Counts of observed values in BUCKETS, the last bucket counts everything larger """
+    __slots__ = ('_counts', '_sum', '_count')
+
+    def __init__(self):
+        self.clear()
+
+    # --- Properties ---
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    @property
+    def counts(self) -> Sequence[int]:
+        return list(self._counts)
+
+    # --- Public methods ---
+
+    def observe(self, value: float):
+        self._counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self._sum += value
+        self._count += 1
+
+    def quantile(self, q: float) -> float:
+        """ Returns the upper bound of the bucket holding given quantile """
+        if not self._count:
+            return 0.0
+        rank = q * self._count
+        seen = 0
+        for idx, count in enumerate(self._counts):
+            seen += count
+            if seen >= rank and count:
+                return BUCKETS[idx] if idx < len(BUCKETS) else float('inf')
+        return float('inf')
+
+    def clear(self):
+        self._counts = [0] * (len(BUCKETS) + 1)
+        self._sum = 0.0
+        self._count = 0
+
+
+class _TableStats:
+    __slots__ = ('hands', 'since')
+
+    def __init__(self):
+        self.hands = 0
+        self.since = time.monotonic()
+
+
+def enabled() -> bool:
+    return bool(_patches)
+
+
+def enable():
+    """ Instruments the engine and server, does nothing if already enabled """
+    if _patches:
+        return
+    from tcp_ip_poker.server import Table
+    _wrap(TexasHoldem, 'hand_strength', _evaluated)
+    _wrap(TexasHoldem, '_handle_winner', _timed('showdown_seconds'))
+    _wrap(Deck, 'shuffle', _timed('shuffle_seconds'))
+    _wrap(Deck, 'get_cards', _timed('deal_seconds'))
+    _wrap(Table, '_announce', _announced)
+    _wrap(Table, '_act', _acted)
+    _wrap(Table, 'start', _started)
+    _wrap(Table, '_finish', _finished)
+
+
+def disable():
+    """ Restores the uninstrumented functions. Collected metrics are kept """
+    while _patches:
+        owner, name, original = _patches.pop()
+        setattr(owner, name, original)
+    for profile in _profiles.values():
+        profile.disable()
+    _profiles.clear()
+
+
+def reset():
+    """ Forgets every collected metric """
+    for values in _histograms.values():
+        values.clear()
+    _tables.clear()
+    _turns.clear()
+
+
+def histogram(name: str) -> Histogram:
+    """ Returns the histogram of given name, creating it when missing """
+    result = _histograms.get(name)
+    if result is None:
+        result = _histograms[name] = Histogram()
+    return result
+
+
+def watch_cache(name: str, cache: Optional[LRUCache]):
+    """ Reports the hit rate of cache under name, None stops reporting it """
+    if cache is None:
+        _caches.pop(name, None)
+    else:
+        _caches[name] = cache
+
+
+def snapshot() -> Dict[str, dict]:
+    """ Returns the current metrics as plain data """
+    now = time.monotonic()
+    return {
+        'histograms': {name: {
+            'count': value.count,
+            'sum': value.sum,
+            'p50': value.quantile(0.5),
+            'p99': value.quantile(0.99)
+        } for name, value in _histograms.items()},
+        'tables': {table.id: {
+            'hands': stats.hands,
+            'hands_per_second': stats.hands / max(now - stats.since, 1e-9)
+        } for table, stats in list(_tables.items())},
+        'caches': {name: {
+            'hits': cache.hits,
+            'misses': cache.misses,
+            'hit_rate': cache.hit_rate
+        } for name, cache in _caches.items()}
+    }
+
+
+def text() -> str:
+    """ Returns the current metrics as a readable summary """
+    stats = snapshot()
+    lines = []
+    for name, value in sorted(stats['histograms'].items()):
+        lines.append(f'{name:<26} {value["count"]:>10} calls  p50 {value["p50"] * 1e6:>10,.0f} µs'
+                     f'  p99 {value["p99"] * 1e6:>10,.0f} µs')
+    for table_id, value in sorted(stats['tables'].items()):
+        lines.append(f'table {table_id:<20} {value["hands"]:>10} hands {value["hands_per_second"]:>10.1f} hands/s')
+    for name, value in sorted(stats['caches'].items()):
+        lines.append(f'cache {name:<20} {value["hits"]:>10} hits  {value["misses"]:>10} misses'
+                     f'  {value["hit_rate"]:>6.1%} hit rate')
+    return ''.join(line + '\n' for line in lines)
+
+
+def prometheus() -> str:
+    """ Returns the current metrics in the Prometheus text exposition format """
+    stats = snapshot()
+    lines = []
+    for name, value in sorted(_histograms.items()):
+        metric = f'{PREFIX}_{name}'
+        lines.append(f'# TYPE {metric} histogram')
+        seen = 0
+        for bound, count in zip(BUCKETS, value.counts):
+            seen += count
+            lines.append(f'{metric}_bucket{{le="{bound:g}"}} {seen}')
+        lines.append(f'{metric}_bucket{{le="+Inf"}} {value.count}')
+        lines.append(f'{metric}_sum {value.sum!r}')
+        lines.append(f'{metric}_count {value.count}')
+    lines.append(f'# TYPE {PREFIX}_table_hands_total counter')
+    for table_id, value in sorted(stats['tables'].items()):
+        lines.append(f'{PREFIX}_table_hands_total{{table="{table_id}"}} {value["hands"]}')
+    lines.append(f'# TYPE {PREFIX}_table_hands_per_second gauge')
+    for table_id, value in sorted(stats['tables'].items()):
+        lines.append(f'{PREFIX}_table_hands_per_second{{table="{table_id}"}} {value["hands_per_second"]!r}')
+    for kind in ('hits', 'misses'):
+        lines.append(f'# TYPE {PREFIX}_cache_{kind}_total counter')
+        for name, value in sorted(stats['caches'].items()):
+            lines.append(f'{PREFIX}_cache_{kind}_total{{cache="{name}"}} {value[kind]}')
+    return ''.join(line + '\n' for line in lines)
+
+
+def profile(table_id: int) -> Callable[[], pstats.Stats]:
+    """ Starts profiling the actions of given table, enabling metrics if needed.
+    Returns a function that stops profiling and returns the collected stats.
+    """
+    enable()
+    profiler = _profiles[table_id] = cProfile.Profile()
+
+    def stop() -> pstats.Stats:
+        if _profiles.get(table_id) is profiler:
+            del _profiles[table_id]
+        return pstats.Stats(profiler)
+    return stop
+
+
+async def serve(host: str = '127.0.0.1', port: int = DEFAULT_PORT) -> asyncio.AbstractServer:
+    """ Enables metrics and starts answering them over HTTP on given address """
+    enable()
+    return await asyncio.start_server(_handle, host, port)
+
+# --- Private functions ---
+
+def _wrap(owner: type, name: str, wrapper: Callable[[Callable], Callable]):
+    original = owner.__dict__[name]
+    if isinstance(original, (classmethod, staticmethod)):
+        patched = type(original)(wrapper(original.__func__))
+    else:
+        patched = wrapper(original)
+    setattr(owner, name, patched)
+    _patches.append((owner, name, original))
+
+
+def _timed(name: str) -> Callable[[Callable], Callable]:
+    values = histogram(name)
+
+    def wrapper(function: Callable) -> Callable:
+        perf_counter = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                values.observe(perf_counter() - start)
+        return timed
+    return wrapper
+
+
+def _evaluated(function: Callable) -> Callable:
+    values = histogram('hand_strength_seconds')
+    perf_counter = time.perf_counter
+
+    def hand_strength(game, player):
+        # Only calls that evaluate are timed, later calls of a street are a lookup
+        if player in game._strengths:
+            return function(game, player)
+        start = perf_counter()
+        try:
+            return function(game, player)
+        finally:
+            values.observe(perf_counter() - start)
+    return hand_strength
+
+
+def _announced(function: Callable) -> Callable:
+    def announce(table):
+        function(table)
+        if table.game.active:
+            _turns[table] = time.perf_counter()
+    return announce
+
+
+def _acted(function: Callable) -> Callable:
+    values = histogram('turn_seconds')
+    profiled = _profiled(function)
+
+    def act(table, *args):
+        started = _turns.pop(table, None)
+        if started is not None:
+            values.observe(time.perf_counter() - started)
+        return profiled(table, *args)
+    return act
+
+
+def _profiled(function: Callable) -> Callable:
+    def run(table, *args):
+        profiler = _profiles.get(table.id)
+        if profiler is None:
+            return function(table, *args)
+        profiler.enable()
+        try:
+            return function(table, *args)
+        finally:
+            profiler.disable()
+    return run
+
+
+def _started(function: Callable) -> Callable:
+    profiled = _profiled(function)
+
+    def start(table, *args):
+        if table not in _tables:
+            _tables[table] = _TableStats()
+        return profiled(table, *args)
+    return start
+
+
+def _finished(function: Callable) -> Callable:
+    def finish(table):
+        stats = _tables.get(table)
+        if stats is None:
+            stats = _tables[table] = _TableStats()
+        stats.hands += 1
+        function(table)
+    return finish
+
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request = await asyncio.wait_for(reader.readline(), 10)
+        while (await asyncio.wait_for(reader.readline(), 10)).strip():
+            pass
+        method, target, *_ = request.decode('latin-1').split() + ['', '']
+        url = urllib.parse.urlsplit(target)
+        query = urllib.parse.parse_qs(url.query)
+        status = '200 OK'
+        if method != 'GET':
+            status, body = '405 Method Not Allowed', ''
+        elif url.path == '/metrics':
+            body = prometheus()
+        elif url.path == '/stats':
+            body = text()
+        elif url.path == '/profile':
+            try:
+                table_id = int(query['table'][0])
+                seconds = min(float(query.get('seconds', ['5'])[0]), MAX_PROFILE_SECONDS)
+            except (KeyError, ValueError):
+                status, body = '400 Bad Request', 'table=<id> and optional seconds=<s> required\n'
+            else:
+                stop = profile(table_id)
+                await asyncio.sleep(seconds)
+                output = io.StringIO()
+                stats = stop()
+                stats.stream = output
+                stats.sort_stats('cumulative').print_stats(40)
+                body = output.getvalue()
+        else:
+            status, body = '404 Not Found', ''
+        data = body.encode()
+        writer.write(f'HTTP/1.0 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                     f'Content-Length: {len(data)}\r\nConnection: close\r\n\r\n'.encode() + data)
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
@@ -0,0 +1,153 @@
+""" Decision engine of NPC players.
+
+An NPC estimates the equity of its hand against the other players still in the
+hand by Monte Carlo sampling of the unknown cards (see equity.simulate) and folds
+when the equity is below a threshold. Sampling is anytime: small batches are run
+until the time budget is used up and the estimate so far decides, so a decision
+never takes longer than the budget however loaded the machine is. Without bets a
+fold only forfeits the pot, so the default threshold only gives up hopeless hands.
+
+One NPCEngine serves every table of a process. Decisions run on its process pool
+so NPC seats never hold up the event loop that serves human players. The deadline
+is set when the decision is requested, so time spent queued behind other
+decisions counts against the budget, and if the pool does not answer in time the
+NPC checks. The evaluator tables are built when a pool process starts so the first
+decision of a process is not spent building them. Processes that can not start a
+process pool, like the daemon workers of a lobby, decide on a thread pool instead,
+which the interpreter switches away from every few milliseconds so the event loop
+of the process keeps serving its clients while an NPC thinks.
+"""
+from __future__ import annotations
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import NamedTuple, Optional
+import asyncio, os, random, time
+
+from tcp_ip_poker import equity
+from tcp_ip_poker.poker import Action, Player, TexasHoldem
+
+BUDGET = 0.005
+FOLD_BELOW = 0.05
+BATCH_SIZE = 32
+GRACE = 0.005
+
+
+class Decision(NamedTuple):
+    """ Action chosen and the equity estimate from given number of samples it is based on """
+    action: Action
+    equity: float
+    samples: int
+
+
+def decide(
+        hole: int,
+        board: int,
+        opponents: int,
+        deadline: float,
+        fold_below: float = FOLD_BELOW,
+        seed: Optional[int] = None
+    ) -> Decision:
+    """ Samples the equity of hole and board card masks against given number of
+    opponents until time.monotonic() reaches deadline and decides from the estimate.
+    At least one batch is sampled unless the deadline has already passed, in which
+    case the NPC checks.
+    """
+    if seed is None:
+        seed = random.randrange(1 << 63)
+    share = 0.0
+    samples = 0
+    stream = 0
+    while time.monotonic() < deadline:
+        wins, ties, losses, batch_share, _ = equity.simulate(hole, board, opponents, BATCH_SIZE, seed, stream)
+        share += batch_share
+        samples += wins + ties + losses
+        stream += 1
+    if not samples:
+        return Decision(Action.CHECK, float('nan'), 0)
+    estimate = share / samples
+    return Decision(Action.FOLD if estimate < fold_below else Action.CHECK, estimate, samples)
+
+
+class NPCEngine:
+    """ Decides the actions of NPC players within a time budget on a shared pool. With
+    threads decisions run on a thread pool of that size instead of a process pool and
+    with processes 0 they run in the calling thread, still within the budget.
+    """
+
+    def __init__(
+            self,
+            budget: float = BUDGET,
+            fold_below: float = FOLD_BELOW,
+            processes: Optional[int] = None,
+            executor: Optional[Executor] = None,
+            threads: Optional[int] = None
+        ):
+        if budget <= 0:
+            raise ValueError('Budget must be positive')
+        self._budget = budget
+        self._fold_below = fold_below
+        self._processes = processes
+        self._threads = threads
+        self._executor = executor
+        self._own_executor = False
+
+    # --- Properties ---
+
+    @property
+    def budget(self) -> float:
+        return self._budget
+
+    # --- Public methods ---
+
+    def decide(self, game: TexasHoldem, player: Player) -> Decision:
+        """ Decides the action of player in the calling thread """
+        return decide(*self._situation(game, player), time.monotonic() + self._budget, self._fold_below)
+
+    async def decide_async(self, game: TexasHoldem, player: Player) -> Decision:
+        """ Decides the action of player on the pool. Returns a check if the pool does
+        not answer within the budget.
+        """
+        hole, board, opponents = self._situation(game, player)
+        deadline = time.monotonic() + self._budget
+        if self._processes == 0 and not self._threads and self._executor is None:
+            return decide(hole, board, opponents, deadline, self._fold_below)
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._pool(), decide, hole, board, opponents, deadline, self._fold_below)
+        try:
+            return await asyncio.wait_for(future, self._budget + GRACE)
+        except asyncio.TimeoutError:
+            return Decision(Action.CHECK, float('nan'), 0)
+
+    def warm_up(self):
+        """ Builds the evaluator tables of an inline or threaded engine now instead of
+        during the first decision. Pool processes do this when they start.
+        """
+        if self._executor is None and (self._processes == 0 or self._threads):
+            _warm_up()
+
+    def close(self):
+        if self._own_executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._own_executor = False
+
+    # --- Private methods ---
+
+    def _pool(self) -> Executor:
+        if self._executor is None:
+            if self._threads:
+                self._executor = ThreadPoolExecutor(self._threads, thread_name_prefix='npc')
+            else:
+                self._executor = ProcessPoolExecutor(self._processes or os.cpu_count(), initializer=_warm_up)
+            self._own_executor = True
+        return self._executor
+
+    @staticmethod
+    def _situation(game: TexasHoldem, player: Player):
+        folded = game.folded
+        opponents = sum(1 for other in game.players if other is not player and other not in folded)
+        return player.hand_set.mask, game.table_set.mask, max(opponents, 1)
+
+# --- Private functions ---
+
+def _warm_up():
+    equity.simulate(0b11, 0, 1, 1, 0, 0)
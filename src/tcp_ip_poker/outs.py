@@ -0,0 +1,133 @@
+""" Outs of every player for the next card.
+
+For every card that can still come the strength of every player's hand with that
+card is computed in one pass over the unseen cards. The rank product and suit
+masks of each player's hand with the board are computed once, after which each
+card costs one multiplication and two table lookups per player instead of a full
+evaluation. A street with four players and 45 unseen cards takes
+well under a millisecond, cheap enough to run on every table after every street.
+With a cache (e.g. isomorphism.CACHE) the outs are computed once per suit
+canonical form of the holes, board and dead cards and mapped back to the suits of
+each isomorphic situation.
+"""
+from __future__ import annotations
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Union
+
+from tcp_ip_poker import evaluator, isomorphism
+from tcp_ip_poker.isomorphism import LRUCache
+from tcp_ip_poker.poker import Card, CardSet, Player, TexasHoldem
+
+BOARD_CARDS = 5
+
+
+class Outs(NamedTuple):
+    """ Outs of one player. Strength is the evaluator strength of the current hand,
+    improving holds the cards that raise its category and winning the cards after
+    which the player has the best hand, alone or tied. Leading tells whether the
+    player has the best hand now.
+    """
+    strength: int
+    leading: bool
+    improving: CardSet
+    winning: CardSet
+
+
+def analyze(
+        holes: Sequence[Union[CardSet, Iterable[Card]]],
+        board: Union[CardSet, Iterable[Card]] = (),
+        dead: Union[CardSet, Iterable[Card]] = (),
+        cache: Optional[LRUCache] = None
+    ) -> List[Outs]:
+    """ Returns the outs of every hole card set given on given board. Dead cards e.g.
+    folded hands can not come. With a cache results are shared between isomorphic
+    situations.
+    """
+    holes = [hole if isinstance(hole, CardSet) else CardSet(hole) for hole in holes]
+    board = board if isinstance(board, CardSet) else CardSet(board)
+    dead = dead if isinstance(dead, CardSet) else CardSet(dead)
+    if len(board) >= BOARD_CARDS:
+        raise ValueError('Board is already complete')
+    if board.mask & dead.mask:
+        raise ValueError('Dead cards must be distinct from the board')
+    known = board.mask | dead.mask
+    for hole in holes:
+        if hole.mask & known or not hole:
+            raise ValueError('Hole cards must be given and distinct from other cards')
+        known |= hole.mask
+    if cache is not None:
+        masks = (board.mask, dead.mask, *(hole.mask for hole in holes))
+        order = isomorphism.canonical_order(*masks)
+        canonical = tuple(isomorphism.relabel(mask, order) for mask in masks)
+        results = cache.get_or_compute(('outs', canonical), lambda: analyze(
+            [CardSet(mask) for mask in canonical[2:]], CardSet(canonical[0]), CardSet(canonical[1])))
+        return [result._replace(improving=CardSet(isomorphism.restore(result.improving.mask, order)),
+                                winning=CardSet(isomorphism.restore(result.winning.mask, order)))
+                for result in results]
+    strengths = [evaluator.evaluate_mask(hole.mask | board.mask) for hole in holes]
+    if not strengths:
+        return []
+
+    rank_table = evaluator.rank_strengths()
+    flush_table = evaluator.flush_strengths()
+    products = evaluator.prime_products()
+    board_suits = _suit_masks(board.mask)
+    board_product = 1
+    for suit_mask in board_suits:
+        board_product *= products[suit_mask]
+    # Per player the rank product and suit masks of hole cards and board together
+    players = []
+    for hole in holes:
+        suits = [board_suit | hole_suit for board_suit, hole_suit in zip(board_suits, _suit_masks(hole.mask))]
+        product = board_product
+        for hole_suit in _suit_masks(hole.mask):
+            product *= products[hole_suit]
+        players.append((product, suits, max(flush_table[suit] for suit in suits)))
+
+    improving = [0] * len(holes)
+    winning = [0] * len(holes)
+    categories = [strength >> evaluator.CATEGORY_SHIFT for strength in strengths]
+    after = [0] * len(holes)
+    seats = range(len(holes))
+    for card_id in range(Card.IDS):
+        bit = 1 << card_id
+        if known & bit:
+            continue
+        suit, rank = divmod(card_id, evaluator.RANKS)
+        prime = evaluator.PRIMES[rank]
+        rank_bit = 1 << rank
+        for seat in seats:
+            product, suits, flush = players[seat]
+            strength = rank_table[product * prime]
+            suited = flush_table[suits[suit] | rank_bit]
+            if flush > strength:
+                strength = flush
+            if suited > strength:
+                strength = suited
+            after[seat] = strength
+            if strength >> evaluator.CATEGORY_SHIFT > categories[seat]:
+                improving[seat] |= bit
+        best = max(after)
+        for seat in seats:
+            if after[seat] == best:
+                winning[seat] |= bit
+    best = max(strengths)
+    return [Outs(strengths[seat], strengths[seat] == best, CardSet(improving[seat]), CardSet(winning[seat]))
+            for seat in seats]
+
+
+def of_game(game: TexasHoldem, cache: Optional[LRUCache] = None) -> Dict[Player, Outs]:
+    """ Returns the outs of the players of a running game who have not folded. The
+    hands of folded players are dead cards.
+    """
+    folded = game.folded
+    players = [player for player in game.players if player not in folded]
+    dead = CardSet()
+    for player in folded:
+        dead = dead | player.hand_set
+    results = analyze([player.hand_set for player in players], game.table_set, dead, cache)
+    return dict(zip(players, results))
+
+# --- Private functions ---
+
+def _suit_masks(mask: int) -> List[int]:
+    return [(mask >> evaluator.RANKS * suit) & evaluator.SUIT_MASK for suit in range(4)]
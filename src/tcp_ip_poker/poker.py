@@ -1,6 +1,8 @@
 from __future__ import annotations
-from typing import Union, Sequence, Tuple
-import enum, itertools, random, copy
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Union, Sequence, Tuple
+import collections.abc, enum, functools, random, copy, operator, struct
+
+from tcp_ip_poker import evaluator
 
 class Suit(enum.Enum):
     """ Value is a tuple of description and unicode symbol """
@@ -11,12 +13,19 @@ class Suit(enum.Enum):
 
     @classmethod
     def index(cls, item: Suit):
-        for idx, suit in enumerate(cls):
-            if suit == item:
-                return idx
-        return -1
+        return _SUIT_INDEX.get(item, -1)
+
+_SUIT_INDEX = {suit: idx for idx, suit in enumerate(Suit)}
+_SUITS = tuple(Suit)
 
 class Card:
+    """ Playing card. There is only one instance of each of the 52 cards, constructing a
+    card returns the shared instance. Each card has an id from 0 to 51 which is
+    suit index * 13 + evaluator rank, so the cards of one suit take 13 consecutive
+    bits of a CardSet mask.
+    """
+    __slots__ = ('_suit', '_value', '_id')
+
     MIN_VALUE = 1
     VALUES = [
         ('Ace', 'A'),
@@ -33,18 +42,18 @@ class Card:
         ('Queen', 'Q'),
         ('King', 'K')
     ]
+    IDS = len(VALUES) * len(Suit)
 
 
-    def __init__(self, suit: Suit, value: int):
-        if not self.MIN_VALUE <=  value <= len(self.VALUES) + self.MIN_VALUE:
+    def __new__(cls, suit: Suit, value: int):
+        if not isinstance(value, int) or not cls.MIN_VALUE <= value < len(cls.VALUES) + cls.MIN_VALUE:
             raise ValueError('Invalid value')
         if not isinstance(suit, Suit):
             raise ValueError('Invalid suit')
-        self._suit = suit
-        self._value = value
+        return _CARDS[_SUIT_INDEX[suit] * evaluator.RANKS + evaluator.rank_of_value(value)]
 
     def __eq__(self, card: Card) -> bool:
-        return self.value == card.value and self.suit == card.suit
+        return self is card or (isinstance(card, Card) and self._id == card._id)
 
     def __lt__(self, card: Card) -> bool:
         return  self.value < card.value
@@ -55,6 +64,9 @@ class Card:
     def __str__(self) -> str:
         return self.get_short_string()
 
+    def __repr__(self) -> str:
+        return f"Card({self.suit}, {self.value})"
+
     def __add__(self, card: Card) -> int:
         return self.value + card.value
 
@@ -62,7 +74,16 @@ class Card:
         return self.value - card.value
         
     def __hash__(self):
-        return (self.value << 2) | Suit.index(self.suit)
+        return self._id
+
+    def __copy__(self) -> Card:
+        return self
+
+    def __deepcopy__(self, memo) -> Card:
+        return self
+
+    def __reduce__(self):
+        return Card.from_id, (self._id,)
 
     # --- Properties ---
 
@@ -74,9 +95,26 @@ class Card:
     def suit(self) -> Suit:
         return self._suit
 
+    @property
+    def id(self) -> int:
+        """ Returns the cards id from 0 to 51 """
+        return self._id
+
+    @property
+    def mask(self) -> int:
+        """ Returns the cards bit in a CardSet mask """
+        return 1 << self._id
+
 
     # --- Public methods ---
 
+    @staticmethod
+    def from_id(card_id: int) -> Card:
+        """ Returns the card of given id """
+        if not 0 <= card_id < Card.IDS:
+            raise ValueError('Invalid card id')
+        return _CARDS[card_id]
+
     def get_value(self, long = True) -> str:
         """ Returns the cards value as string. If long is true returns full description
         otherwise returns short description.
@@ -94,55 +132,225 @@ class Card:
     # --- Private methods ---
 
 
+def _create_cards() -> Sequence[Card]:
+    cards = []
+    for card_id in range(Card.IDS):
+        card = object.__new__(Card)
+        card._suit = _SUITS[card_id // evaluator.RANKS]
+        card._value = evaluator.value_of_rank(card_id % evaluator.RANKS)
+        card._id = card_id
+        cards.append(card)
+    return tuple(cards)
+
+_CARDS = _create_cards()
+_NO_CARD = 0xFF
+_card_id = operator.attrgetter('_id')
+
+class CardSet:
+    """ Immutable set of cards stored as a 64 bit mask where bit n is the card with id n.
+    Supports the usual set operators between card sets and membership checks for cards.
+    Iterating yields the cards in id order.
+    """
+    __slots__ = ('_mask',)
+
+    FULL_MASK = (1 << Card.IDS) - 1
+
+    def __init__(self, cards: Union[Iterable[Card], int, None] = None):
+        if cards is None:
+            mask = 0
+        elif isinstance(cards, int):
+            if not 0 <= cards <= self.FULL_MASK:
+                raise ValueError('Invalid card mask')
+            mask = cards
+        else:
+            mask = 0
+            for card in cards:
+                mask |= 1 << card.id
+        self._mask = mask
+
+    def __int__(self) -> int:
+        return self._mask
+
+    def __len__(self) -> int:
+        return bin(self._mask).count('1')
+
+    def __bool__(self) -> bool:
+        return self._mask != 0
+
+    def __iter__(self) -> Iterator[Card]:
+        mask = self._mask
+        while mask:
+            low = mask & -mask
+            yield _CARDS[low.bit_length() - 1]
+            mask ^= low
+
+    def __contains__(self, card: Card) -> bool:
+        return isinstance(card, Card) and bool(self._mask >> card.id & 1)
+
+    def __eq__(self, other: CardSet) -> bool:
+        return isinstance(other, CardSet) and self._mask == other._mask
+
+    def __hash__(self):
+        return hash(self._mask)
+
+    def __or__(self, other: CardSet) -> CardSet:
+        return CardSet(self._mask | other._mask)
+
+    def __and__(self, other: CardSet) -> CardSet:
+        return CardSet(self._mask & other._mask)
+
+    def __sub__(self, other: CardSet) -> CardSet:
+        return CardSet(self._mask & ~other._mask)
+
+    def __xor__(self, other: CardSet) -> CardSet:
+        return CardSet(self._mask ^ other._mask)
+
+    def __str__(self) -> str:
+        return ''.join(str(card) for card in self)
+
+    def __repr__(self) -> str:
+        return f"CardSet({self._mask:#x})"
+
+    # --- Properties ---
+
+    @property
+    def mask(self) -> int:
+        return self._mask
+
+    # --- Public methods ---
+
+    def add(self, card: Card) -> CardSet:
+        """ Returns a new set with given card added """
+        return CardSet(self._mask | (1 << card.id))
+
+    def remove(self, card: Card) -> CardSet:
+        """ Returns a new set with given card removed """
+        return CardSet(self._mask & ~(1 << card.id))
+
+    def isdisjoint(self, other: CardSet) -> bool:
+        return not self._mask & other._mask
+
+    def issubset(self, other: CardSet) -> bool:
+        return self._mask & ~other._mask == 0
+
 class Deck:
     """ Class that represents classic deck with 4 suits and cards in each suite from 1 to
     ace.
+
+    The cards live in one fixed list where the first len(deck) cards are still in the
+    deck and the top is the last of them. A shuffled deck is not shuffled up front,
+    instead every card dealt is drawn at random from the remaining cards and swapped
+    to the top (a partial Fisher-Yates shuffle), so dealing k cards takes k random
+    numbers and no card or list is created. Filling only resets the count. Random
+    positions are scaled from random() which is faster than randrange and biased by
+    less than 2**-46 for a deck.
+
+    A snapshot holds the flags, the count and the order of every card as card ids.
+    Taking one fixes the order of the remaining cards of a shuffled deck first, so a
+    restored deck deals exactly the cards the original deals.
     """
     MAX_DECK_SIZE = len(Card.VALUES) * len(Suit)
+    SNAPSHOT = struct.Struct(f'<BB{MAX_DECK_SIZE}s')
 
-    def __init__(self):
-        self._cards = []
-        self.fill()
+    def __init__(self, rng: Optional[random.Random] = None):
+        self._cards = list(_CARDS)
+        self._size = len(self._cards)
+        self._shuffled = False
+        self._ordered = False
+        self._top_drawn = False
+        self._random = (rng or random).random
 
     def __len__(self):
-        return len(self._cards)
+        return self._size
 
     # --- Properties ---
 
     @property
     def empty(self) -> bool:
-        return len(self._cards) == 0
+        return self._size == 0
+
+    @property
+    def card_set(self) -> CardSet:
+        """ Returns the cards remaining in the deck as a card set """
+        return CardSet(self._cards[:self._size])
 
     # --- Public methods ---
 
     def fill(self):
-        """ Restocks the deck with full deck"""
-        self._cards.clear()
-        
-        value_range = range(Card.MIN_VALUE, len(Card.VALUES) + Card.MIN_VALUE)
-        for suit, value in itertools.product(Suit, value_range):
-            self._cards.append(Card(suit, value))
+        """ Restocks the deck with full deck. A shuffled deck stays shuffled. """
+        self._size = len(self._cards)
+        self._ordered = False
+        self._top_drawn = False
+
+    def remove(self, cards: Iterable[Card]):
+        """ Removes given cards from the deck e.g. cards already known to be dealt """
+        removed = CardSet(cards).mask
+        remaining = self._cards[:self._size]
+        kept = [card for card in remaining if not removed >> card.id & 1]
+        self._cards[:self._size] = kept + [card for card in remaining if removed >> card.id & 1]
+        self._size = len(kept)
+        self._top_drawn = False
 
     def shuffle(self, times: int = 1):
-        """ Shuffles the current decks cards given amount of times or once if given times
-        is less than 1.
+        """ Shuffles the current decks cards. Cards are drawn at random when dealt so
+        shuffling more than once changes nothing but is allowed.
         """
         if not isinstance(times, int):
             raise ValueError('Invalid times parameter')
         if times < 1:
             raise ValueError('Deck must be shuffled atleast 1 time')
-        for _ in range(times):
-            random.shuffle(self._cards)
+        self._shuffled = True
+        self._ordered = False
+        self._top_drawn = False
+
+    def order(self):
+        """ Draws the order of the remaining cards of a shuffled deck now. Dealing takes
+        no random numbers after this until the deck is filled or shuffled again.
+        """
+        if self._shuffled and not self._ordered:
+            deck = self._cards
+            rand = self._random
+            top = self._size - 1
+            if self._top_drawn:
+                top -= 1
+            for top in range(top, 0, -1):
+                pick = int(rand() * (top + 1))
+                deck[pick], deck[top] = deck[top], deck[pick]
+            self._ordered = True
+            self._top_drawn = False
+
+    def snapshot(self) -> bytes:
+        """ Returns the state of the deck as SNAPSHOT bytes, fixing the order first """
+        self.order()
+        flags = self._shuffled | self._ordered << 1
+        return self.SNAPSHOT.pack(flags, self._size, bytes(map(_card_id, self._cards)))
+
+    def restore(self, data: bytes):
+        """ Sets the state of the deck from a snapshot """
+        flags, size, card_ids = self.SNAPSHOT.unpack(data)
+        if sorted(card_ids) != list(range(self.MAX_DECK_SIZE)) or size > self.MAX_DECK_SIZE:
+            raise ValueError('Invalid deck snapshot')
+        self._cards = [_CARDS[card_id] for card_id in card_ids]
+        self._size = size
+        self._shuffled = bool(flags & 1)
+        self._ordered = bool(flags & 2)
+        self._top_drawn = False
 
     def peek_top(self) -> Card:
-        """ Returns an copy from top most card on the deck """
-        return copy.copy(self._cards[-1])
+        """ Returns the top most card on the deck without removing it """
+        if self._size == 0:
+            raise IndexError('Deck is empty')
+        self._draw_top()
+        return self._cards[self._size - 1]
 
     def get_card(self) -> Union[Card, None]:
         """ Removes the top most card from the deck and returns it """
-        if len(self._cards) > 0:
-            return self._cards.pop()
-        return None
+        if self._size == 0:
+            return None
+        self._draw_top()
+        self._size -= 1
+        self._top_drawn = False
+        return self._cards[self._size]
 
     def get_cards(self, cards: int) -> Sequence[Card]:
         """ Removes the top most cards from the deck and returns them in a list or one 
@@ -151,15 +359,31 @@ class Deck:
         """
         if not isinstance(cards, int):
             raise ValueError('Invalid cards parameter')
-        if cards < 1:
-            cards = 1
-        card_list = []
-        for _ in range(cards):
-            if len(self._cards) > 0:
-                card_list.append(self._cards.pop())
-            else:
-                break
-        return card_list
+        cards = min(max(cards, 1), self._size)
+        if self._shuffled and not self._ordered:
+            deck = self._cards
+            rand = self._random
+            top = self._size - 1
+            if self._top_drawn:
+                top -= 1
+            for top in range(top, self._size - 1 - cards, -1):
+                pick = int(rand() * (top + 1))
+                deck[pick], deck[top] = deck[top], deck[pick]
+            self._top_drawn = False
+        dealt = self._cards[self._size - cards:self._size]
+        dealt.reverse()
+        self._size -= cards
+        return dealt
+
+    # --- Private methods ---
+
+    def _draw_top(self):
+        """ Moves a random remaining card to the top of a shuffled deck """
+        if self._shuffled and not self._ordered and not self._top_drawn:
+            top = self._size - 1
+            pick = int(self._random() * self._size)
+            self._cards[pick], self._cards[top] = self._cards[top], self._cards[pick]
+            self._top_drawn = True
 
 class Player:
     """ Represents a single player in a game of poker. Host is the IP address of given 
@@ -170,6 +394,7 @@ class Player:
     def __init__(self, host: str):
         self._host = host
         self._hand: Sequence[Card] = []
+        self._hand_mask = 0
 
     # --- Properties ---
 
@@ -182,6 +407,11 @@ class Player:
         """ Returns copy of current hand as a list of cards"""
         return copy.copy(self._hand)
 
+    @property
+    def hand_set(self) -> CardSet:
+        """ Returns current hand as a card set """
+        return CardSet(self._hand_mask)
+
     @property
     def hand_full(self) -> bool:
         """ Returns boolean whether the players hand is full or not """
@@ -193,6 +423,12 @@ class Player:
         if self.hand_full:
             raise Exception('Hand is full')
         self._hand.append(card)
+        self._hand_mask |= 1 << card.id
+
+    def pick_cards(self, cards: Iterable[Card]):
+        """ Picks all given cards e.g. from a card set """
+        for card in cards:
+            self.pick_card(card)
 
     def discard_card(self, card: Union[int, Card]) -> Card:
         """ Discards the card of given index from hand. """
@@ -200,13 +436,16 @@ class Player:
             card = self._hand.index(card)
         elif not -1 < card < len(self._hand):
             raise ValueError('Invalid card index')
-        return self._hand.pop(card)
+        card = self._hand.pop(card)
+        self._hand_mask &= ~(1 << card.id)
+        return card
 
     def discard_cards(self) -> Sequence[Card]:
         """ Discards all cards in hand """
         cards = []
-        while self.hand_full:
+        while self._hand:
             cards.append(self._hand.pop())
+        self._hand_mask = 0
         return cards
 
 class VictoryCombination(enum.Enum):
@@ -225,73 +464,41 @@ class VictoryCombination(enum.Enum):
             cls,
             cards: Sequence[Card]
         ) -> Tuple(VictoryCombination, Sequence[Card]):
-        best = VictoryCombination.HIGH_CARD
-        best_idx = 0
-        combinations = [list(comb) for comb in itertools.combinations(cards, r=5)]
-        results = []
-        for combination in combinations:
-            combination.sort(key=lambda item: item.value)
-            flush = VictoryCombination.is_flush(combination)
-            straight = VictoryCombination.is_straight(combination)
-            duplicates = VictoryCombination.duplicate_value_cards(combination)
-            full_house = VictoryCombination.is_full_house(duplicates)
-            pairs, kinds = VictoryCombination.multiples(duplicates)
-            
-            if straight and flush:
-                results.append(VictoryCombination.STRAIGHT_FLUSH)
-            elif kinds == 4:
-                results.append(VictoryCombination.FOUR_OF_A_KIND)
-            elif full_house:
-                results.append(VictoryCombination.FULL_HOUSE)
-            elif flush:
-                results.append(VictoryCombination.FLUSH)
-            elif straight:
-                results.append(VictoryCombination.STRAIGHT)
-            elif kinds == 3:
-                results.append(VictoryCombination.THREE_OF_A_KIND)
-            elif pairs == 2:
-                results.append(VictoryCombination.TWO_PAIRS)
-            elif pairs == 1:
-                results.append(VictoryCombination.PAIR)
-            else:
-                results.append(VictoryCombination.HIGH_CARD)
-        for idx, current in enumerate(results):
-            if idx == 0:
-                best = current
-                best_idx = idx
-                continue
-            comparison = cls.compare_combinations(current, best)
-            if comparison == 0:
-                continue
-            elif comparison == 1:
-                best = current
-                best_idx = idx
-        if results.count(best) > 1:
-            best_comparison = []
-            lcombinations = []
-            for idx, res in enumerate(results):
-                if res == best:
-                    best_comparison.append(res)
-                    lcombinations.append(combinations[idx])
-            for idx, current in enumerate(best_comparison):
-                if idx == 0:
-                    continue
-                current_hand = lcombinations[idx]
-                previous = best_comparison[idx - 1]
-                previous_hand = lcombinations[idx - 1]
-                current_sum = sum(item.value for item in current_hand)
-                previous_sum = sum(item.value for item in previous_hand)
-                lidx = lcombinations.index(current_hand)
-                if current_sum > previous_sum:
-                    best = current
-                    best_idx = lidx
-                else:
-                    best = previous
-                    best_idx = lidx - 1
-            result = lcombinations[best_idx]
-        else:
-            result = combinations[best_idx]
-        return (best, result)
+        """ Returns the best combination and the five cards that make it from given cards """
+        strength = evaluator.evaluate(cards)
+        return cls.from_strength(strength), cls.best_cards(cards, strength)
+
+    @classmethod
+    def strength(cls, cards: Sequence[Card]) -> int:
+        """ Returns the strength of the best combination in given cards as integer. Bigger
+        strength is always a better hand, kickers included.
+        """
+        return evaluator.evaluate(cards)
+
+    @classmethod
+    def from_strength(cls, strength: int) -> VictoryCombination:
+        """ Returns the combination of given strength """
+        return _COMBINATIONS[evaluator.category(strength)]
+
+    @staticmethod
+    def rank_hands(hands: Sequence[Sequence[Card]]) -> Sequence[Sequence[int]]:
+        """ Returns the indexes of given hands grouped by equal strength from best to worst """
+        return evaluator.rank([evaluator.evaluate(cards) for cards in hands])
+
+    @staticmethod
+    def best_cards(cards: Sequence[Card], strength: int) -> Sequence[Card]:
+        """ Returns the cards that make the hand of given strength from given cards """
+        if evaluator.category(strength) in (evaluator.FLUSH, evaluator.STRAIGHT_FLUSH):
+            suits = [card.suit for card in cards]
+            flush_suit = max(suits, key=suits.count)
+            cards = [card for card in cards if card.suit == flush_suit]
+        by_value = {}
+        for card in cards:
+            by_value.setdefault(card.value, []).append(card)
+        result = []
+        for rank in evaluator.ranks(strength)[:min(len(cards), 5)]:
+            result.append(by_value[evaluator.value_of_rank(rank)].pop())
+        return result
 
     @classmethod
     def compare_combinations(cls, c1: VictoryCombination, c2: VictoryCombination) -> int:
@@ -357,22 +564,142 @@ class VictoryCombination(enum.Enum):
             duplicates[card.value].append(card)
         return duplicates
 
+_COMBINATIONS = tuple(VictoryCombination)
+
+class Action(enum.IntEnum):
+    CHECK = 0
+    FOLD = 1
+
+class SequenceView(collections.abc.Sequence):
+    """ Read-only view of a list the engine keeps updating. Taking one copies nothing,
+    it compares equal to lists and tuples of the same items and adding it to a list or
+    tuple gives a list.
+    """
+    __slots__ = ('_items',)
+
+    def __init__(self, items: list):
+        self._items = items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __getitem__(self, index):
+        return self._items[index]
+
+    def __iter__(self) -> Iterator:
+        return iter(self._items)
+
+    def __contains__(self, item) -> bool:
+        return item in self._items
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, SequenceView):
+            return self._items == other._items
+        if isinstance(other, (list, tuple)):
+            return len(self._items) == len(other) and all(a == b for a, b in zip(self._items, other))
+        return NotImplemented
+
+    __hash__ = None
+
+    def __add__(self, other: Iterable) -> list:
+        return self._items + list(other)
+
+    def __radd__(self, other: Iterable) -> list:
+        return list(other) + self._items
+
+    def __repr__(self) -> str:
+        return repr(self._items)
+
+    def index(self, item, *args) -> int:
+        return self._items.index(item, *args)
+
+    def count(self, item) -> int:
+        return self._items.count(item)
+
+class EventType(enum.IntEnum):
+    START = 0
+    DEAL = 1
+    BOARD = 2
+    CHECK = 3
+    FOLD = 4
+    SHOWDOWN = 5
+
+class GameEvent(NamedTuple):
+    """ One event of a hand. Cards are card ids and the fields used depend on type:
+
+        START       seat = number of players
+        DEAL        seat, cards = hole cards of the seat
+        BOARD       cards = cards dealt to the table
+        CHECK       seat
+        FOLD        seat
+        SHOWDOWN    seat = winner seats bit mask, strength of the winning hand
+    """
+    type: EventType
+    seat: int = 0
+    cards: bytes = b''
+    strength: int = 0
+
+# Enum members and NamedTuple.__new__ are slow enough to show in a hand
+_START, _DEAL, _BOARD, _CHECK, _FOLD, _SHOWDOWN = EventType
+_event = functools.partial(tuple.__new__, GameEvent)
+
 class TexasHoldem:
     """ Class represents a game of Poker between 2 to 4 players. Players can either be 
     controller by AI of the software.
+
+    A hand is an append-only stream of GameEvents and the state of the game is a fold
+    over it: actions and dealing emit an event which is then applied, and applying
+    never draws cards or evaluates hands since the dealt cards and the result of the
+    showdown are in the events. replay(events, players) rebuilds a game from its
+    events alone, without a deck or the evaluator unless asked to rescore it. The
+    properties are read-only views of the state, nothing is copied.
+
+    The complete state of a game is a fixed size snapshot of SNAPSHOT_SIZE bytes that
+    takes microseconds to take and restore, so a table can be checkpointed after
+    every action and moved to another process or recovered in the middle of a hand:
+
+        version u8, flags u8 (active, tie), players u8, turn u8,
+        players turn seat u8, seats done this turn u8 bit mask, npcs u8,
+        action count u8, action u8 * 16 (seat << 1 | Action),
+        winner seats bit mask u8, strength u32, hole cards u8 * 8, board u8 * 5,
+        deck (see Deck)
+
+    Cards are card ids and missing cards and seats are 0xFF. Players are stored by
+    seat and given back when restoring. Restoring replays the events of the snapshot.
     """
     MINIMUM_PLAYERS = 2
     MAXIMUM_PLAYERS = 4
-
-    def __init__(self):
-        self._deck = Deck()
-        self._table: Sequence[Card] = []
-        self._discard_pile: Sequence[Card] = []
-        self._players: Sequence[Player] = []
-        self._moves: Sequence[Tuple[Player, Card]] = []
+    HOLE_CARDS = 2
+    BOARD_CARDS = 5
+    MAX_ACTIONS = 16
+    SNAPSHOT_VERSION = 1
+    SNAPSHOT = struct.Struct(f'<8B{MAX_ACTIONS}sBI{HOLE_CARDS * MAXIMUM_PLAYERS}s{BOARD_CARDS}s')
+    SNAPSHOT_SIZE = SNAPSHOT.size + Deck.SNAPSHOT.size
+
+    # Events without cards are shared instead of allocated for every action
+    _STARTS = tuple(_event((_START, count, b'', 0)) for count in range(MAXIMUM_PLAYERS + 1))
+    _CHECKS = tuple(_event((_CHECK, seat, b'', 0)) for seat in range(MAXIMUM_PLAYERS))
+    _FOLDS = tuple(_event((_FOLD, seat, b'', 0)) for seat in range(MAXIMUM_PLAYERS))
+
+    def __init__(self, rng: Optional[random.Random] = None, history = None):
+        """ Finished hands are passed to record method of given history e.g.
+        tcp_ip_poker.history.HistoryWriter.
+        """
+        self._deck = Deck(rng)
+        self._history = history
+        self._events: List[GameEvent] = []
+        self._actions: List[Tuple[int, Action]] = []
+        self._strength = 0
+        self._table: List[Card] = []
+        self._table_mask = 0
+        self._discard_pile: List[Card] = []
+        self._players: List[Player] = []
+        self._moves: List[Tuple[Player, Card]] = []
         self._active = False
         self._players_turn: Union[Player, None] = None
-        self._players_turn_handled: Sequence[Player] = []
+        self._players_turn_handled: List[Player] = []
+        self._folded: List[Player] = []
+        self._strengths: Dict[Player, int] = {}
         self._current_turn = 0
         self._played = 0
         self._npcs = 0
@@ -389,15 +716,40 @@ class TexasHoldem:
     def players_turn(self) -> Player:
         return self._players_turn
 
+    @property
+    def folded(self) -> Sequence[Player]:
+        """ Returns a view of players who have folded """
+        return SequenceView(self._folded)
+
     @property
     def players(self) -> Sequence[Player]:
-        """ Returns an copy of current players """
-        return copy.copy(self._players)
+        """ Returns a view of current players """
+        return SequenceView(self._players)
 
     @property
     def table(self) -> Sequence[Card]:
-        """ Returns an copy of current tables cards """
-        return copy.copy(self._table)
+        """ Returns a view of current tables cards """
+        return SequenceView(self._table)
+
+    @property
+    def table_set(self) -> CardSet:
+        """ Returns current tables cards as a card set """
+        return CardSet(self._table_mask)
+
+    @property
+    def actions(self) -> Sequence[Tuple[int, Action]]:
+        """ Returns a view of the seats and actions taken in order """
+        return SequenceView(self._actions)
+
+    @property
+    def events(self) -> Sequence[GameEvent]:
+        """ Returns a view of the events of the hand so far """
+        return SequenceView(self._events)
+
+    @property
+    def strength(self) -> int:
+        """ Returns the evaluator strength of the winning hand or 0 if it was not shown """
+        return self._strength
 
     # --- Public methods ---
 
@@ -408,19 +760,28 @@ class TexasHoldem:
             raise Exception('Poker game requires atleast 2 playeres')
         if self._played > 0:
             pass # change leader
-        self._active = True
-        self._deck.shuffle(3)
-        self._handle_next_turn()
+        self._deck.shuffle()
+        self._emit(self._STARTS[len(self._players)])
+        self._deal_street()
 
     def check(self, player: Player):
         if self._players_turn == player:
-            self._rotate_player(player)            
+            event = self._CHECKS[self._players.index(player)]
+            self._apply_check(event)
+            self._events.append(event)
+            if self._players_turn is None:
+                self._deal_street()
         else:
             raise Exception(f'Not {player}s turn')
 
     def fold(self, player: Player):
+        """ Player gives up the game. If only one player is left that player wins """
         if self._players_turn == player:
-            pass
+            self._emit(self._FOLDS[self._players.index(player)])
+            if not self._active:
+                self._record()
+            elif self._players_turn is None:
+                self._deal_street()
         else:
             raise Exception(f'Not {player}s turn')
 
@@ -443,6 +804,155 @@ class TexasHoldem:
         self._players.append(player)
         return player
 
+    def hand_strength(self, player: Player) -> int:
+        """ Returns the evaluator strength of the best hand of the players cards and the
+        table cards so far. Evaluated once per street, later calls are a lookup.
+        """
+        strength = self._strengths.get(player)
+        if strength is None:
+            if player not in self._players or not player.hand:
+                raise Exception(f'{player} has no cards')
+            strength = self._strengths[player] = evaluator.evaluate_mask(player.hand_set.mask | self._table_mask)
+        return strength
+
+    def rank_players(self) -> Sequence[Sequence[Player]]:
+        """ Returns the players who have not folded ordered by their current hands from
+        best to worst. Players with equal hands are grouped together so the first group
+        holds the winners and later groups give the order for splitting side pots.
+        """
+        players = [player for player in self._players if player not in self._folded]
+        strengths = [self.hand_strength(player) for player in players]
+        return [[players[idx] for idx in group] for group in evaluator.rank(strengths)]
+
+    def current_combination(self, player: Player) -> VictoryCombination:
+        """ Returns the combination the player currently holds with the table cards """
+        return VictoryCombination.from_strength(self.hand_strength(player))
+
+    @classmethod
+    def replay(
+            cls,
+            events: Iterable[GameEvent],
+            players: Sequence[Union[Player, str]],
+            rescore: bool = False
+        ) -> TexasHoldem:
+        """ Returns the game given events lead to with given players, or hosts, seated in
+        order. The hands of given players are replaced. With rescore the showdown is
+        evaluated again instead of taken from the events, e.g. after the evaluator has
+        changed, and the events of the game have the new result. Raises ValueError if
+        the events are not a valid hand.
+        """
+        game = cls()
+        for player in players:
+            game.add_player(player)
+        for player in game._players:
+            player.discard_cards()
+        appliers = cls._APPLIERS
+        append = game._events.append
+        try:
+            for event in events:
+                if event[0] == _SHOWDOWN and rescore:
+                    event = game._showdown()
+                appliers[event[0]](game, event)
+                append(event)
+        except (IndexError, KeyError, TypeError) as e:
+            raise ValueError('Invalid game events') from e
+        game._resume_deck()
+        return game
+
+    @classmethod
+    def from_hand(
+            cls,
+            players: Sequence[Union[Player, str]],
+            holes: Sequence[Sequence[int]],
+            board: Sequence[int],
+            actions: Sequence[Tuple[int, Action]],
+            winners: Sequence[int] = (),
+            strength: int = 0
+        ) -> TexasHoldem:
+        """ Returns the game played with given hole and board card ids and actions, e.g.
+        of a tcp_ip_poker.history.HandRecord, by replaying the events they imply. Streets
+        are dealt when every player has acted and winner seats and strength are the
+        result of the showdown if one is reached.
+        """
+        game = cls()
+        for player in players:
+            game.add_player(player)
+        for player in game._players:
+            player.discard_cards()
+        game._replay_hand(holes, board, actions, winners, strength)
+        game._resume_deck()
+        return game
+
+    def snapshot(self) -> bytes:
+        """ Returns the complete state of the game. Fixes the order of the cards left in
+        the deck (see Deck.snapshot).
+        """
+        players = self._players
+        seats = {player: seat for seat, player in enumerate(players)}
+        holes = bytearray([_NO_CARD] * (2 * self.MAXIMUM_PLAYERS))
+        for seat, player in enumerate(players):
+            hand = player._hand
+            holes[2 * seat:2 * seat + len(hand)] = bytes(map(_card_id, hand))
+        if self._winner is None:
+            winners = ()
+        else:
+            winners = self._winner if self._tie else (self._winner,)
+        return self.SNAPSHOT.pack(
+            self.SNAPSHOT_VERSION,
+            self._active | self._tie << 1,
+            len(players),
+            self._current_turn,
+            _NO_CARD if self._players_turn is None else seats[self._players_turn],
+            sum(1 << seats[player] for player in self._players_turn_handled),
+            self._npcs,
+            len(self._actions),
+            bytes(seat << 1 | action for seat, action in self._actions),
+            sum(1 << seats[player] for player in winners),
+            self._strength,
+            bytes(holes),
+            bytes(map(_card_id, self._table)).ljust(5, bytes((_NO_CARD,)))
+        ) + self._deck.snapshot()
+
+    @classmethod
+    def restore(
+            cls,
+            data: bytes,
+            players: Sequence[Union[Player, str]],
+            rng: Optional[random.Random] = None,
+            history = None
+        ) -> TexasHoldem:
+        """ Returns the game of a snapshot with given players, or hosts, seated in the
+        order of the snapshot. The hands of given players are replaced.
+        """
+        if len(data) != cls.SNAPSHOT_SIZE:
+            raise ValueError('Invalid game snapshot')
+        (version, flags, count, current_turn, turn, handled, npcs, action_count, actions,
+         winners, strength, holes, board) = cls.SNAPSHOT.unpack_from(data)
+        if version != cls.SNAPSHOT_VERSION:
+            raise ValueError('Unsupported game snapshot version')
+        if count != len(players):
+            raise ValueError(f'Snapshot has {count} players')
+        game = cls(rng, history)
+        game._deck.restore(data[cls.SNAPSHOT.size:])
+        for player in players:
+            game.add_player(player)
+        for player in game._players:
+            player.discard_cards()
+        game._replay_hand(
+            [[card_id for card_id in holes[2 * seat:2 * seat + 2] if card_id != _NO_CARD] for seat in range(count)],
+            [card_id for card_id in board if card_id != _NO_CARD],
+            [(action >> 1, Action(action & 1)) for action in actions[:action_count]],
+            [seat for seat in range(count) if winners >> seat & 1],
+            strength
+        )
+        seats = {player: seat for seat, player in enumerate(game._players)}
+        if (game._current_turn != current_turn or game._active != bool(flags & 1)
+                or turn != (_NO_CARD if game._players_turn is None else seats[game._players_turn])
+                or handled != sum(1 << seats[player] for player in game._players_turn_handled)):
+            raise ValueError('Inconsistent game snapshot')
+        game._npcs = npcs
+        return game
+
     def get_result(self) -> Tuple[bool, bool]:
         """ Return the result of previosly played game if it has finished.
         Raises exception if game still active.
@@ -453,149 +963,157 @@ class TexasHoldem:
 
     # --- Private methods ---
 
-    def _rotate_player(self, player: Player):
-        self._players_turn_handled.append(player)
-        if len(self._players_turn_handled) == len(self._players):
-            self._players_turn_handled.clear()
-            self._handle_next_turn()
-        else:
-            self._players_turn = self._players[(self._players.index(player) + 1) % len(self._players)]
+    def _emit(self, event: GameEvent):
+        self._APPLIERS[event[0]](self, event)
+        self._events.append(event)
 
-    def _handle_next_turn(self):
+    def _deal_street(self):
+        """ Deals the next street once every player has acted, or shows down after the river """
         if self._current_turn == 0:
-            self._serve_cards_to_players(2)
-            self._serve_cards_to_table(3)
-        elif self._current_turn == 1:
-            self._serve_cards_to_table(1)
-        elif self._current_turn == 2:
-            self._serve_cards_to_table(1)
+            # Hole cards go round the table a card at a time, then the flop
+            count = len(self._players)
+            hole_cards = self.HOLE_CARDS * count
+            dealt = bytes(map(_card_id, self._deck.get_cards(hole_cards + 3)))
+            for seat in range(count):
+                self._emit(_event((_DEAL, seat, dealt[seat:hole_cards:count], 0)))
+            self._emit(_event((_BOARD, 0, dealt[hole_cards:], 0)))
+        elif self._current_turn < 3:
+            self._emit(_event((_BOARD, 0, bytes((self._deck.get_cards(1)[0]._id,)), 0)))
         else:
             self._handle_winner()
-        self._players_turn = self._players[0]
-        self._current_turn += 1
-
-    def _serve_cards_to_players(self, count: int):
-        for _ in range(count):
-            for player in self._players:
-                player.pick_card(self._deck.get_card())
-
-    def _serve_cards_to_table(self, count: int):
-        for card in self._deck.get_cards(count):
-            self._table.append(card)
 
     def _handle_winner(self):
-        self._active = False
-        player_combinations = [(VictoryCombination.determine_best_combination(player.hand + self._table), player) for player in self._players]
-        currently_winning = None
-        contesting_winners = []
-        for idx, player_combination in enumerate(player_combinations):
-            if idx == 0:
-                currently_winning = player_combination
-                continue
-            comparison = VictoryCombination.compare_combinations(currently_winning[0][0], player_combination[0][0])
-            if comparison == 1:
-                contesting_winners.clear()
-            elif comparison == 0:
-                player_combination, player = player_combination
-                player_combination, player_hand = player_combination
-                winning_combination, winning_player = currently_winning
-                winning_combination, winning_hand = winning_combination
-                player_dupes = VictoryCombination.duplicate_value_cards(player_hand)
-                win_dupes = VictoryCombination.duplicate_value_cards(winning_hand)
-                if player_combination == VictoryCombination.HIGH_CARD:
-                    player_sum = max(c.value for c in player_hand)
-                    win_sum = max(c.value for c in winning_hand)
-                elif player_combination in [VictoryCombination.PAIR, VictoryCombination.TWO_PAIRS]:
-                    player_cards = []
-                    for card_value in player_dupes:
-                        if len(player_dupes[card_value]) == 2:
-                            for card in player_dupes[card_value]:
-                                player_cards.append(card)
-                    win_cards = []
-                    for card_value in win_dupes:
-                        if len(win_dupes[card_value]) == 2:
-                            for card in win_dupes[card_value]:
-                                win_cards.append(card)
-                    player_sum = 0
-                    for card in player_cards:
-                        player_sum += card.value
-                    win_sum = 0
-                    for card in win_cards:
-                        win_sum += card.value
-                elif player_combination in [VictoryCombination.THREE_OF_A_KIND, VictoryCombination.FOUR_OF_A_KIND]:
-                    player_kinds = [player_dupes[card_value] for card_value in player_dupes if len(player_dupes[card_value]) in [3, 4]]
-                    win_kinds = [win_dupes[card_value] for card_value in win_dupes if len(win_dupes[card_value]) in [3, 4]]
-                    player_sum = sum([item.value for sublist in player_kinds for item in sublist])
-                    win_sum = sum([item.value for sublist in win_kinds for item in sublist])
+        self._emit(self._showdown())
+        self._record()
+
+    def _showdown(self) -> GameEvent:
+        winners = self.rank_players()[0]
+        seats = sum(1 << self._players.index(player) for player in winners)
+        return _event((_SHOWDOWN, seats, b'', self.hand_strength(winners[0])))
+
+    def _replay_hand(self, holes, board, actions, winners, strength):
+        if not any(holes):
+            if board or actions:
+                raise ValueError('Invalid hand')
+            return
+        board = bytes(board)
+        winners = sum(1 << seat for seat in winners)
+        emit = self._emit
+        emit(self._STARTS[len(self._players)])
+        for seat, hole in enumerate(holes):
+            emit(_event((_DEAL, seat, bytes(hole), 0)))
+        dealt = 3
+        emit(_event((_BOARD, 0, board[:dealt], 0)))
+        for seat, action in actions:
+            if not self._active:
+                raise ValueError('Invalid hand')
+            emit((self._FOLDS if action == Action.FOLD else self._CHECKS)[seat])
+            if self._players_turn is None:
+                if self._current_turn < 3:
+                    emit(_event((_BOARD, 0, board[dealt:dealt + 1], 0)))
+                    dealt += 1
                 else:
-                    player_sum = sum([c.value for c in player_hand])
-                    win_sum = sum([c.value for c in winning_hand])
-                if player_sum > win_sum:
-                    currently_winning = ((player_combination, player.hand), player)
-                    contesting_winners.clear()
-                elif player_sum == win_sum:
-                    contesting_winners.append(((player_combination, player_hand), player))
-            else:
-                currently_winning = player_combination
-                contesting_winners.clear()
-
-        if len(contesting_winners) > 0:
-            self._winner = [currently_winning[1]] + [contestant[1] for contestant in contesting_winners]
-            self._tie = True
-        else:
-            self._winner = currently_winning[1]
-            self._tie = False
+                    emit(_event((_SHOWDOWN, winners, b'', strength)))
+        if dealt != len(board):
+            raise ValueError('Invalid hand')
+
+    def _resume_deck(self):
+        """ Leaves the cards not dealt shuffled in the deck so a replayed hand can go on """
+        if not self._active:
+            return
+        dealt = self._table_mask
+        for player in self._players:
+            dealt |= player._hand_mask
+        card_ids = sorted(range(Deck.MAX_DECK_SIZE), key=lambda card_id: dealt >> card_id & 1)
+        self._deck.restore(Deck.SNAPSHOT.pack(1, Deck.MAX_DECK_SIZE - bin(dealt).count('1'), bytes(card_ids)))
+
+    def _apply_start(self, event: GameEvent):
+        if self._events or event[1] != len(self._players):
+            raise ValueError('Invalid start event')
+        self._active = True
 
-            
-            """
-            combination, player = player_combination
-            combination, player_hand = combination
-            if idx == 0:
-                currently_winning = player, combination, player_hand
-                continue
-            win_player, win_comb, win_hand = currently_winning
-            comparison = VictoryCombination.compare_combinations(combination, win_comb)
-            if comparison == 1:
-                currently_winning = player, combination, player_hand                
-            elif comparison == 0:
-                player_dupes = VictoryCombination.duplicate_value_cards(player_hand)
-                win_dupes = VictoryCombination.duplicate_value_cards(win_hand)
-                if combination == VictoryCombination.HIGH_CARD:
-                    player_sum = max(c.value for c in player_hand)
-                    win_sum = max(c.value for c in win_hand)
-                elif combination in [VictoryCombination.PAIR, VictoryCombination.TWO_PAIRS]:
-                    player_cards = []
-                    for card_value in player_dupes:
-                        if len(player_dupes[card_value]) == 2:
-                            for card in player_dupes[card_value]:
-                                player_cards.append(card)
-                    win_cards = []
-                    for card_value in win_dupes:
-                        if len(win_dupes[card_value]) == 2:
-                            for card in win_dupes[card_value]:
-                                win_cards.append(card)
-                    player_sum = 0
-                    for card in player_cards:
-                        player_sum += card.value
-                    win_sum = 0
-                    for card in win_cards:
-                        win_sum += card.value
-                elif combination in [VictoryCombination.THREE_OF_A_KIND, VictoryCombination.FOUR_OF_A_KIND]:
-                    player_kinds = [player_dupes[card_value] for card_value in player_dupes if len(player_dupes[card_value]) in [3, 4]]
-                    win_kinds = [win_dupes[card_value] for card_value in win_dupes if len(win_dupes[card_value]) in [3, 4]]
-                    player_sum = sum([item.value for sublist in player_kinds for item in sublist])
-                    win_sum = sum([item.value for sublist in win_kinds for item in sublist])
-                else:
-                    player_sum = sum([c.value for c in player_hand])
-                    win_sum = sum([c.value for c in win_hand])
-                if player_sum > win_sum:
-                    currently_winning = player, combination, player_hand
-                elif player_sum == win_sum:
-                    winning.append(player)
-        if len(winning) > 1:
-            self._winner = winning
-            self._tie = True
+    def _apply_deal(self, event: GameEvent):
+        player = self._players[event[1]]
+        if player._hand or len(event[2]) != 2 or not self._active or self._current_turn:
+            raise ValueError(f'Invalid deal to seat {event[1]}')
+        first, second = event[2]
+        player._hand = [_CARDS[first], _CARDS[second]]
+        player._hand_mask = 1 << first | 1 << second
+
+    def _apply_board(self, event: GameEvent):
+        if not self._active or self._players_turn is not None or self._current_turn > 2:
+            raise ValueError('Board dealt during a street')
+        if not self._current_turn and not all(player._hand for player in self._players):
+            raise ValueError('Board dealt before hole cards')
+        table = self._table
+        mask = self._table_mask
+        for card_id in event[2]:
+            table.append(_CARDS[card_id])
+            mask |= 1 << card_id
+        self._table_mask = mask
+        self._strengths.clear()
+        self._players_turn_handled.clear()
+        self._next_street()
+
+    def _apply_check(self, event: GameEvent):
+        seat = event[1]
+        if self._players[seat] is not self._players_turn:
+            raise ValueError(f'Check out of turn by seat {seat}')
+        self._actions.append((seat, Action.CHECK))
+        self._rotate_player(seat)
+
+    def _apply_fold(self, event: GameEvent):
+        seat = event[1]
+        player = self._players[seat]
+        if player is not self._players_turn:
+            raise ValueError(f'Fold out of turn by seat {seat}')
+        self._actions.append((seat, Action.FOLD))
+        folded = self._folded
+        folded.append(player)
+        if len(folded) == len(self._players) - 1:
+            self._active = False
+            self._winner = next(_player for _player in self._players if _player not in folded)
+            self._tie = False
         else:
-            self._winner = winning[-1]
-            """
+            self._rotate_player(seat)
+
+    def _apply_showdown(self, event: GameEvent):
+        if not self._active or self._players_turn is not None or self._current_turn != 3:
+            raise ValueError('Showdown before the river is over')
+        winners = [player for seat, player in enumerate(self._players) if event[1] >> seat & 1]
+        if not winners:
+            raise ValueError('Showdown without winners')
+        self._active = False
+        self._strength = event[3]
+        self._tie = len(winners) > 1
+        self._winner = winners if self._tie else winners[0]
+        self._players_turn_handled.clear()
+        self._next_street()
+
+    _APPLIERS = (_apply_start, _apply_deal, _apply_board, _apply_check, _apply_fold, _apply_showdown)
+
+    def _next_street(self):
+        folded = self._folded
+        for player in self._players:
+            if player not in folded:
+                self._players_turn = player
+                break
+        self._current_turn += 1
 
+    def _rotate_player(self, seat: int):
+        """ Passes the turn on from seat, or to no one when every player has acted this street """
+        players = self._players
+        handled = self._players_turn_handled
+        handled.append(players[seat])
+        folded = self._folded
+        count = len(players)
+        for idx in range(seat + 1, seat + count):
+            candidate = players[idx % count]
+            if candidate not in handled and candidate not in folded:
+                self._players_turn = candidate
+                return
+        self._players_turn = None
+
+    def _record(self):
+        if self._history is not None:
+            self._history.record(self)
@@ -0,0 +1,47 @@
+""" Ordered map of jobs over a process pool.
+
+The analyses that spread work over processes (equity, simulation and tournament)
+split it into numbered jobs whose results must be combined in job order to stay
+reproducible however many processes run them. run submits jobs ahead of the
+results being consumed, at most twice as many as there are workers, so every
+worker stays busy while only a few results are held in memory, and yields the
+results in job order.
+"""
+from __future__ import annotations
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, Optional
+import collections, os
+
+
+def run(
+        function: Callable,
+        jobs: Iterable[tuple],
+        processes: Optional[int] = None,
+        executor: Optional[Executor] = None
+    ) -> Iterator:
+    """ Yields the results of function for jobs in order keeping every worker busy.
+    Jobs run on given executor or on a new process pool of given size (all cores by
+    default). Processes 1 runs everything in the calling process. Closing the
+    iterator early cancels the jobs not started yet.
+    """
+    if executor is None and processes == 1:
+        for job in jobs:
+            yield function(*job)
+        return
+    own = executor is None
+    if own:
+        executor = ProcessPoolExecutor(processes or os.cpu_count())
+    window = 2 * (processes or os.cpu_count() or 1)
+    pending = collections.deque()
+    try:
+        for job in jobs:
+            pending.append(executor.submit(function, *job))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        if own:
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,379 @@
+""" Heads-up preflop equity of the 169 starting hand classes.
+
+Starting hands are grouped into 169 classes on a 13 x 13 grid where rows and
+columns go from ace down to two: the diagonal holds the pairs, above it the
+suited hands and below it the offsuit hands. The equity of every class against
+every other class is computed by exact enumeration of all boards for every hole
+card matchup, with matchups that only differ by a relabelling of suits counted
+once. Building requires NumPy and takes hours on one core so it is spread over a
+process pool:
+
+    python -m tcp_ip_poker.preflop [path]
+
+The path defaults to preflop.bin in tables.DIRECTORY next to the other pre-built
+tables, so every process of a machine finds the same file.
+Every finished class matchup is appended to a checkpoint file next to the table
+(path.partial) and a build that is interrupted continues from it when run again.
+The result is a small binary file of 16 bit fixed point equities which
+PreflopTable memory-maps read-only, so every process using the same file shares
+the same pages and a lookup is a single index into the mapping.
+
+Range is a weighted set of classes parsed from the usual notation, e.g.
+'QQ+, AKs, AQs:0.5, KQ'. PreflopTable.range_equity answers the equity of one range
+against another from the table alone, weighting every class matchup by the number
+of hole card combinations that do not share a card.
+"""
+from __future__ import annotations
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Callable, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+import itertools, mmap, os, pathlib, struct, sys
+
+from tcp_ip_poker import evaluator, tables
+from tcp_ip_poker.poker import Card
+
+CLASSES = evaluator.RANKS * evaluator.RANKS
+MAGIC = b'TPEQ'
+VERSION = 1
+HEADER = struct.Struct('<4sHH')
+SCALE = 0xFFFF
+DEFAULT_PATH = tables.DIRECTORY / 'preflop.bin'
+CHECKPOINT = struct.Struct('<BBH')
+CHECKPOINT_INTERVAL = 64
+
+_SUITS = 4
+_boards = None
+_class_indexes: Dict[str, int] = {}
+_compatible: Dict[Tuple[int, int], int] = {}
+
+
+def hand_class(cards: Sequence[Card]) -> int:
+    """ Returns the class index of given two hole cards """
+    if len(cards) != 2:
+        raise ValueError('Hand class requires 2 cards')
+    first, second = sorted((card.id % evaluator.RANKS for card in cards), reverse=True)
+    row = evaluator.RANKS - 1 - first
+    column = evaluator.RANKS - 1 - second
+    if cards[0].suit == cards[1].suit:
+        return row * evaluator.RANKS + column
+    return column * evaluator.RANKS + row
+
+
+def class_name(index: int) -> str:
+    """ Returns the common name of the class e.g. AA, AKs or 72o """
+    row, column = divmod(index, evaluator.RANKS)
+    high = Card.VALUES[evaluator.value_of_rank(evaluator.RANKS - 1 - min(row, column)) - 1][1]
+    low = Card.VALUES[evaluator.value_of_rank(evaluator.RANKS - 1 - max(row, column)) - 1][1]
+    high, low = high.replace('10', 'T'), low.replace('10', 'T')
+    if row == column:
+        return high + low
+    return high + low + ('s' if row < column else 'o')
+
+
+def class_index(name: str) -> int:
+    """ Returns the class index of a name e.g. AA, AKs, 72o or T9s """
+    if not _class_indexes:
+        _class_indexes.update((class_name(index), index) for index in range(CLASSES))
+    name = name.strip()
+    index = _class_indexes.get(name[:2].upper() + name[2:].lower())
+    if index is None:
+        raise ValueError(f'Invalid hand class {name!r}')
+    return index
+
+
+def class_combinations(index: int) -> Sequence[Tuple[int, int]]:
+    """ Returns the card id pairs of every hand in the class """
+    row, column = divmod(index, evaluator.RANKS)
+    high = evaluator.RANKS - 1 - min(row, column)
+    low = evaluator.RANKS - 1 - max(row, column)
+    if row == column:
+        return [(s1 * evaluator.RANKS + high, s2 * evaluator.RANKS + high)
+                for s1, s2 in itertools.combinations(range(_SUITS), 2)]
+    if row < column:
+        return [(s * evaluator.RANKS + high, s * evaluator.RANKS + low) for s in range(_SUITS)]
+    return [(s1 * evaluator.RANKS + high, s2 * evaluator.RANKS + low)
+            for s1, s2 in itertools.permutations(range(_SUITS), 2)]
+
+
+class Range:
+    """ Weighted set of starting hand classes. Given as a mapping from class index or
+    name to weight between 0 and 1 or as comma separated classes in the usual
+    notation: AA, AKs, AKo, AK (suited and offsuit), QQ+ (queens or better), ATs+ (AT
+    suited up to AK suited) each optionally followed by :weight.
+    """
+
+    def __init__(self, weights: Union[str, Mapping[Union[int, str], float], None] = None):
+        if isinstance(weights, str):
+            weights = _parse_range(weights)
+        self._weights = [0.0] * CLASSES
+        for index, weight in (weights or {}).items():
+            if not isinstance(index, int):
+                index = class_index(index)
+            if not 0 <= weight <= 1:
+                raise ValueError('Range weights must be between 0 and 1')
+            self._weights[index] = float(weight)
+
+    def __len__(self) -> int:
+        """ Returns the amount of classes in the range """
+        return sum(1 for weight in self._weights if weight)
+
+    def __contains__(self, index: Union[int, str]) -> bool:
+        return bool(self._weights[index if isinstance(index, int) else class_index(index)])
+
+    # --- Properties ---
+
+    @property
+    def weights(self) -> Tuple[float, ...]:
+        """ Returns the weight of every class by class index """
+        return tuple(self._weights)
+
+    @property
+    def classes(self) -> Sequence[int]:
+        return [index for index, weight in enumerate(self._weights) if weight]
+
+    @property
+    def combinations(self) -> float:
+        """ Returns the weighted amount of hole card combinations in the range """
+        return sum(weight * len(class_combinations(index)) for index, weight in enumerate(self._weights))
+
+
+class PreflopTable:
+    """ Read-only memory-mapped preflop equity table """
+
+    def __init__(self, path: Union[str, os.PathLike] = DEFAULT_PATH):
+        if sys.byteorder != 'little':
+            raise OSError('Preflop table requires a little endian host')
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, classes = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION or classes != CLASSES:
+            self._mmap.close()
+            raise ValueError('Invalid preflop table file')
+        if len(self._mmap) != HEADER.size + 2 * CLASSES * CLASSES:
+            self._mmap.close()
+            raise ValueError('Truncated preflop table file')
+        self._values = memoryview(self._mmap)[HEADER.size:].cast('H')
+
+    def __enter__(self) -> PreflopTable:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # --- Public methods ---
+
+    def equity(self, hero: Union[int, Sequence[Card]], villain: Union[int, Sequence[Card]]) -> float:
+        """ Returns the equity of hero class against villain class. Classes can be given
+        as indexes or as hole cards.
+        """
+        if not isinstance(hero, int):
+            hero = hand_class(hero)
+        if not isinstance(villain, int):
+            villain = hand_class(villain)
+        return self._values[hero * CLASSES + villain] / SCALE
+
+    def range_equity(self, hero: Range, villain: Range) -> float:
+        """ Returns the equity of hero range against villain range. Every class matchup
+        is weighted by the class weights and the hole card combinations of the two
+        classes that do not share a card.
+        """
+        values = self._values
+        villain_weights = [(index, weight) for index, weight in enumerate(villain.weights) if weight]
+        total = 0.0
+        weighted = 0.0
+        for hero_index, hero_weight in enumerate(hero.weights):
+            if not hero_weight:
+                continue
+            row = hero_index * CLASSES
+            for villain_index, villain_weight in villain_weights:
+                weight = hero_weight * villain_weight * _compatible_combinations(hero_index, villain_index)
+                total += weight
+                weighted += weight * values[row + villain_index]
+        if not total:
+            raise ValueError('Ranges have no compatible hands')
+        return weighted / total / SCALE
+
+    def close(self):
+        self._values.release()
+        self._mmap.close()
+
+
+def build(
+        path: Union[str, os.PathLike] = DEFAULT_PATH,
+        processes: Optional[int] = None,
+        executor: Optional[Executor] = None,
+        progress: Optional[Callable[[int, int], None]] = None
+    ):
+    """ Computes the full table by exact enumeration and writes it to given path.
+    Matchups are run on given executor or on a new process pool of given size and
+    every finished one is appended to the checkpoint file path.partial. A build
+    finding a checkpoint only computes the missing matchups. Progress is called with
+    the matchups done and the total every CHECKPOINT_INTERVAL matchups.
+    """
+    pairs = [(hero, villain) for hero in range(CLASSES) for villain in range(hero + 1, CLASSES)]
+    # A class against itself is even by symmetry
+    values = [round(SCALE / 2)] * (CLASSES * CLASSES)
+    checkpoint = f'{os.fspath(path)}.partial'
+    pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+    done = _read_checkpoint(checkpoint, values)
+    remaining = [pair for pair in pairs if pair not in done]
+    own = executor is None
+    if own:
+        executor = ProcessPoolExecutor(processes)
+    try:
+        with open(checkpoint, 'ab') as file:
+            # Drop a record cut short by an interrupted build
+            file.truncate(len(done) * CHECKPOINT.size)
+            count = len(done)
+            for (hero, villain), result in zip(remaining, executor.map(_class_equity, remaining, chunksize=8)):
+                value = round(result * SCALE)
+                values[hero * CLASSES + villain] = value
+                values[villain * CLASSES + hero] = SCALE - value
+                file.write(CHECKPOINT.pack(hero, villain, value))
+                count += 1
+                if count % CHECKPOINT_INTERVAL == 0:
+                    file.flush()
+                    if progress is not None:
+                        progress(count, len(pairs))
+    finally:
+        if own:
+            executor.shutdown(cancel_futures=True)
+    write(path, values)
+    os.remove(checkpoint)
+
+
+def write(path: Union[str, os.PathLike], values: Sequence[int]):
+    """ Writes given fixed point values atomically as a table file """
+    if len(values) != CLASSES * CLASSES:
+        raise ValueError('Invalid amount of values')
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    try:
+        with open(temporary, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, VERSION, CLASSES))
+            file.write(struct.pack(f'<{len(values)}H', *values))
+        os.replace(temporary, path)
+    finally:
+        if temporary.exists():
+            temporary.unlink()
+
+
+def matchup_equity(hero: Tuple[int, int], villain: Tuple[int, int]) -> float:
+    """ Returns the exact equity of hero hole card ids against villain hole card ids over
+    every possible board.
+    """
+    import numpy as np
+    from tcp_ip_poker import batch
+
+    dead = set(hero) | set(villain)
+    live = np.array([card_id for card_id in range(_SUITS * evaluator.RANKS) if card_id not in dead],
+                    dtype=np.int8)
+    hands = np.empty((len(_board_indexes()), evaluator.MAX_CARDS), dtype=np.int8)
+    hands[:, 2:] = live[_board_indexes()]
+    hands[:, :2] = hero
+    own = batch.evaluate_batch(hands)
+    hands[:, :2] = villain
+    other = batch.evaluate_batch(hands)
+    wins = int((own > other).sum())
+    ties = int((own == other).sum())
+    return (wins + ties / 2) / len(hands)
+
+# --- Private functions ---
+
+def _board_indexes():
+    """ Returns every five card combination of the 48 live cards as index rows """
+    global _boards
+    if _boards is None:
+        import numpy as np
+        live = _SUITS * evaluator.RANKS - 4
+        _boards = np.array(list(itertools.combinations(range(live), 5)), dtype=np.int8)
+    return _boards
+
+
+def _read_checkpoint(path: str, values: List[int]) -> Dict[Tuple[int, int], int]:
+    """ Fills values from a checkpoint file and returns the matchups in it """
+    done: Dict[Tuple[int, int], int] = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, 'rb') as file:
+        data = file.read()
+    for hero, villain, value in CHECKPOINT.iter_unpack(data[:len(data) - len(data) % CHECKPOINT.size]):
+        values[hero * CLASSES + villain] = value
+        values[villain * CLASSES + hero] = SCALE - value
+        done[hero, villain] = value
+    return done
+
+
+def _parse_range(text: str) -> Dict[int, float]:
+    ranks = [class_name(index * evaluator.RANKS + index)[0] for index in range(evaluator.RANKS)]
+    weights: Dict[int, float] = {}
+    for part in text.split(','):
+        name, _, weight = part.strip().partition(':')
+        if not name:
+            continue
+        try:
+            weight = float(weight) if weight else 1.0
+        except ValueError:
+            raise ValueError(f'Invalid weight in {part.strip()!r}') from None
+        plus = name.endswith('+')
+        name = name.rstrip('+')
+        if len(name) == 2 and name[0].upper() != name[1].upper():
+            # Suited and offsuit
+            names = [name + 's', name + 'o']
+        else:
+            names = [name]
+        for name in names:
+            index = class_index(name)
+            row, column = divmod(index, evaluator.RANKS)
+            if not plus:
+                weights[index] = weight
+            elif row == column:
+                for rank in range(row + 1):
+                    weights[rank * evaluator.RANKS + rank] = weight
+            else:
+                high, low = min(row, column), max(row, column)
+                for kicker in range(high + 1, low + 1):
+                    weights[class_index(ranks[high] + ranks[kicker] + name[2:])] = weight
+    return weights
+
+
+def _compatible_combinations(hero: int, villain: int) -> int:
+    """ Returns the amount of hole card combination pairs of two classes without a
+    shared card.
+    """
+    key = (hero, villain) if hero <= villain else (villain, hero)
+    count = _compatible.get(key)
+    if count is None:
+        masks = [1 << first | 1 << second for first, second in class_combinations(villain)]
+        count = _compatible[key] = sum(1 for first, second in class_combinations(hero)
+                                       for mask in masks if not mask & (1 << first | 1 << second))
+    return count
+
+
+def _permute(card_ids: Sequence[int], permutation: Sequence[int]) -> Tuple[int, ...]:
+    return tuple(sorted(permutation[card_id // evaluator.RANKS] * evaluator.RANKS
+                        + card_id % evaluator.RANKS for card_id in card_ids))
+
+
+def _class_equity(pair: Tuple[int, int]) -> float:
+    """ Returns the equity of hero class against villain class. One hero hand stands for
+    the whole class and villain hands that are the same up to a suit relabelling which
+    keeps the hero hand are enumerated once and weighted.
+    """
+    hero_class, villain_class = pair
+    hero = class_combinations(hero_class)[0]
+    keeping = [permutation for permutation in itertools.permutations(range(_SUITS))
+               if _permute(hero, permutation) == tuple(sorted(hero))]
+    weights: Dict[Tuple[int, ...], int] = {}
+    for villain in class_combinations(villain_class):
+        if set(villain) & set(hero):
+            continue
+        canonical = min(_permute(villain, permutation) for permutation in keeping)
+        weights[canonical] = weights.get(canonical, 0) + 1
+    total = sum(weights.values())
+    return sum(matchup_equity(hero, villain) * weight for villain, weight in weights.items()) / total
+
+
+if __name__ == '__main__':
+    build(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PATH,
+          progress=lambda done, total: print(f'{done}/{total}', end='\r', file=sys.stderr, flush=True))
@@ -0,0 +1,342 @@
+""" Binary wire protocol between clients and the game server.
+
+Every frame is a little endian 16 bit length followed by that many bytes: a one
+byte frame type and the body. Cards are single bytes holding Card.id and seats
+are single bytes holding the player's index at the table. A client starts with a
+HELLO frame carrying VERSION and the server answers with its own HELLO.
+
+    HELLO    version u8              both ways
+    JOIN     table u32 (0 = any)     client
+    START, CHECK, FOLD, LEAVE, QUIT  client, empty body
+    NPC                              client, empty body, seats an NPC player
+    WATCH    table u32               client, follow a table without a seat
+    OK       command u8, value u32   server reply e.g. joined table id
+    ERROR    utf-8 message           server reply
+    PLAYERS  count u8, (length u8, utf-8 host) * count
+    DEAL     seat u8, card * 2       only to the owner of the cards
+    BOARD    card * n                all board cards so far
+    TURN, CHECKED, FOLDED            seat u8
+    RESULT   tie u8, seat * n        winners
+
+Encoder appends frames to one buffer so everything produced for a client during
+one action is written with a single call. Decoder owns a fixed receive buffer
+that asyncio.BufferedProtocol reads into directly and yields frame bodies as
+memoryview slices of it, so a frame is never copied on the way in. Slices are
+valid until the next get_buffer call. Frames must fit in the receive buffer, 4 KB
+by default which is plenty for every frame above.
+
+TextEncoder produces the same events as lines of text for the line protocol of
+the server.
+"""
+from __future__ import annotations
+from typing import Iterator, Sequence, Tuple
+import enum, struct
+
+from tcp_ip_poker.poker import Card
+
+VERSION = 1
+HEADER = struct.Struct('<H')
+MAX_FRAME = 0xFFFF
+BUFFER_SIZE = 1 << 12
+
+_OK = struct.Struct('<BI')
+_JOIN = struct.Struct('<I')
+
+
+class FrameType(enum.IntEnum):
+    HELLO = 0x01
+    JOIN = 0x02
+    START = 0x03
+    CHECK = 0x04
+    FOLD = 0x05
+    LEAVE = 0x06
+    QUIT = 0x07
+    NPC = 0x08
+    WATCH = 0x09
+    OK = 0x40
+    ERROR = 0x41
+    PLAYERS = 0x42
+    DEAL = 0x43
+    BOARD = 0x44
+    TURN = 0x45
+    CHECKED = 0x46
+    FOLDED = 0x47
+    RESULT = 0x48
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class Encoder:
+    """ Collects outgoing frames into one buffer """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    # --- Public methods ---
+
+    def frame(self, frame_type: int, body: bytes = b''):
+        if len(body) >= MAX_FRAME:
+            raise ProtocolError('Frame too large')
+        buffer = self._buffer
+        buffer += HEADER.pack(len(body) + 1)
+        buffer.append(frame_type)
+        buffer += body
+
+    def flush(self) -> bytes:
+        """ Returns the collected frames and empties the buffer """
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+    def hello(self, version: int = VERSION):
+        self.frame(FrameType.HELLO, bytes((version,)))
+
+    def join(self, table: int = 0):
+        self.frame(FrameType.JOIN, _JOIN.pack(table))
+
+    def watch(self, table: int):
+        self.frame(FrameType.WATCH, _JOIN.pack(table))
+
+    def command(self, frame_type: int):
+        """ Appends a command frame without body e.g. CHECK """
+        self.frame(frame_type)
+
+    def ok(self, command: int, value: int = 0):
+        self.frame(FrameType.OK, _OK.pack(command, value))
+
+    def error(self, message: str):
+        self.frame(FrameType.ERROR, message.encode()[:MAX_FRAME - 1])
+
+    def players(self, hosts: Sequence[str]):
+        body = bytearray((len(hosts),))
+        for host in hosts:
+            encoded = host.encode()[:0xFF]
+            body.append(len(encoded))
+            body += encoded
+        self.frame(FrameType.PLAYERS, body)
+
+    def deal(self, seat: int, cards: Sequence[Card]):
+        self.frame(FrameType.DEAL, bytes((seat, *(card.id for card in cards))))
+
+    def board(self, cards: Sequence[Card]):
+        self.frame(FrameType.BOARD, bytes(card.id for card in cards))
+
+    def turn(self, seat: int):
+        self.frame(FrameType.TURN, bytes((seat,)))
+
+    def checked(self, seat: int):
+        self.frame(FrameType.CHECKED, bytes((seat,)))
+
+    def folded(self, seat: int):
+        self.frame(FrameType.FOLDED, bytes((seat,)))
+
+    def result(self, tie: bool, seats: Sequence[int]):
+        self.frame(FrameType.RESULT, bytes((int(tie), *seats)))
+
+
+class TextEncoder:
+    """ Same events as Encoder as lines of text. Seats are shown as the hosts of the
+    last players event.
+    """
+
+    def __init__(self):
+        self._lines = []
+        self._hosts: Sequence[str] = []
+
+    def __len__(self) -> int:
+        return len(self._lines)
+
+    # --- Public methods ---
+
+    def flush(self) -> bytes:
+        data = ''.join(line + '\n' for line in self._lines).encode()
+        self._lines.clear()
+        return data
+
+    def hello(self, version: int = VERSION):
+        self._lines.append(f'HELLO {version}')
+
+    def ok(self, command: int, value: int = 0):
+        name = FrameType(command).name
+        self._lines.append(f'OK {name} {value}' if command in (FrameType.JOIN, FrameType.WATCH) else f'OK {name}')
+
+    def error(self, message: str):
+        self._lines.append(f'ERROR {message}')
+
+    def players(self, hosts: Sequence[str]):
+        self._hosts = list(hosts)
+        self._lines.append('PLAYERS ' + ','.join(hosts))
+
+    def deal(self, seat: int, cards: Sequence[Card]):
+        self._lines.append('HAND ' + ''.join(str(card) for card in cards))
+
+    def board(self, cards: Sequence[Card]):
+        self._lines.append('TABLE ' + ''.join(str(card) for card in cards))
+
+    def turn(self, seat: int):
+        self._lines.append(f'TURN {self._hosts[seat]}')
+
+    def checked(self, seat: int):
+        self._lines.append(f'CHECK {self._hosts[seat]}')
+
+    def folded(self, seat: int):
+        self._lines.append(f'FOLD {self._hosts[seat]}')
+
+    def result(self, tie: bool, seats: Sequence[int]):
+        hosts = ','.join(self._hosts[seat] for seat in seats)
+        self._lines.append(('RESULT TIE ' if tie else 'RESULT WIN ') + hosts)
+
+    def stats(self, table_counts: Sequence[int]):
+        """ Table counts of the workers behind a lobby """
+        self._lines.append('STATS ' + ','.join(f'{idx}:{count}' for idx, count in enumerate(table_counts)))
+
+
+class Decoder:
+    """ Fixed receive buffer that frames or lines are parsed from in place. Use
+    get_buffer and buffer_updated from asyncio.BufferedProtocol or feed.
+    """
+
+    def __init__(self, size: int = BUFFER_SIZE):
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+
+    def __len__(self) -> int:
+        """ Returns the amount of received bytes not parsed yet """
+        return self._end - self._start
+
+    # --- Public methods ---
+
+    def get_buffer(self, sizehint: int = -1) -> memoryview:
+        """ Returns the free part of the buffer. Unparsed bytes are moved to the front
+        first so previously yielded slices are no longer valid.
+        """
+        if self._start:
+            pending = self._end - self._start
+            self._buffer[:pending] = bytes(self._view[self._start:self._end])
+            self._start, self._end = 0, pending
+        if self._end == len(self._buffer):
+            raise ProtocolError('Receive buffer full')
+        return self._view[self._end:]
+
+    def buffer_updated(self, nbytes: int):
+        self._end += nbytes
+
+    def feed(self, data: bytes):
+        """ Copies given bytes into the buffer """
+        data = memoryview(data)
+        while data:
+            buffer = self.get_buffer()
+            amount = min(len(buffer), len(data))
+            buffer[:amount] = data[:amount]
+            self.buffer_updated(amount)
+            data = data[amount:]
+
+    def pending(self) -> memoryview:
+        """ Returns the received bytes not parsed yet """
+        return self._view[self._start:self._end]
+
+    def peek(self) -> int:
+        """ Returns the first unparsed byte or -1 """
+        return self._buffer[self._start] if self._end > self._start else -1
+
+    def frames(self) -> Iterator[Tuple[int, memoryview]]:
+        """ Yields type and body of every complete frame received """
+        view = self._view
+        while self._end - self._start >= HEADER.size:
+            length, = HEADER.unpack_from(view, self._start)
+            if length == 0:
+                raise ProtocolError('Empty frame')
+            begin = self._start + HEADER.size
+            if self._end - begin < length:
+                if begin + length > len(self._buffer) and self._start == 0:
+                    raise ProtocolError('Frame larger than receive buffer')
+                break
+            self._start = begin + length
+            yield view[begin], view[begin + 1:begin + length]
+
+    def lines(self, limit: int = 0xFF) -> Iterator[memoryview]:
+        """ Yields every complete newline terminated line received without the newline """
+        while self._end > self._start:
+            newline = self._buffer.find(b'\n', self._start, self._end)
+            if newline < 0:
+                if self._end - self._start > limit:
+                    raise ProtocolError('Line too long')
+                break
+            line = self._view[self._start:newline]
+            self._start = newline + 1
+            yield line
+
+
+# --- Body decoding ---
+# A body of the wrong size raises ProtocolError so a malformed frame closes the
+# connection like any other protocol violation.
+
+def decode_hello(body: memoryview) -> int:
+    _expect_size(body, 1)
+    return body[0]
+
+
+def decode_join(body: memoryview) -> int:
+    if not len(body):
+        return 0
+    _expect_size(body, _JOIN.size)
+    return _JOIN.unpack_from(body)[0]
+
+
+def decode_ok(body: memoryview) -> Tuple[int, int]:
+    _expect_size(body, _OK.size)
+    return _OK.unpack_from(body)
+
+
+def decode_error(body: memoryview) -> str:
+    return str(body, 'utf-8', 'replace')
+
+
+def decode_players(body: memoryview) -> Sequence[str]:
+    hosts = []
+    offset = 1
+    try:
+        for _ in range(body[0]):
+            length = body[offset]
+            if offset + 1 + length > len(body):
+                raise IndexError
+            hosts.append(str(body[offset + 1:offset + 1 + length], 'utf-8', 'replace'))
+            offset += 1 + length
+    except IndexError:
+        raise ProtocolError('Truncated PLAYERS frame') from None
+    return hosts
+
+
+def decode_cards(body: memoryview) -> Sequence[Card]:
+    if len(body) and max(body) >= Card.IDS:
+        raise ProtocolError('Invalid card id')
+    return [Card.from_id(card_id) for card_id in body]
+
+
+def decode_deal(body: memoryview) -> Tuple[int, Sequence[Card]]:
+    _expect_size(body, 3)
+    return body[0], decode_cards(body[1:])
+
+
+def decode_seat(body: memoryview) -> int:
+    _expect_size(body, 1)
+    return body[0]
+
+
+def decode_result(body: memoryview) -> Tuple[bool, Sequence[int]]:
+    if not len(body):
+        raise ProtocolError('Empty RESULT frame')
+    return bool(body[0]), list(body[1:])
+
+# --- Private functions ---
+
+def _expect_size(body: memoryview, size: int):
+    if len(body) != size:
+        raise ProtocolError(f'Frame body of {len(body)} bytes, expected {size}')
@@ -0,0 +1,593 @@
+""" asyncio TCP server hosting many TexasHoldem tables in one process.
+
+Every connection becomes a Player whose host is the peer address and port. The
+server speaks the binary protocol of tcp_ip_poker.protocol and, for debugging
+with a plain terminal, a line based text protocol. Binary clients start with a
+HELLO frame so the first byte received decides the protocol. Text commands are:
+
+    JOIN [table]   join given table or the first table with a free seat
+    START          start a hand on the joined table (needs 2 players)
+    CHECK          check on your turn
+    FOLD           fold on your turn
+    NPC            seat an NPC player at the joined table
+    WATCH table    follow given table without a seat (see tcp_ip_poker.spectator)
+    LEAVE          leave the joined or watched table
+    QUIT           close the connection
+
+Replies are 'OK ...' or 'ERROR <message>'. Table events are sent to every player
+at the table: PLAYERS, HAND (only to its owner), TABLE, TURN, CHECK, FOLD and
+RESULT. A table starts a hand by itself once it is full. Watchers of a table get
+the same events but HAND, collected and sent once per tick.
+
+NPC players stay at their table until every human has left. Their actions are
+decided by the NPCEngine of the server, shared by every table, on its process pool
+within its time budget, so seating many NPCs does not delay human players.
+
+Commands are handled directly on the event loop. Engine actions, showdown
+included, are table lookups that take microseconds so they never hold up the
+I/O of other tables. Events for a connection are collected and written once per
+loop iteration without waiting and a client whose buffer grows past
+MAX_WRITE_BUFFER is disconnected, so slow clients can not stall a table.
+"""
+from __future__ import annotations
+from typing import Dict, Iterator, List, Optional, Sequence, Union
+import argparse, asyncio, itertools, logging
+
+from tcp_ip_poker import protocol
+from tcp_ip_poker.history import HistoryWriter
+from tcp_ip_poker.npc import NPCEngine
+from tcp_ip_poker.poker import Action, Player, TexasHoldem
+from tcp_ip_poker.protocol import FrameType
+from tcp_ip_poker.spectator import Spectators
+
+DEFAULT_HOST = '0.0.0.0'
+DEFAULT_PORT = 7777
+METRICS_HOST = '127.0.0.1'
+BACKLOG = 4096
+MAX_LINE = 256
+MAX_WRITE_BUFFER = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+_TEXT_COMMANDS = {
+    'JOIN': FrameType.JOIN,
+    'START': FrameType.START,
+    'CHECK': FrameType.CHECK,
+    'FOLD': FrameType.FOLD,
+    'NPC': FrameType.NPC,
+    'WATCH': FrameType.WATCH,
+    'LEAVE': FrameType.LEAVE,
+    'QUIT': FrameType.QUIT
+}
+
+
+class Connection(asyncio.BufferedProtocol):
+    """ Client connection and the player it controls. Incoming bytes are read straight
+    into the decoder buffer.
+    """
+
+    def __init__(self, server: Server):
+        self._server = server
+        self._transport: Optional[asyncio.Transport] = None
+        self._decoder = protocol.Decoder()
+        self._binary: Optional[bool] = None
+        self._player: Optional[Player] = None
+        self._flush_scheduled = False
+        self.encoder: Union[protocol.Encoder, protocol.TextEncoder, None] = None
+        self.table: Optional[Table] = None
+        self.watching: Optional[Table] = None
+
+    # --- Properties ---
+
+    @property
+    def player(self) -> Player:
+        return self._player
+
+    @property
+    def closed(self) -> bool:
+        return self._transport is None or self._transport.is_closing()
+
+    @property
+    def binary(self) -> bool:
+        return bool(self._binary)
+
+    @property
+    def buffered(self) -> int:
+        """ Returns the amount of bytes written but not sent to the client yet """
+        return 0 if self._transport is None else self._transport.get_write_buffer_size()
+
+    # --- asyncio.BufferedProtocol ---
+
+    def connection_made(self, transport: asyncio.Transport):
+        self._transport = transport
+        host, port = transport.get_extra_info('peername')[:2]
+        self._player = Player(f'{host}:{port}')
+        self._server.connected(self)
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        return self._decoder.get_buffer(sizehint)
+
+    def buffer_updated(self, nbytes: int):
+        self._decoder.buffer_updated(nbytes)
+        if self._binary is None:
+            self.set_binary(self._decoder.peek() < 0x20)
+        self._receive()
+
+    def connection_lost(self, exc: Optional[Exception]):
+        self._server.disconnected(self)
+
+    # --- Public methods ---
+
+    def set_binary(self, binary: bool):
+        """ Selects the protocol of the connection """
+        self._binary = binary
+        self.encoder = protocol.Encoder() if binary else protocol.TextEncoder()
+
+    def feed(self, data: bytes):
+        """ Handles given bytes as if they were received e.g. when the connection was
+        accepted by another process.
+        """
+        self._decoder.feed(data)
+        self._receive()
+
+    def events(self) -> Union[protocol.Encoder, protocol.TextEncoder]:
+        """ Returns the encoder to add events to, they are written to the client once
+        the current loop iteration is done.
+        """
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self.flush)
+        return self.encoder
+
+    def flush(self):
+        """ Writes the collected events to the client. Disconnects the client if it does
+        not keep up with reading.
+        """
+        self._flush_scheduled = False
+        if self.closed or self.encoder is None or not len(self.encoder):
+            return
+        self._transport.write(self.encoder.flush())
+        if self._transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+            logger.info('Dropping slow client %s', self._player.host)
+            self.close()
+
+    def write(self, data: bytes):
+        """ Writes encoded events as they are e.g. a buffer shared by many clients """
+        if not self.closed:
+            self._transport.write(data)
+
+    def close(self):
+        if self._transport is not None:
+            self._transport.close()
+
+    # --- Private methods ---
+
+    def _receive(self):
+        try:
+            if self._binary:
+                self._receive_frames()
+            else:
+                self._receive_lines()
+        except protocol.ProtocolError as e:
+            logger.info('Protocol error from %s: %s', self._player.host, e)
+            self.close()
+        self.flush()
+
+    def _receive_frames(self):
+        for frame_type, body in self._decoder.frames():
+            if self._player is None or self.closed:
+                return
+            if frame_type == FrameType.HELLO:
+                if protocol.decode_hello(body) != protocol.VERSION:
+                    self.encoder.error('Unsupported protocol version')
+                    self.flush()
+                    self.close()
+                    return
+                self.encoder.hello()
+            else:
+                argument = protocol.decode_join(body) if frame_type in (FrameType.JOIN, FrameType.WATCH) else None
+                self._command(frame_type, argument or None)
+
+    def _receive_lines(self):
+        for line in self._decoder.lines(MAX_LINE):
+            if self.closed:
+                return
+            command, _, argument = str(line, 'utf-8', 'replace').strip().partition(' ')
+            command = _TEXT_COMMANDS.get(command.upper())
+            if command is None:
+                self.encoder.error('Unknown command')
+                continue
+            try:
+                argument = int(argument) if argument.strip() else None
+            except ValueError:
+                self.encoder.error('Invalid table')
+                continue
+            self._command(command, argument)
+
+    def _command(self, command: int, argument: Optional[int]):
+        if command == FrameType.QUIT:
+            self.flush()
+            self.close()
+            return
+        try:
+            value = self._server.dispatch(self, command, argument)
+        except Exception as e:
+            self.encoder.error(str(e))
+        else:
+            self.encoder.ok(command, value or 0)
+
+
+class Table:
+    """ One seat group playing consecutive hands of TexasHoldem """
+
+    def __init__(self, table_id: int, history: Optional[HistoryWriter] = None, npc: Optional[NPCEngine] = None):
+        self._id = table_id
+        self._history = history
+        self._npc = npc
+        self._connections: Dict[Player, Connection] = {}
+        self._npcs: List[Player] = []
+        self._npc_ids = itertools.count()
+        self._npc_turn: Optional[asyncio.Task] = None
+        self._disconnected = set()
+        self._game = TexasHoldem(history=self if history else None)
+        self._spectators = Spectators(self._game)
+
+    # --- Properties ---
+
+    @property
+    def id(self) -> int:
+        return self._id
+
+    @property
+    def game(self) -> TexasHoldem:
+        return self._game
+
+    @property
+    def spectators(self) -> Spectators:
+        return self._spectators
+
+    @property
+    def full(self) -> bool:
+        return len(self._connections) + len(self._npcs) >= TexasHoldem.MAXIMUM_PLAYERS
+
+    @property
+    def empty(self) -> bool:
+        """ Returns True if no human player is at the table """
+        return not self._connections
+
+    # --- Public methods ---
+
+    def join(self, connection: Connection):
+        if self.full:
+            raise Exception('Table is full')
+        if self._game.active:
+            raise Exception('Hand is running')
+        self._game.add_player(connection.player)
+        self._connections[connection.player] = connection
+        connection.table = self
+        self._announce_players()
+        if self.full:
+            self.start()
+
+    def add_npc(self) -> Player:
+        """ Seats a new NPC player and returns it """
+        if self._npc is None:
+            raise Exception('NPC players are not available')
+        if self.full:
+            raise Exception('Table is full')
+        if self._game.active:
+            raise Exception('Hand is running')
+        player = self._game.add_player(Player(f'NPC{next(self._npc_ids)}'))
+        self._npcs.append(player)
+        self._announce_players()
+        if self.full:
+            self.start()
+        return player
+
+    def leave(self, connection: Connection):
+        """ Removes the connection from the table. A player in a running hand folds when
+        the turn comes.
+        """
+        connection.table = None
+        self._connections.pop(connection.player, None)
+        if self._game.active and connection.player in self._game.players:
+            self._disconnected.add(connection.player)
+            self._fold_disconnected()
+        elif not self._game.active:
+            self._new_game()
+            self._announce_players()
+
+    def start(self):
+        if len(self._game.players) < TexasHoldem.MINIMUM_PLAYERS:
+            raise Exception('Poker game requires atleast 2 players')
+        if self._game.active:
+            raise Exception('Hand is running')
+        self._game.start()
+        for seat, player in enumerate(self._game.players):
+            connection = self._connections.get(player)
+            if connection is not None:
+                connection.events().deal(seat, player.hand)
+        self._announce()
+
+    def check(self, connection: Connection):
+        self._act(connection.player, Action.CHECK)
+
+    def fold(self, connection: Connection):
+        self._act(connection.player, Action.FOLD)
+
+    def record(self, game: TexasHoldem):
+        """ Adds a finished hand of the table to the history """
+        self._history.record(game, self._id)
+
+    # --- Private methods ---
+
+    def _seat(self, player: Player) -> int:
+        return self._game.players.index(player)
+
+    def _new_game(self):
+        self._game = TexasHoldem(history=self if self._history else None)
+        self._spectators.follow(self._game)
+        self._disconnected.clear()
+        for player in [*self._connections, *self._npcs]:
+            player.discard_cards()
+            self._game.add_player(player)
+
+    def _act(self, player: Player, action: Action):
+        seat = self._seat(player)
+        if action == Action.CHECK:
+            self._game.check(player)
+            self._broadcast('checked', seat)
+        else:
+            self._game.fold(player)
+            self._broadcast('folded', seat)
+        self._after_action()
+
+    async def _play_npc(self, game: TexasHoldem, player: Player):
+        """ Decides and plays the turn of an NPC unless the hand moved on meanwhile """
+        try:
+            decision = await self._npc.decide_async(game, player)
+        except Exception:
+            logger.exception('NPC decision failed, checking')
+            decision = None
+        if game is not self._game or not game.active or game.players_turn is not player:
+            return
+        self._act(player, decision.action if decision else Action.CHECK)
+
+    def _after_action(self):
+        if self._fold_disconnected():
+            return
+        self._announce()
+
+    def _fold_disconnected(self) -> bool:
+        """ Folds disconnected players on their turn. Returns True if the hand ended """
+        while self._game.active and self._game.players_turn in self._disconnected:
+            player = self._game.players_turn
+            seat = self._seat(player)
+            self._game.fold(player)
+            self._broadcast('folded', seat)
+        if not self._game.active:
+            self._finish()
+            return True
+        return False
+
+    def _announce_players(self):
+        self._broadcast('players', [player.host for player in self._game.players])
+
+    def _announce(self):
+        if not self._game.active:
+            self._finish()
+            return
+        self._broadcast('board', self._game.table)
+        self._broadcast('turn', self._seat(self._game.players_turn))
+        if self._game.players_turn in self._npcs:
+            loop = asyncio.get_running_loop()
+            self._npc_turn = loop.create_task(self._play_npc(self._game, self._game.players_turn))
+
+    def _finish(self):
+        winner, tie = self._game.get_result()
+        winners = winner if tie else [winner]
+        self._broadcast('result', tie, [self._seat(player) for player in winners])
+        self._new_game()
+        self._announce_players()
+
+    def _broadcast(self, event: str, *args):
+        for connection in self._connections.values():
+            getattr(connection.events(), event)(*args)
+        self._spectators.changed()
+
+
+class Server:
+    """ Accepts clients and routes their commands to tables """
+
+    def __init__(
+            self,
+            table_ids: Optional[Iterator[int]] = None,
+            history: Optional[HistoryWriter] = None,
+            npc: Optional[NPCEngine] = None
+        ):
+        """ Finished hands are recorded to given history and NPC players are played by
+        given engine, by default one with its own process pool started on first use.
+        """
+        self._history = history
+        self._npc = npc or NPCEngine()
+        self._tables: Dict[int, Table] = {}
+        self._table_ids = table_ids or itertools.count(1)
+        self._connections = 0
+
+    # --- Properties ---
+
+    @property
+    def tables(self) -> Sequence[Table]:
+        return list(self._tables.values())
+
+    @property
+    def connections(self) -> int:
+        return self._connections
+
+    @property
+    def npc(self) -> NPCEngine:
+        return self._npc
+
+    # --- Public methods ---
+
+    async def serve(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> asyncio.AbstractServer:
+        """ Starts listening on given address and returns the asyncio server """
+        loop = asyncio.get_running_loop()
+        return await loop.create_server(lambda: Connection(self), host, port, backlog=BACKLOG)
+
+    def connected(self, connection: Connection):
+        self._connections += 1
+
+    def disconnected(self, connection: Connection):
+        self._connections -= 1
+        self._unwatch(connection)
+        self._leave(connection)
+
+    def adopt(self, connection: Connection, table_id: int) -> int:
+        """ Seats a connection handed over by a lobby at given table, creating it when
+        missing. If the table has no room the connection is seated elsewhere.
+        """
+        table = self._tables.get(table_id)
+        if table is None:
+            table = self._tables[table_id] = Table(table_id, self._history, self._npc)
+        elif table.full or table.game.active:
+            table = self._find_table(None)
+        table.join(connection)
+        return table.id
+
+    def watch(self, connection: Connection, table_id: Optional[int]) -> int:
+        """ Starts sending the events of given table to a connection without seating it """
+        if connection.table is not None:
+            raise Exception('Already at a table')
+        table = self._tables.get(table_id)
+        if table is None:
+            raise Exception('No such table')
+        self._unwatch(connection)
+        table.spectators.add(connection)
+        connection.watching = table
+        return table.id
+
+    def dispatch(self, connection: Connection, command: int, argument: Optional[int] = None) -> int:
+        """ Runs one client command and returns the value for the reply """
+        if command == FrameType.JOIN:
+            if connection.table is not None:
+                raise Exception('Already at a table')
+            table = self._find_table(argument)
+            table.join(connection)
+            self._unwatch(connection)
+            return table.id
+        if command == FrameType.WATCH:
+            return self.watch(connection, argument)
+        if command == FrameType.LEAVE and connection.watching is not None:
+            self._unwatch(connection)
+            return 0
+        table = connection.table
+        if command not in (FrameType.START, FrameType.CHECK, FrameType.FOLD, FrameType.NPC, FrameType.LEAVE):
+            raise Exception('Unknown command')
+        if table is None:
+            raise Exception('Not at a table')
+        if command == FrameType.START:
+            table.start()
+        elif command == FrameType.CHECK:
+            table.check(connection)
+        elif command == FrameType.FOLD:
+            table.fold(connection)
+        elif command == FrameType.NPC:
+            table.add_npc()
+        else:
+            self._leave(connection)
+        return 0
+
+    # --- Private methods ---
+
+    def _find_table(self, table_id: Optional[int]) -> Table:
+        if table_id is not None:
+            if table_id not in self._tables:
+                raise Exception('No such table')
+            return self._tables[table_id]
+        for table in self._tables.values():
+            if not table.full and not table.game.active:
+                return table
+        table = Table(next(self._table_ids), self._history, self._npc)
+        self._tables[table.id] = table
+        return table
+
+    def _leave(self, connection: Connection):
+        table = connection.table
+        if table is None:
+            return
+        table.leave(connection)
+        if table.empty:
+            del self._tables[table.id]
+            for watcher in table.spectators.close():
+                watcher.watching = None
+                watcher.events().error('Table closed')
+
+    def _unwatch(self, connection: Connection):
+        if connection.watching is not None:
+            connection.watching.spectators.remove(connection)
+            connection.watching = None
+
+
+def raise_file_limit():
+    """ Allows as many open sockets as the hard limit permits """
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+async def run(
+        host: str = DEFAULT_HOST,
+        port: int = DEFAULT_PORT,
+        history: Optional[str] = None,
+        metrics_port: Optional[int] = None,
+        metrics_host: str = METRICS_HOST
+    ):
+    """ Serves until cancelled. Metrics, which include profiling the game loop, are
+    served on their own host, the loopback interface unless given otherwise.
+    """
+    writer = HistoryWriter(history) if history else None
+    npc = NPCEngine()
+    server = await Server(history=writer, npc=npc).serve(host, port)
+    logger.info('Listening on %s', ', '.join(str(sock.getsockname()) for sock in server.sockets))
+    if metrics_port is not None:
+        from tcp_ip_poker import metrics
+        metrics_server = await metrics.serve(metrics_host, metrics_port)
+        logger.info('Metrics on %s', ', '.join(str(sock.getsockname()) for sock in metrics_server.sockets))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        npc.close()
+        if writer is not None:
+            writer.close()
+
+
+def main(args: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(prog='tcp_ip_poker', description='TCP/IP poker server')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, default=0,
+                        help='run a lobby that spreads tables over this many worker processes')
+    parser.add_argument('--history', help='append finished hands to this hand history log')
+    parser.add_argument('--metrics', type=int, metavar='PORT',
+                        help='collect metrics and serve them over HTTP on this port')
+    parser.add_argument('--metrics-host', default=METRICS_HOST,
+                        help=f'address to serve metrics on, default {METRICS_HOST}')
+    options = parser.parse_args(args)
+    if options.workers > 0 and options.metrics is not None:
+        parser.error('--metrics is not supported with --workers, metrics are collected per process')
+    logging.basicConfig(level=logging.INFO)
+    raise_file_limit()
+    try:
+        if options.workers > 0:
+            from tcp_ip_poker import lobby
+            asyncio.run(lobby.run(options.host, options.port, options.workers, options.history))
+        else:
+            asyncio.run(run(options.host, options.port, options.history, options.metrics, options.metrics_host))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,123 @@
+""" Headless simulation of complete hands between NPC players.
+
+Every player checks to showdown, so a hand is the deal of TexasHoldem (two hole
+cards to each player in turn, then the flop, turn and river) followed by the
+showdown. Instead of driving a TexasHoldem through add_player, start and check the
+hands are dealt from one reused Deck in a tight loop and evaluated straight from
+card masks. The cards dealt are the same a TexasHoldem would deal from the same
+deck.
+
+Hands are run in chunks spread over a process pool. Chunk n deals from its own
+random stream derived from the seed, so a seeded run gives the same hands however
+many processes run it. Results are yielded in hand order as they are completed
+and only a few chunks are held in memory at a time:
+
+    for result in simulation.hands(1000000, players=4, seed=1):
+        ...
+    simulation.write('hands.tsv', simulation.hands(1000000, seed=1))
+"""
+from __future__ import annotations
+from concurrent.futures import Executor
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
+import contextlib, math, os, random
+
+from tcp_ip_poker import evaluator, pool
+from tcp_ip_poker.poker import Card, Deck, TexasHoldem, VictoryCombination
+
+HOLE_CARDS = 2
+BOARD_CARDS = 5
+CHUNK_SIZE = 10000
+
+
+class HandResult(NamedTuple):
+    """ Result of one simulated hand. Cards are card ids and winners are seats """
+    hand: int
+    holes: Tuple[Tuple[int, int], ...]
+    board: Tuple[int, ...]
+    winners: Tuple[int, ...]
+    strength: int
+
+    @property
+    def tie(self) -> bool:
+        return len(self.winners) > 1
+
+    @property
+    def combination(self) -> VictoryCombination:
+        """ Returns the combination of the winning hand """
+        return VictoryCombination.from_strength(self.strength)
+
+
+def hands(
+        count: int,
+        players: int = TexasHoldem.MAXIMUM_PLAYERS,
+        seed: Optional[int] = None,
+        processes: Optional[int] = None,
+        executor: Optional[Executor] = None,
+        chunk_size: int = CHUNK_SIZE
+    ) -> Iterator[HandResult]:
+    """ Yields the results of given number of hands between given number of players.
+    Chunks are run on given executor or on a new process pool of given size (all cores
+    by default). Processes 1 runs everything in the calling process.
+    """
+    if not TexasHoldem.MINIMUM_PLAYERS <= players <= TexasHoldem.MAXIMUM_PLAYERS:
+        raise ValueError('Invalid amount of players')
+    if count < 0 or chunk_size < 1:
+        raise ValueError('Invalid amount of hands')
+    if seed is None:
+        seed = random.randrange(1 << 63)
+    chunks = math.ceil(count / chunk_size)
+    jobs = ((players, idx * chunk_size, min(chunk_size, count - idx * chunk_size), seed, idx)
+            for idx in range(chunks))
+    with contextlib.closing(pool.run(simulate, jobs, processes, executor)) as results:
+        for result in results:
+            yield from result
+
+
+def simulate(players: int, first: int, count: int, seed: int, stream: int) -> List[HandResult]:
+    """ Runs one chunk of hands numbered from first """
+    deck = Deck(random.Random(f'{seed}/{stream}'))
+    deck.shuffle()
+    evaluate = evaluator.evaluate_mask
+    dealt_cards = HOLE_CARDS * players + BOARD_CARDS
+    seats = range(players)
+    results = []
+    for hand in range(first, first + count):
+        deck.fill()
+        dealt = deck.get_cards(dealt_cards)
+        board = dealt[HOLE_CARDS * players:]
+        board_mask = 0
+        for card in board:
+            board_mask |= card.mask
+        holes = [(dealt[seat], dealt[players + seat]) for seat in seats]
+        strengths = [evaluate(board_mask | first_card.mask | second_card.mask)
+                     for first_card, second_card in holes]
+        best = max(strengths)
+        results.append(HandResult(
+            hand,
+            tuple((first_card.id, second_card.id) for first_card, second_card in holes),
+            tuple(card.id for card in board),
+            tuple(seat for seat in seats if strengths[seat] == best),
+            best
+        ))
+    return results
+
+
+def write(path: Union[str, os.PathLike], results: Iterable[HandResult]) -> int:
+    """ Writes results as tab separated lines of hand, hole cards, board, winning seats,
+    WIN or TIE and the combination as they are produced. Returns the amount of hands.
+    """
+    written = 0
+    with open(path, 'w', encoding='utf-8') as file:
+        for result in results:
+            holes = ' '.join(_cards(hole) for hole in result.holes)
+            winners = ','.join(str(seat) for seat in result.winners)
+            outcome = 'TIE' if result.tie else 'WIN'
+            file.write(f'{result.hand}\t{holes}\t{_cards(result.board)}\t{winners}\t{outcome}\t'
+                       f'{result.combination.name}\n')
+            written += 1
+    return written
+
+# --- Private functions ---
+
+def _cards(card_ids: Sequence[int]) -> str:
+    return ''.join(str(Card.from_id(card_id)) for card_id in card_ids)
@@ -0,0 +1,187 @@
+""" Spectators who follow a table without a seat.
+
+Watchers get the public events of a table, the same frames or lines as players
+except hole cards: PLAYERS, BOARD, TURN, CHECKED, FOLDED and RESULT. A popular
+table has hundreds of watchers, so changes are not encoded for each of them as
+they happen. Once per TICK Spectators reads the events the game appended since the
+previous tick (see TexasHoldem.events), encodes them once per protocol and writes
+the same buffer to every watcher. Changes within a tick are coalesced: checks and
+folds are sent in order, the board when it grows and the turn once at the end.
+
+Watchers are never waited for. One with more than RESYNC_BUFFER bytes not sent yet
+is skipped until it has read everything, then it gets a snapshot of the table
+(players, board, folded seats and turn) and follows the changes again. One that
+does not catch up within RESYNC_TIMEOUT is disconnected. Either way a slow watcher
+holds up neither the table nor the other watchers.
+"""
+from __future__ import annotations
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+import asyncio, logging, time
+
+from tcp_ip_poker import protocol
+from tcp_ip_poker.poker import EventType, TexasHoldem
+
+if TYPE_CHECKING:
+    from tcp_ip_poker.server import Connection
+
+TICK = 0.05
+RESYNC_BUFFER = 16 * 1024
+RESYNC_TIMEOUT = 5.0
+
+logger = logging.getLogger(__name__)
+
+
+class _Watcher:
+    __slots__ = ('synced', 'since')
+
+    def __init__(self):
+        self.synced = False
+        self.since = time.monotonic()
+
+
+class Spectators:
+    """ Watchers of one table and the changes of its game not sent to them yet """
+
+    def __init__(self, game: TexasHoldem, tick: float = TICK):
+        self._tick = tick
+        self._watchers: Dict[Connection, _Watcher] = {}
+        # Indexed by Connection.binary
+        self._encoders = (protocol.TextEncoder(), protocol.Encoder())
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._hosts: Tuple[str, ...] = ()
+        self._follow(game)
+
+    def __len__(self) -> int:
+        return len(self._watchers)
+
+    # --- Public methods ---
+
+    def add(self, connection: Connection):
+        """ Starts sending the table to connection, from a snapshot on the next tick """
+        self._watchers[connection] = _Watcher()
+        self.changed()
+
+    def remove(self, connection: Connection):
+        self._watchers.pop(connection, None)
+
+    def changed(self):
+        """ Sends the changes of the game on the next tick """
+        if self._timer is None and self._watchers:
+            self._timer = asyncio.get_running_loop().call_later(self._tick, self.tick)
+
+    def follow(self, game: TexasHoldem):
+        """ Switches to the next game of the table after collecting the end of the previous one """
+        self._collect()
+        self._follow(game)
+        self.changed()
+
+    def tick(self):
+        """ Sends the changes collected so far to every watcher that keeps up """
+        self._timer = None
+        self._collect()
+        game = self._game
+        if self._dirty and game.active:
+            seat = game.players.index(game.players_turn)
+            for encoder in self._encoders:
+                encoder.turn(seat)
+        self._dirty = False
+        diffs = tuple(encoder.flush() for encoder in self._encoders)
+        snapshots: List[Optional[bytes]] = [None, None]
+        now = time.monotonic()
+        behind = False
+        for connection, watcher in list(self._watchers.items()):
+            if connection.closed:
+                del self._watchers[connection]
+                continue
+            binary = connection.binary
+            if watcher.synced:
+                if connection.buffered > RESYNC_BUFFER:
+                    watcher.synced = False
+                    watcher.since = now
+                    behind = True
+                elif diffs[binary]:
+                    connection.write(diffs[binary])
+            elif not connection.buffered:
+                if snapshots[binary] is None:
+                    snapshots[binary] = self._snapshot(binary)
+                connection.write(snapshots[binary])
+                watcher.synced = True
+            elif now - watcher.since > RESYNC_TIMEOUT:
+                logger.info('Dropping slow spectator %s', connection.player.host)
+                del self._watchers[connection]
+                connection.close()
+            else:
+                behind = True
+        if behind:
+            self.changed()
+
+    def close(self) -> List[Connection]:
+        """ Stops sending to the watchers, e.g. when the table closes, and returns them """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        watchers = list(self._watchers)
+        self._watchers.clear()
+        return watchers
+
+    # --- Private methods ---
+
+    def _follow(self, game: TexasHoldem):
+        self._game = game
+        self._sent = 0
+        self._board = 0
+        self._finished = False
+        self._dirty = False
+
+    def _collect(self):
+        """ Encodes the changes of the game since the last call once for every protocol """
+        game = self._game
+        events = game.events
+        if not self._watchers:
+            # New watchers start from a snapshot, the players are encoded again for them
+            self._hosts = ()
+            self._sent = len(events)
+            self._board = len(game.table)
+            self._finished = bool(events) and not game.active
+            return
+        encoders = self._encoders
+        hosts = tuple(player.host for player in game.players)
+        if hosts != self._hosts:
+            self._hosts = hosts
+            for encoder in encoders:
+                encoder.players(hosts)
+            self._dirty = True
+        if len(events) == self._sent:
+            return
+        for event in events[self._sent:]:
+            if event.type == EventType.BOARD:
+                self._board += len(event.cards)
+                board = game.table[:self._board]
+                for encoder in encoders:
+                    encoder.board(board)
+            elif event.type == EventType.CHECK:
+                for encoder in encoders:
+                    encoder.checked(event.seat)
+            elif event.type == EventType.FOLD:
+                for encoder in encoders:
+                    encoder.folded(event.seat)
+        self._sent = len(events)
+        self._dirty = True
+        if not game.active and not self._finished:
+            self._finished = True
+            winner, tie = game.get_result()
+            seats = [game.players.index(player) for player in (winner if tie else [winner])]
+            for encoder in encoders:
+                encoder.result(tie, seats)
+
+    def _snapshot(self, binary: bool) -> bytes:
+        game = self._game
+        encoder = protocol.Encoder() if binary else protocol.TextEncoder()
+        players = game.players
+        encoder.players([player.host for player in players])
+        if game.active:
+            encoder.board(game.table)
+            for player in game.folded:
+                encoder.folded(players.index(player))
+            encoder.turn(players.index(game.players_turn))
+        return encoder.flush()
@@ -0,0 +1,135 @@
+""" Pre-built lookup tables in memory-mapped files.
+
+Building the evaluator tables takes most of a second and the batch evaluator
+tables a few more, too long to repeat in every worker process. A set of tables is
+built once and written to DIRECTORY/<name>.bin, after which processes map the file
+read-only: loading is opening a file, and every process using the tables shares
+the same pages instead of holding its own copy. A missing file or one written for
+another version of the tables is rebuilt on first use. To build every table ahead
+of time e.g. when installing:
+
+    python -m tcp_ip_poker.tables
+
+DIRECTORY is $TCP_IP_POKER_TABLES or tcp_ip_poker under the user cache directory.
+A file is a header, a directory of arrays and the arrays, each 8 byte aligned:
+
+    magic u8 * 4, format u16, arrays u16, version u32
+    (name u8 * 16, format u8, offset u64, length u64) * arrays
+
+where format is the struct format character of the items and length the amount
+of items, in native (little endian) byte order.
+"""
+from __future__ import annotations
+from typing import Callable, Dict, Mapping, Union
+import mmap, os, pathlib, struct, sys
+
+MAGIC = b'TPTB'
+FORMAT = 1
+HEADER = struct.Struct('<4sHHI')
+ENTRY = struct.Struct('<16sc7xQQ')
+ALIGNMENT = 8
+
+
+def _default_directory() -> pathlib.Path:
+    if os.environ.get('TCP_IP_POKER_TABLES'):
+        return pathlib.Path(os.environ['TCP_IP_POKER_TABLES'])
+    cache = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return pathlib.Path(cache) / 'tcp_ip_poker'
+
+
+DIRECTORY = _default_directory()
+
+
+def load(
+        name: str,
+        version: int,
+        build: Callable[[], Mapping[str, object]],
+        directory: Union[str, os.PathLike, None] = None
+    ) -> Dict[str, memoryview]:
+    """ Returns the arrays of the table set name as read-only memoryviews of its file.
+    When the file is missing or holds another version the arrays are built by build,
+    as objects supporting the buffer protocol e.g. array.array or NumPy arrays, and
+    written first. If the file can not be written the built arrays are returned.
+    """
+    path = pathlib.Path(directory or DIRECTORY) / f'{name}.bin'
+    if sys.byteorder == 'little':
+        try:
+            return _map(path, version)
+        except (OSError, ValueError):
+            pass
+    arrays = {key: memoryview(value) for key, value in build().items()}
+    if sys.byteorder == 'little':
+        try:
+            write(path, version, arrays)
+            return _map(path, version)
+        except OSError:
+            pass
+    return {key: value.toreadonly() for key, value in arrays.items()}
+
+
+def write(path: Union[str, os.PathLike], version: int, arrays: Mapping[str, object]):
+    """ Writes named arrays atomically as a table file """
+    path = pathlib.Path(path)
+    views = {key: memoryview(value) for key, value in arrays.items()}
+    for key, view in views.items():
+        if view.ndim != 1 or len(view.format) != 1 or len(key.encode()) > 16:
+            raise ValueError(f'Invalid table array {key!r}')
+    offset = _align(HEADER.size + ENTRY.size * len(views))
+    entries = []
+    for key, view in views.items():
+        entries.append(ENTRY.pack(key.encode(), view.format.encode(), offset, len(view)))
+        offset = _align(offset + view.nbytes)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    try:
+        with open(temporary, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, FORMAT, len(views), version))
+            file.write(b''.join(entries))
+            for view in views.values():
+                file.write(bytes(_align(file.tell()) - file.tell()))
+                file.write(view.cast('B'))
+        os.replace(temporary, path)
+    finally:
+        if temporary.exists():
+            temporary.unlink()
+
+
+def build_all():
+    """ Builds the table files of every evaluator that is available """
+    from tcp_ip_poker import evaluator
+    evaluator.rank_strengths()
+    try:
+        from tcp_ip_poker import batch
+    except ImportError:
+        return
+    batch.load_tables()
+
+# --- Private functions ---
+
+def _align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _map(path: pathlib.Path, version: int) -> Dict[str, memoryview]:
+    with open(path, 'rb') as file:
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(data)
+    try:
+        magic, file_format, count, file_version = HEADER.unpack_from(view)
+        if magic != MAGIC or file_format != FORMAT or file_version != version:
+            raise ValueError('Outdated table file')
+        arrays = {}
+        for idx in range(count):
+            key, item_format, offset, length = ENTRY.unpack_from(view, HEADER.size + idx * ENTRY.size)
+            item_format = item_format.decode()
+            end = offset + length * struct.calcsize(item_format)
+            if end > len(view):
+                raise ValueError('Truncated table file')
+            arrays[key.rstrip(b'\0').decode()] = view[offset:end].cast(item_format)
+        return arrays
+    except (struct.error, ValueError, TypeError) as e:
+        raise ValueError(f'Invalid table file {path}') from e
+
+
+if __name__ == '__main__':
+    build_all()
@@ -0,0 +1,311 @@
+""" Multi-table tournament played to the last entrant.
+
+Entrants are seated at random at as few tables of up to MAXIMUM_PLAYERS as they
+fit, and every table plays one hand per round. TexasHoldem has no betting, so a
+tournament hand is played for an ante: every seat pays it, or its whole stack
+when shorter, the hand is checked to showdown and the best hand takes the pot,
+with side pots for short stacks and ties split evenly. The ante doubles every
+LEVEL_ROUNDS rounds. An entrant left without chips busts, and entrants busting in
+the same round finish in order of the stacks they started the hand with.
+
+Between rounds the tables are kept within one player of each other with as few
+moves as possible. While the entrants left fit at one table fewer the smallest
+table is broken and its players moved one at a time to the smallest table left,
+then while the largest table has two players more than the smallest one player
+moves from the largest to the smallest. The smallest and largest tables come from
+two heaps of (players, table) that are pushed to whenever a table changes and
+whose stale entries are skipped when read, so a bust costs O(log tables) instead
+of a scan of every table.
+
+Hands are dealt like in simulation, straight from a Deck and evaluated from card
+masks, the cards a TexasHoldem would deal. A round is split into chunks of
+CHUNK_TABLES tables run on a process pool, chunk n of round r dealing from its
+own random stream, so a seeded tournament ends the same however many processes
+run it. Workers get the stacks of their tables and return them after the hand
+with the pots paid, leaving the coordinating process little more than storing
+them and seating the busts, so it keeps up with a large pool:
+
+    result = Tournament(10000, seed=1).run()
+    python -m tcp_ip_poker.tournament --entrants 10000 --seed 1
+"""
+from __future__ import annotations
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Dict, List, Mapping, NamedTuple, Optional, Sequence, Tuple, Union
+import argparse, contextlib, heapq, math, os, random, sys, time
+
+from tcp_ip_poker import evaluator, pool
+from tcp_ip_poker.poker import Deck, TexasHoldem
+
+STACK = 1000
+ANTE = 10
+LEVEL_ROUNDS = 10
+CHUNK_TABLES = 256
+
+
+class TournamentResult(NamedTuple):
+    """ Finishing order from the winner down and the work it took """
+    standings: Tuple[str, ...]
+    rounds: int
+    hands: int
+    moves: int
+    broken: int
+
+    @property
+    def winner(self) -> str:
+        return self.standings[0]
+
+
+class Tournament:
+    """ Entrants spread over tables, played a round at a time """
+
+    def __init__(
+            self,
+            entrants: Union[int, Sequence[str]],
+            stack: int = STACK,
+            ante: int = ANTE,
+            level_rounds: int = LEVEL_ROUNDS,
+            seed: Optional[int] = None
+        ):
+        names = [f'P{idx}' for idx in range(entrants)] if isinstance(entrants, int) else list(entrants)
+        if len(names) < TexasHoldem.MINIMUM_PLAYERS:
+            raise ValueError('Invalid amount of entrants')
+        if stack < 1 or ante < 1 or level_rounds < 1:
+            raise ValueError('Invalid stack or ante')
+        if seed is None:
+            seed = random.randrange(1 << 63)
+        self._names = names
+        self._ante = ante
+        self._level_rounds = level_rounds
+        self._seed = seed
+        self._round = 0
+        self._hands = 0
+        self._moves = 0
+        self._broken = 0
+        self._busted: List[int] = []
+        self._remaining = len(names)
+        # Table id to the entrants seated there and their stacks by seat
+        self._tables: Dict[int, List[int]] = {}
+        self._stacks: Dict[int, List[int]] = {}
+        self._smallest: List[Tuple[int, int]] = []
+        self._largest: List[Tuple[int, int]] = []
+        order = list(range(len(names)))
+        random.Random(seed).shuffle(order)
+        tables = math.ceil(len(names) / TexasHoldem.MAXIMUM_PLAYERS)
+        for table_id in range(tables):
+            self._tables[table_id] = order[table_id::tables]
+            self._stacks[table_id] = [stack] * len(self._tables[table_id])
+            self._push(table_id)
+
+    # --- Properties ---
+
+    @property
+    def finished(self) -> bool:
+        return self._remaining == 1
+
+    @property
+    def round(self) -> int:
+        return self._round
+
+    @property
+    def ante(self) -> int:
+        """ Returns the ante of the next round """
+        return self._ante << self._round // self._level_rounds
+
+    @property
+    def remaining(self) -> int:
+        return self._remaining
+
+    @property
+    def tables(self) -> Mapping[int, Sequence[str]]:
+        """ Returns the names seated at each table by table id """
+        names = self._names
+        return {table_id: [names[entrant] for entrant in seats] for table_id, seats in self._tables.items()}
+
+    @property
+    def chips(self) -> Mapping[str, int]:
+        """ Returns the stacks of the entrants still playing """
+        return {self._names[entrant]: stack for table_id, seats in self._tables.items()
+                for entrant, stack in zip(seats, self._stacks[table_id])}
+
+    # --- Public methods ---
+
+    def play_round(self, executor: Optional[Executor] = None) -> List[str]:
+        """ Plays a hand at every table, on given executor or in this process, then
+        balances the tables and returns the entrants who busted in order of elimination.
+        """
+        if self.finished:
+            raise Exception('Tournament is finished')
+        table_ids = list(self._tables)
+        chunks = [table_ids[idx:idx + CHUNK_TABLES] for idx in range(0, len(table_ids), CHUNK_TABLES)]
+        stacks = self._stacks
+        ante = self.ante
+        jobs = (([stacks[table_id] for table_id in chunk], ante, self._seed, self._round, idx)
+                for idx, chunk in enumerate(chunks))
+        # Stack at the start of the hand, entrant and table of those out of chips
+        busts: List[Tuple[int, int, int]] = []
+        results = pool.run(_play, jobs, None if executor is not None else 1, executor)
+        with contextlib.closing(results) as results:
+            for chunk, chunk_stacks in zip(chunks, results):
+                for table_id, after in zip(chunk, chunk_stacks):
+                    if 0 in after:
+                        before = stacks[table_id]
+                        seats = self._tables[table_id]
+                        busts.extend((before[seat], seats[seat], table_id)
+                                     for seat, stack in enumerate(after) if not stack)
+                    stacks[table_id] = after
+        self._round += 1
+        self._hands += len(table_ids)
+        busts.sort()
+        if busts:
+            self._remove(busts)
+            self._balance()
+        return [self._names[entrant] for _, entrant, _ in busts]
+
+    def run(self, processes: Optional[int] = None, executor: Optional[Executor] = None) -> TournamentResult:
+        """ Plays rounds until one entrant is left on given executor or on a new process
+        pool of given size (all cores by default). Processes 1 runs everything in the
+        calling process.
+        """
+        with contextlib.ExitStack() as stack:
+            if executor is None and processes != 1:
+                executor = stack.enter_context(ProcessPoolExecutor(processes or os.cpu_count()))
+            while not self.finished:
+                self.play_round(executor)
+        return self.result()
+
+    def result(self) -> TournamentResult:
+        """ Returns the standings so far, entrants still playing first by stack """
+        playing = sorted(((stack, entrant) for table_id, seats in self._tables.items()
+                          for entrant, stack in zip(seats, self._stacks[table_id])), key=lambda item: -item[0])
+        standings = tuple(self._names[entrant] for entrant in [entrant for _, entrant in playing] + self._busted[::-1])
+        return TournamentResult(standings, self._round, self._hands, self._moves, self._broken)
+
+    # --- Private methods ---
+
+    def _remove(self, busts: List[Tuple[int, int, int]]):
+        for _, entrant, table_id in busts:
+            seats = self._tables[table_id]
+            seat = seats.index(entrant)
+            del seats[seat]
+            del self._stacks[table_id][seat]
+            self._busted.append(entrant)
+        for table_id in {table_id for _, _, table_id in busts}:
+            self._push(table_id)
+        self._remaining -= len(busts)
+
+    def _balance(self):
+        """ Breaks tables the entrants no longer need and evens out the rest """
+        tables = self._tables
+        needed = math.ceil(self._remaining / TexasHoldem.MAXIMUM_PLAYERS)
+        while len(tables) > needed:
+            table_id = self._peek(self._smallest, 1)
+            seats = tables.pop(table_id)
+            stacks = self._stacks.pop(table_id)
+            self._broken += 1
+            for entrant, stack in zip(seats, stacks):
+                self._move(entrant, stack, self._peek(self._smallest, 1))
+        while True:
+            smallest = self._peek(self._smallest, 1)
+            largest = self._peek(self._largest, -1)
+            if len(tables[largest]) - len(tables[smallest]) <= 1:
+                break
+            self._move(tables[largest].pop(), self._stacks[largest].pop(), smallest)
+            self._push(largest)
+        if len(self._smallest) > 4 * len(tables):
+            self._smallest = [(len(seats), table_id) for table_id, seats in tables.items()]
+            self._largest = [(-len(seats), table_id) for table_id, seats in tables.items()]
+            heapq.heapify(self._smallest)
+            heapq.heapify(self._largest)
+
+    def _move(self, entrant: int, stack: int, table_id: int):
+        self._tables[table_id].append(entrant)
+        self._stacks[table_id].append(stack)
+        self._push(table_id)
+        self._moves += 1
+
+    def _push(self, table_id: int):
+        players = len(self._tables[table_id])
+        heapq.heappush(self._smallest, (players, table_id))
+        heapq.heappush(self._largest, (-players, table_id))
+
+    def _peek(self, heap: List[Tuple[int, int]], sign: int) -> int:
+        """ Returns the table on top of a heap after dropping entries of tables that
+        changed or were broken since they were pushed.
+        """
+        while True:
+            players, table_id = heap[0]
+            seats = self._tables.get(table_id)
+            if seats is not None and len(seats) == players * sign:
+                return table_id
+            heapq.heappop(heap)
+
+
+def main(args: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='tcp_ip_poker.tournament', description=__doc__.splitlines()[0])
+    parser.add_argument('--entrants', type=int, default=1000)
+    parser.add_argument('--stack', type=int, default=STACK)
+    parser.add_argument('--ante', type=int, default=ANTE, help='ante of the first level')
+    parser.add_argument('--level-rounds', type=int, default=LEVEL_ROUNDS, help='rounds before the ante doubles')
+    parser.add_argument('--processes', type=int, help='worker processes, default all cores')
+    parser.add_argument('--seed', type=int)
+    options = parser.parse_args(args)
+    tournament = Tournament(options.entrants, options.stack, options.ante, options.level_rounds, options.seed)
+    started = time.perf_counter()
+    result = tournament.run(options.processes)
+    seconds = time.perf_counter() - started
+    print(f'{result.winner} won {options.entrants} entrants after {result.rounds} rounds')
+    print(f'{result.hands} hands in {seconds:.1f} s, {result.hands / seconds:,.0f} hands/s')
+    print(f'{result.moves} moves, {result.broken} tables broken')
+    return 0
+
+# --- Private functions ---
+
+def _play(tables: Sequence[List[int]], ante: int, seed: int, round_no: int, chunk: int) -> List[List[int]]:
+    """ Plays a hand at each table of given stacks and returns the stacks after it """
+    deck = Deck(random.Random(f'{seed}/{round_no}/{chunk}'))
+    deck.shuffle()
+    evaluate = evaluator.evaluate_mask
+    hole_cards = TexasHoldem.HOLE_CARDS
+    results = []
+    for stacks in tables:
+        players = len(stacks)
+        deck.fill()
+        dealt = deck.get_cards(hole_cards * players + TexasHoldem.BOARD_CARDS)
+        board_mask = 0
+        for card in dealt[hole_cards * players:]:
+            board_mask |= card.mask
+        strengths = [evaluate(board_mask | dealt[seat].mask | dealt[players + seat].mask) for seat in range(players)]
+        results.append(_settle(stacks, strengths, ante))
+    return results
+
+
+def _settle(stacks: Sequence[int], strengths: Sequence[int], ante: int) -> List[int]:
+    """ Collects the antes of a table and returns the stacks after paying the pots to
+    the best hands.
+    """
+    paid = [stack if stack < ante else ante for stack in stacks]
+    after = [stack - amount for stack, amount in zip(stacks, paid)]
+    seats = range(len(stacks))
+    if min(paid) == ante:
+        _pay(after, strengths, seats, ante * len(stacks))
+        return after
+    # Side pots, one for every distinct amount paid
+    previous = 0
+    for level in sorted(set(paid)):
+        eligible = [seat for seat in seats if paid[seat] >= level]
+        _pay(after, strengths, eligible, (level - previous) * len(eligible))
+        previous = level
+    return after
+
+
+def _pay(stacks: List[int], strengths: Sequence[int], eligible: Sequence[int], pot: int):
+    best = max(strengths[seat] for seat in eligible)
+    winners = [seat for seat in eligible if strengths[seat] == best]
+    share, rest = divmod(pot, len(winners))
+    for seat in winners:
+        stacks[seat] += share
+    stacks[winners[0]] += rest
+
+
+if __name__ == '__main__':
+    sys.exit(main())
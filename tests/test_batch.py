@@ -0,0 +1,39 @@
+import random
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from tcp_ip_poker import Deck, VictoryCombination
+from tcp_ip_poker import evaluator
+from tcp_ip_poker.batch import categories, deal_orders, evaluate_batch, to_array
+
+def test_batch_matches_scalar():
+    random.seed(0)
+    hands = []
+    deck = Deck()
+    for _ in range(2000):
+        deck.fill()
+        deck.shuffle()
+        hands.append(deck.get_cards(7))
+    for size in (5, 6, 7):
+        sized = [hand[:size] for hand in hands]
+        strengths = evaluate_batch(to_array(sized))
+        assert list(strengths) == [evaluator.evaluate(hand) for hand in sized]
+        assert list(categories(strengths)) == [
+            VictoryCombination.determine_best_combination(hand)[0].value for hand in sized]
+
+def test_batch_validation():
+    with pytest.raises(ValueError):
+        evaluate_batch(np.zeros((3, 4), dtype=np.int8))
+    with pytest.raises(ValueError):
+        evaluate_batch(np.full((3, 7), 52, dtype=np.int8))
+    assert evaluate_batch(np.zeros((0, 7), dtype=np.int8)).shape == (0,)
+
+def test_deal_orders():
+    orders = deal_orders(1000, 9, live=range(40), rng=np.random.default_rng(0))
+    assert orders.shape == (1000, 9)
+    assert all(len(set(row)) == 9 for row in orders.tolist())
+    assert orders.min() >= 0 and orders.max() < 40
+    assert deal_orders(10).shape == (10, 52)
+    with pytest.raises(ValueError):
+        deal_orders(10, 53)
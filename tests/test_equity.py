@@ -0,0 +1,43 @@
+from concurrent.futures import ProcessPoolExecutor
+import pytest
+
+from tcp_ip_poker import Card, Suit
+from tcp_ip_poker.equity import equity
+from tcp_ip_poker.isomorphism import LRUCache
+
+def test_equity():
+    aces = [Card(Suit.SPADES, 1), Card(Suit.HEARTS, 1)]
+    result = equity(aces, opponents=1, margin=0.01, seed=1, processes=1)
+    assert 0.82 < result.equity < 0.89
+    assert result.win + result.tie + result.lose == pytest.approx(1)
+    assert result.margin <= 0.01
+
+    board = [Card(Suit.CLUBS, 1), Card(Suit.DIAMONDS, 1), Card(Suit.CLUBS, 5)]
+    assert equity(aces, board, opponents=3, max_samples=2000, processes=1).equity > 0.99
+
+    with pytest.raises(ValueError):
+        equity(aces[:1])
+    with pytest.raises(ValueError):
+        equity(aces, [aces[0]])
+
+def test_equity_reproducible():
+    hole = [Card(Suit.SPADES, 10), Card(Suit.SPADES, 11)]
+    board = [Card(Suit.SPADES, 2), Card(Suit.HEARTS, 9), Card(Suit.CLUBS, 13)]
+    local = equity(hole, board, opponents=2, max_samples=4000, batch_size=1000, seed=7, processes=1)
+    with ProcessPoolExecutor(2) as executor:
+        pooled = equity(hole, board, opponents=2, max_samples=4000, batch_size=1000, seed=7,
+                        executor=executor)
+    assert local == pooled
+
+def test_equity_cache():
+    cache = LRUCache(2)
+    spades = [Card(Suit.SPADES, 1), Card(Suit.SPADES, 13)]
+    hearts = [Card(Suit.HEARTS, 1), Card(Suit.HEARTS, 13)]
+    board = [Card(Suit.SPADES, 5), Card(Suit.CLUBS, 5), Card(Suit.HEARTS, 9)]
+    swapped = [Card(Suit.HEARTS, 5), Card(Suit.CLUBS, 5), Card(Suit.SPADES, 9)]
+    first = equity(spades, board, max_samples=500, seed=1, processes=1, cache=cache)
+    assert equity(hearts, swapped, max_samples=500, seed=1, processes=1, cache=cache) == first
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert equity(hearts, board, max_samples=500, seed=1, processes=1, cache=cache) != first
+    equity(spades, max_samples=500, seed=1, processes=1, cache=cache)
+    assert len(cache) == 2 and cache.misses == 3
@@ -0,0 +1,93 @@
+import itertools, os, random, subprocess, sys
+import pytest
+
+from tcp_ip_poker import Card, Deck, Suit, VictoryCombination
+from tcp_ip_poker import evaluator
+
+def test_kickers():
+    pair_king_kicker = [
+        Card(Suit.SPADES, 10),
+        Card(Suit.HEARTS, 10),
+        Card(Suit.SPADES, 13),
+        Card(Suit.SPADES, 4),
+        Card(Suit.HEARTS, 3)
+    ]
+    pair_queen_kicker = [
+        Card(Suit.CLUBS, 10),
+        Card(Suit.DIAMONDS, 10),
+        Card(Suit.CLUBS, 12),
+        Card(Suit.CLUBS, 4),
+        Card(Suit.DIAMONDS, 3)
+    ]
+    pair_ace_high = [
+        Card(Suit.SPADES, 1),
+        Card(Suit.HEARTS, 1),
+        Card(Suit.SPADES, 2),
+        Card(Suit.SPADES, 3),
+        Card(Suit.HEARTS, 4)
+    ]
+    assert evaluator.evaluate(pair_king_kicker) > evaluator.evaluate(pair_queen_kicker)
+    assert evaluator.evaluate(pair_ace_high) > evaluator.evaluate(pair_king_kicker)
+    suits_swapped = [Card(Suit.CLUBS if c.suit == Suit.SPADES else Suit.DIAMONDS, c.value)
+                     for c in pair_king_kicker]
+    assert evaluator.evaluate(pair_king_kicker) == evaluator.evaluate(suits_swapped)
+
+def test_ace_straights():
+    wheel = [
+        Card(Suit.SPADES, 1),
+        Card(Suit.HEARTS, 2),
+        Card(Suit.SPADES, 3),
+        Card(Suit.CLUBS, 4),
+        Card(Suit.HEARTS, 5)
+    ]
+    broadway = [
+        Card(Suit.SPADES, 10),
+        Card(Suit.HEARTS, 11),
+        Card(Suit.SPADES, 12),
+        Card(Suit.CLUBS, 13),
+        Card(Suit.HEARTS, 1)
+    ]
+    six_high = wheel[1:] + [Card(Suit.DIAMONDS, 6)]
+    assert VictoryCombination.determine_best_combination(wheel)[0] == VictoryCombination.STRAIGHT
+    assert VictoryCombination.determine_best_combination(broadway)[0] == VictoryCombination.STRAIGHT
+    assert evaluator.evaluate(wheel) < evaluator.evaluate(six_high) < evaluator.evaluate(broadway)
+
+def test_seven_cards_match_best_five():
+    random.seed(0)
+    for _ in range(200):
+        deck = Deck()
+        deck.shuffle()
+        for size in (5, 6, 7):
+            cards = deck.get_cards(size)
+            strength = evaluator.evaluate(cards)
+            assert strength == max(evaluator.evaluate(comb) for comb in itertools.combinations(cards, 5))
+            combination, best = VictoryCombination.determine_best_combination(cards)
+            assert len(best) == 5
+            assert evaluator.evaluate(best) == strength
+            assert combination.value == evaluator.category(strength)
+            deck.fill()
+            deck.shuffle()
+
+def test_hand_state():
+    rng = random.Random(1)
+    for _ in range(300):
+        cards = rng.sample(range(52), 7)
+        state = evaluator.HandState()
+        mask = 0
+        for card_id in cards:
+            mask |= 1 << card_id
+            assert state.add(card_id) == evaluator.evaluate_mask(mask)
+        assert len(state) == 7 and state.mask == mask
+        assert state.copy().strength == evaluator.HandState(mask).strength == state.strength
+        with pytest.raises(ValueError):
+            state.add(next(card_id for card_id in range(52) if card_id not in cards))
+    with pytest.raises(ValueError):
+        evaluator.HandState(1).add(0)
+
+def test_hand_state_first_use():
+    """ HandState loads the tables itself when it is the first use of the evaluator """
+    script = ('from tcp_ip_poker import evaluator; '
+              'print(evaluator.HandState(0b1111100000000).strength == evaluator.evaluate_mask(0b1111100000000))')
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    run = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, env=env)
+    assert run.stdout.split() == ['True'], run.stderr
@@ -0,0 +1,71 @@
+import asyncio, random, time
+
+from tcp_ip_poker import Action, TexasHoldem
+from tcp_ip_poker.history import HistoryReader, HistoryWriter
+
+def test_history(tmp_path):
+    path = tmp_path / 'hands.log'
+    rng = random.Random(0)
+    games = []
+    with HistoryWriter(path, batch_size=256) as writer:
+        for idx in range(30):
+            game = TexasHoldem(rng, history=writer)
+            game.add_player('A')
+            game.add_player(f'B{idx % 3}')
+            game.start()
+            if idx % 5 == 0:
+                game.fold(game.players_turn)
+            while game.active:
+                game.check(game.players_turn)
+            games.append(game)
+        assert len(writer) == 30
+
+    with HistoryReader(path) as reader:
+        assert len(reader) == 30
+        folded = reader[0]
+        assert folded.actions == ((0, Action.FOLD),) and folded.winners == (1,)
+        assert folded.combination is None and len(folded.board) == 3
+        record = reader[1]
+        game = games[1]
+        assert record.hosts == ('A', 'B1')
+        assert record.holes == tuple(tuple(card.id for card in player.hand) for player in game.players)
+        assert record.board == tuple(card.id for card in game.table)
+        assert len(record.actions) == 6 and record.strength == game.strength
+        assert record.replay().events == game.events and folded.replay().events == games[0].events
+        assert reader[-1].hand == 29
+        assert [record.hand for record in reader.hands_of('B2')] == list(range(29, -1, -3))
+        assert len(list(reader.hands_of('A'))) == 30
+        assert list(reader.hands_of('C')) == []
+
+    # Appending continues the hand numbers and the host chains
+    with HistoryWriter(path) as writer:
+        game = TexasHoldem(rng, history=writer)
+        game.add_player('C')
+        game.add_player('B2')
+        game.start()
+        while game.active:
+            game.check(game.players_turn)
+    with HistoryReader(path) as reader:
+        assert [record.hand for record in reader.hands_of('B2')][:3] == [30, 29, 26]
+        assert reader[30].hosts == ('C', 'B2')
+
+async def _quiet_hand(path):
+    writer = HistoryWriter(path, flush_interval=0.05)
+    game = TexasHoldem(random.Random(1), history=writer)
+    game.add_player('A')
+    game.add_player('B')
+    game.start()
+    game.fold(game.players_turn)
+    # Readable once the timer hands the lone record to the writer thread, without close
+    deadline = time.monotonic() + 5
+    while True:
+        await asyncio.sleep(0.05)
+        with HistoryReader(path) as reader:
+            if len(reader):
+                assert reader[0].hosts == ('A', 'B')
+                break
+        assert time.monotonic() < deadline
+    writer.close()
+
+def test_history_flush_interval(tmp_path):
+    asyncio.run(_quiet_hand(tmp_path / 'hands.log'))
@@ -0,0 +1,39 @@
+import itertools
+
+from tcp_ip_poker import Card, CardSet, Suit
+from tcp_ip_poker.isomorphism import (
+    LRUCache, canonical, canonical_masks, canonical_order, isomorphic, relabel, restore
+)
+
+def test_canonical():
+    hand = [Card(Suit.SPADES, 1), Card(Suit.HEARTS, 1), Card(Suit.SPADES, 9)]
+    suits = list(Suit)
+    forms = set()
+    for permutation in itertools.permutations(suits):
+        relabelled = [Card(permutation[suits.index(card.suit)], card.value) for card in hand]
+        forms.add(canonical(relabelled)[0])
+        assert isomorphic(hand, relabelled)
+    assert len(forms) == 1 and len(forms.pop()) == 3
+    assert not isomorphic(hand, [Card(Suit.SPADES, 1), Card(Suit.HEARTS, 1), Card(Suit.CLUBS, 9)])
+
+    # Hole cards and board are relabelled together
+    hole = CardSet([Card(Suit.SPADES, 1), Card(Suit.SPADES, 13)]).mask
+    flush_draw = CardSet([Card(Suit.SPADES, 2), Card(Suit.SPADES, 7), Card(Suit.HEARTS, 9)]).mask
+    no_draw = CardSet([Card(Suit.HEARTS, 2), Card(Suit.HEARTS, 7), Card(Suit.SPADES, 9)]).mask
+    assert canonical_masks(hole, flush_draw) != canonical_masks(hole, no_draw)
+    order = canonical_order(hole, no_draw)
+    assert tuple(relabel(mask, order) for mask in (hole, no_draw)) == canonical_masks(hole, no_draw)
+    assert restore(relabel(no_draw, order), order) == no_draw
+
+def test_lru_cache():
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert 'b' not in cache and 'a' in cache and len(cache) == 2
+    assert cache.get('b') is None
+    assert cache.get_or_compute('d', lambda: 4) == 4
+    assert (cache.hits, cache.misses) == (1, 2) and cache.hit_rate == 1 / 3
+    cache.clear()
+    assert len(cache) == 0 and cache.hits == 0
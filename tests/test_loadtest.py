@@ -0,0 +1,42 @@
+import asyncio, os, signal, subprocess, sys
+import pytest
+
+from tcp_ip_poker import loadtest
+from tcp_ip_poker.server import Server
+
+async def _load(options):
+    server = Server()
+    listener = await server.serve('127.0.0.1', 0)
+    port = listener.sockets[0].getsockname()[1]
+    try:
+        return await loadtest.run(options, '127.0.0.1', port)
+    finally:
+        listener.close()
+        await listener.wait_closed()
+
+def test_loadtest():
+    # Two full tables and one of three bots and an NPC
+    options = loadtest.Options(connections=11, think=0.001, duration=0.5, warmup=0.1)
+    report = asyncio.run(_load(options))
+    assert report['tables'] == 3 and report['errors'] == 0
+    assert report['actions'] > 0 and report['hands'] > 0
+    latency = report['latency']
+    assert 0 < latency['p50'] <= latency['p99'] <= latency['p999'] <= latency['max']
+    assert report['server_cpu'] is None
+    assert 'p99' in loadtest.text(report)
+
+def test_cpu_seconds():
+    """ CPU of processes below the direct children counts for the server """
+    if not os.path.exists('/proc/self/stat'):
+        pytest.skip('/proc is not available')
+    busy = ('import time\nend = time.process_time() + 0.3\nwhile time.process_time() < end: pass\n'
+            'print(flush=True)\ntime.sleep(10)')
+    spawn = 'import subprocess, sys\nsubprocess.run([sys.executable, "-c", {!r}])'
+    process = subprocess.Popen([sys.executable, '-c', spawn.format(spawn.format(busy))],
+                               stdout=subprocess.PIPE, start_new_session=True)
+    try:
+        process.stdout.readline()
+        assert loadtest._cpu_seconds(process.pid) >= 0.3
+    finally:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
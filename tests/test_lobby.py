@@ -0,0 +1,82 @@
+import asyncio, socket
+
+from tcp_ip_poker import lobby as lobby_module
+from tcp_ip_poker.lobby import Lobby
+from test_server import _Client
+
+async def _play():
+    lobby = Lobby(2)
+    listener = await lobby.serve('127.0.0.1', 0)
+    port = listener.sockets[0].getsockname()[1]
+    clients = [await _Client().connect(port) for _ in range(3)]
+    first, second, third = clients
+    await first.send('CHECK')
+    assert await first.expect('ERROR') == 'ERROR Not at a table'
+    await first.send('JOIN 5')
+    assert await first.expect('ERROR') == 'ERROR No such table'
+    # Commands received together with the join are handled by the worker
+    await first.send('JOIN\nSTART')
+    assert await first.expect('OK JOIN') == 'OK JOIN 1'
+    assert await first.expect('ERROR') == 'ERROR Poker game requires atleast 2 players'
+    await second.send('JOIN 1')
+    assert await second.expect('OK JOIN') == 'OK JOIN 1'
+    await second.send('START')
+    for _ in range(3):
+        await first.expect(f'TURN {first.host}')
+        await first.send('CHECK')
+        await second.expect(f'TURN {second.host}')
+        await second.send('CHECK')
+    await first.expect('RESULT')
+
+    # The running hand of table 1 is reported so a new table is opened on the other worker
+    await asyncio.sleep(0.2)
+    await third.send('JOIN')
+    assert await third.expect('OK JOIN') == 'OK JOIN 1'
+    await asyncio.sleep(0.2)
+    await first.send('START')
+    await first.expect('TURN')
+    await asyncio.sleep(0.2)
+    fourth = await _Client().connect(port)
+    await fourth.send('STATS')
+    assert await fourth.expect('STATS') == 'STATS 0:1,1:0'
+    await fourth.send('JOIN')
+    assert await fourth.expect('OK JOIN') == 'OK JOIN 2'
+    assert sorted(lobby.table_counts) == [1, 1]
+
+    # Spectators are handed to the worker of the table without taking a seat
+    watcher = await _Client().connect(port)
+    await watcher.send('WATCH')
+    assert await watcher.expect('ERROR') == 'ERROR No such table'
+    await watcher.send('WATCH 1')
+    assert await watcher.expect('OK') == 'OK WATCH 1'
+    assert await watcher.expect('PLAYERS') == f'PLAYERS {first.host},{second.host},{third.host}'
+    assert sorted(lobby.table_counts) == [1, 1]
+
+    for client in clients + [fourth, watcher]:
+        client.writer.close()
+    listener.close()
+    await listener.wait_closed()
+    lobby.close()
+
+def test_lobby():
+    asyncio.run(_play())
+
+def test_report_retried():
+    """ A report the lobby was too busy to take is not taken as sent """
+    worker, lobby = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    worker.setblocking(False)
+    try:
+        while True:
+            worker.send(bytes(64))
+    except BlockingIOError:
+        pass
+    assert not lobby_module._report(worker, 1, [(1, 2, False)])
+    lobby.setblocking(False)
+    try:
+        while True:
+            lobby.recv(lobby_module._MESSAGE_SIZE)
+    except BlockingIOError:
+        pass
+    assert lobby_module._report(worker, 1, [(1, 2, False)])
+    worker.close()
+    lobby.close()
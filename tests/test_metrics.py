@@ -0,0 +1,125 @@
+import asyncio, time
+import pytest
+
+from tcp_ip_poker import Deck, TexasHoldem, metrics
+from tcp_ip_poker.npc import NPCEngine
+from tcp_ip_poker import server
+from tcp_ip_poker.server import Server, Table
+
+from test_server import _Client
+
+def test_histogram():
+    values = metrics.Histogram()
+    assert values.quantile(0.5) == 0.0
+    for value in (0.5e-6, 3e-6, 3e-6, 1000.0):
+        values.observe(value)
+    assert values.count == 4 and values.sum == 1000.0 + 6.5e-6
+    assert values.quantile(0.5) == 4e-6
+    assert values.quantile(1) == float('inf')
+    assert sum(values.counts) == 4
+
+def test_enable_disable():
+    originals = (Deck.__dict__['shuffle'], TexasHoldem.__dict__['hand_strength'], Table.__dict__['_act'])
+    metrics.enable()
+    try:
+        metrics.reset()
+        game = TexasHoldem()
+        game.add_player(None)
+        game.add_player(None)
+        game.start()
+        while game.active:
+            game.check(game.players_turn)
+        stats = metrics.snapshot()['histograms']
+        assert stats['shuffle_seconds']['count'] == 1
+        assert stats['showdown_seconds']['count'] == 1
+        # One evaluation per player at the showdown, repeated calls are lookups
+        assert stats['hand_strength_seconds']['count'] == 2
+    finally:
+        metrics.disable()
+    assert (Deck.__dict__['shuffle'], TexasHoldem.__dict__['hand_strength'], Table.__dict__['_act']) == originals
+    Deck().shuffle()
+    assert metrics.snapshot()['histograms']['shuffle_seconds']['count'] == 1
+
+async def _fetch(port, path):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f'GET {path} HTTP/1.0\r\n\r\n'.encode())
+    response = await asyncio.wait_for(reader.read(), 5)
+    writer.close()
+    return response.decode()
+
+async def _play():
+    metrics.reset()
+    server = Server(npc=NPCEngine(processes=0))
+    listener = await server.serve('127.0.0.1', 0)
+    endpoint = await metrics.serve('127.0.0.1', 0)
+    port = endpoint.sockets[0].getsockname()[1]
+    client = await _Client().connect(listener.sockets[0].getsockname()[1])
+    await client.send('JOIN')
+    table_id = int((await client.expect('OK JOIN')).split()[-1])
+    profile = asyncio.ensure_future(_fetch(port, f'/profile?table={table_id}&seconds=0.5'))
+    await asyncio.sleep(0.1)
+    await client.send('NPC')
+    await client.send('START')
+    while True:
+        line = await client.expect('')
+        if line.startswith('HAND '):
+            dealt = time.monotonic()
+        if line.startswith('RESULT'):
+            break
+        if line == f'TURN {client.host}':
+            await client.send('CHECK')
+    assert 'cumulative' in await profile
+
+    stats = metrics.snapshot()
+    assert stats['tables'][table_id]['hands'] == 1
+    # The rate counts from the start of the first hand, which came before its deal
+    assert stats['tables'][table_id]['hands_per_second'] <= 1 / (time.monotonic() - dealt)
+    assert stats['histograms']['hand_strength_seconds']['count'] == 2
+    assert stats['histograms']['turn_seconds']['count'] >= 1
+    assert f'table {table_id}' in metrics.text()
+    response = await _fetch(port, '/metrics')
+    assert response.startswith('HTTP/1.0 200 OK')
+    assert f'tcp_ip_poker_table_hands_total{{table="{table_id}"}} 1' in response
+    assert 'tcp_ip_poker_turn_seconds_bucket{le="+Inf"}' in response
+    assert 'tcp_ip_poker_cache_hits_total{cache="isomorphism"}' in response
+    assert (await _fetch(port, '/profile')).startswith('HTTP/1.0 400')
+    assert (await _fetch(port, '/nothing')).startswith('HTTP/1.0 404')
+    endpoint.close()
+    listener.close()
+
+def test_server_metrics():
+    try:
+        asyncio.run(_play())
+    finally:
+        metrics.disable()
+
+async def _run_server(monkeypatch, **options):
+    hosts = []
+    serve = metrics.serve
+
+    async def record(host, port):
+        hosts.append(host)
+        return await serve(host, port)
+    monkeypatch.setattr(metrics, 'serve', record)
+    task = asyncio.ensure_future(server.run('0.0.0.0', 0, metrics_port=0, **options))
+    while not hosts:
+        await asyncio.sleep(0.01)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    return hosts[0]
+
+def test_metrics_host(monkeypatch):
+    """ Metrics stay on the loopback interface even when the game listens on every interface """
+    try:
+        assert asyncio.run(_run_server(monkeypatch)) == '127.0.0.1'
+        assert asyncio.run(_run_server(monkeypatch, metrics_host='0.0.0.0')) == '0.0.0.0'
+    finally:
+        metrics.disable()
+
+def test_metrics_workers():
+    """ A lobby does not collect metrics so asking for them is an error, not ignored """
+    with pytest.raises(SystemExit):
+        server.main(['--workers', '1', '--metrics', '9777'])
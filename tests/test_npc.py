@@ -0,0 +1,91 @@
+import asyncio, time
+
+from tcp_ip_poker import Action, Card, CardSet, Suit, TexasHoldem, npc
+from tcp_ip_poker.npc import NPCEngine
+from tcp_ip_poker.server import Server
+
+from test_server import _Client
+
+def _mask(*cards):
+    return CardSet(Card(suit, value) for suit, value in cards).mask
+
+def test_decide():
+    aces = _mask((Suit.SPADES, 1), (Suit.HEARTS, 1))
+    npc.decide(aces, 0, 1, time.monotonic() + 0.01)
+    start = time.monotonic()
+    decision = npc.decide(aces, 0, 1, start + 0.01, seed=1)
+    assert time.monotonic() - start < 0.1
+    assert decision.action == Action.CHECK and decision.samples > 0 and decision.equity > 0.7
+    board = _mask((Suit.CLUBS, 1), (Suit.DIAMONDS, 13), (Suit.SPADES, 9), (Suit.HEARTS, 7), (Suit.CLUBS, 4))
+    hopeless = npc.decide(_mask((Suit.SPADES, 2), (Suit.DIAMONDS, 3)), board, 3, time.monotonic() + 0.01, 0.5)
+    assert hopeless.action == Action.FOLD
+    assert npc.decide(aces, 0, 1, time.monotonic() - 1).samples == 0
+
+    game = TexasHoldem()
+    player = game.add_player(None)
+    game.add_player(None)
+    game.start()
+    decision = NPCEngine(processes=0).decide(game, player)
+    assert decision.action in (Action.CHECK, Action.FOLD)
+
+async def _play():
+    server = Server(npc=NPCEngine(processes=0))
+    listener = await server.serve('127.0.0.1', 0)
+    port = listener.sockets[0].getsockname()[1]
+    client = await _Client().connect(port)
+    await client.send('NPC')
+    assert await client.expect('ERROR') == 'ERROR Not at a table'
+    await client.send('JOIN')
+    await client.expect('OK JOIN')
+    await client.send('NPC')
+    assert await client.expect('PLAYERS') == f'PLAYERS {client.host},NPC0'
+    await client.expect('OK NPC')
+    await client.send('START')
+    await client.expect('HAND ')
+    while True:
+        line = await client.expect('')
+        if line.startswith('RESULT'):
+            break
+        if line == f'TURN {client.host}':
+            await client.send('CHECK')
+    listener.close()
+    await listener.wait_closed()
+
+def test_server_npc():
+    asyncio.run(_play())
+
+async def _decide_while_serving(engine):
+    """ Returns a decision and how often the event loop ran while it was made """
+    game = TexasHoldem()
+    player = game.add_player(None)
+    game.add_player(None)
+    game.start()
+    ticks = 0
+    done = False
+
+    async def tick():
+        nonlocal ticks
+        while not done:
+            await asyncio.sleep(0.001)
+            ticks += 1
+    ticker = asyncio.ensure_future(tick())
+    await asyncio.sleep(0)
+    # The first decision of a process pool waits for its processes to start
+    await engine.decide_async(game, player)
+    ticks = 0
+    decision = await engine.decide_async(game, player)
+    done = True
+    await ticker
+    engine.close()
+    return decision, ticks
+
+def test_pooled_decisions():
+    budget = 0.05
+    for engine in (NPCEngine(budget, processes=1), NPCEngine(budget, threads=1)):
+        engine.warm_up()
+        decision, ticks = asyncio.run(_decide_while_serving(engine))
+        assert decision.samples > 0 and decision.action in (Action.CHECK, Action.FOLD)
+        # The loop keeps running while the pool decides
+        assert ticks >= 5
+    decision, ticks = asyncio.run(_decide_while_serving(NPCEngine(budget, processes=0)))
+    assert decision.samples > 0 and ticks <= 1
@@ -0,0 +1,56 @@
+import random
+import pytest
+
+from tcp_ip_poker import Card, CardSet, Suit, TexasHoldem, evaluator, outs
+from tcp_ip_poker.isomorphism import LRUCache
+
+def test_outs_match_brute_force():
+    rng = random.Random(2)
+    for _ in range(30):
+        cards = rng.sample(range(52), 9 + rng.choice((0, 3, 4)))
+        holes = [CardSet(Card.from_id(card_id) for card_id in cards[idx:idx + 2]) for idx in (0, 2, 4)]
+        dead = CardSet(Card.from_id(card_id) for card_id in cards[6:9])
+        board = CardSet(Card.from_id(card_id) for card_id in cards[9:])
+        results = outs.analyze(holes, board, dead)
+        known = board | dead
+        for hole in holes:
+            known = known | hole
+        for seat, hole in enumerate(holes):
+            strength = evaluator.evaluate_mask(hole.mask | board.mask)
+            assert results[seat].strength == strength
+            improving, winning = set(), set()
+            for card in CardSet(CardSet.FULL_MASK) - known:
+                after = [evaluator.evaluate_mask(other.mask | board.mask | card.mask) for other in holes]
+                if evaluator.category(after[seat]) > evaluator.category(strength):
+                    improving.add(card)
+                if after[seat] == max(after):
+                    winning.add(card)
+            assert set(results[seat].improving) == improving
+            assert set(results[seat].winning) == winning
+
+def test_outs_of_game():
+    random.seed(4)
+    game = TexasHoldem()
+    for _ in range(3):
+        game.add_player()
+    game.start()
+    game.fold(game.players_turn)
+    results = outs.of_game(game)
+    assert len(results) == 2
+    assert sum(result.leading for result in results.values()) >= 1
+    assert all(len(result.winning) <= 52 - 3 - 6 for result in results.values())
+    with pytest.raises(ValueError):
+        outs.analyze([[Card(Suit.SPADES, 1)]], [Card(Suit.SPADES, 1)])
+
+def test_outs_cache():
+    rng = random.Random(5)
+    cache = LRUCache()
+    # Swapping two suits gives an isomorphic situation answered from the cache
+    swap = {Suit.SPADES: Suit.HEARTS, Suit.HEARTS: Suit.SPADES, Suit.CLUBS: Suit.CLUBS, Suit.DIAMONDS: Suit.DIAMONDS}
+    for _ in range(20):
+        cards = [Card.from_id(card_id) for card_id in rng.sample(range(52), 9)]
+        for situation in (cards, [Card(swap[card.suit], card.value) for card in cards]):
+            holes = [CardSet(situation[idx:idx + 2]) for idx in (0, 2, 4)]
+            dead, board = CardSet(situation[6:7]), CardSet(situation[7:])
+            assert outs.analyze(holes, board, dead, cache) == outs.analyze(holes, board, dead)
+    assert cache.misses == 20 and cache.hits == 20
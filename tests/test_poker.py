@@ -1,6 +1,8 @@
+import copy, pickle, random
 import pytest
 
-from tcp_ip_poker import Card, Deck, Suit, TexasHoldem, VictoryCombination, Player
+from tcp_ip_poker import evaluator
+from tcp_ip_poker import Card, CardSet, Deck, EventType, GameEvent, Suit, TexasHoldem, VictoryCombination, Player
 
 def test_cards():
     deck = Deck()
@@ -16,7 +18,57 @@ def test_cards():
     for suit in suit_cards:
         assert len(suit_cards[suit]) == 13
 
+
+def test_card_set():
+    ace = Card(Suit.HEARTS, 1)
+    assert ace is Card(Suit.HEARTS, 1)
+    assert copy.copy(ace) is ace
+    assert pickle.loads(pickle.dumps(ace)) is ace
+    assert Card.from_id(ace.id) is ace
+    with pytest.raises(ValueError):
+        Card(Suit.HEARTS, 14)
+
+    deck = Deck()
+    assert len(set(card.id for card in deck.get_cards(Deck.MAX_DECK_SIZE))) == Deck.MAX_DECK_SIZE
+    deck.fill()
+    hand = CardSet(deck.get_cards(2))
+    assert len(hand) == 2
+    assert hand.isdisjoint(deck.card_set)
+    assert (hand | deck.card_set).mask == CardSet.FULL_MASK
+    assert list(hand | hand) == list(hand)
+    assert all(card in hand for card in hand)
+    assert ace in hand.add(ace) and ace not in hand.add(ace).remove(ace)
+
+    player = Player('127.0.0.1')
+    player.pick_cards(hand)
+    assert player.hand_set == hand
+    player.discard_card(0)
+    assert len(player.hand_set) == 1
     
+def test_deck():
+    deck = Deck(random.Random(0))
+    assert [card.id for card in deck.get_cards(3)] == [51, 50, 49]
+    deck.fill()
+    deck.shuffle(3)
+    top = deck.peek_top()
+    assert deck.peek_top() is top and deck.get_card() is top
+    dealt = [top] + deck.get_cards(10) + [deck.get_card()]
+    assert len(deck) == Deck.MAX_DECK_SIZE - 12
+    assert CardSet(dealt).isdisjoint(deck.card_set) and len(CardSet(dealt)) == 12
+    deck.fill()
+    deck.remove(dealt[:2])
+    assert len(deck) == Deck.MAX_DECK_SIZE - 2 and dealt[0] not in deck.card_set
+    assert len(CardSet(deck.get_cards(Deck.MAX_DECK_SIZE))) == Deck.MAX_DECK_SIZE - 2
+    assert deck.empty and deck.get_card() is None
+
+    # Every card is equally likely to be dealt first
+    counts = [0] * Deck.MAX_DECK_SIZE
+    for _ in range(52000):
+        deck.fill()
+        counts[deck.get_card().id] += 1
+    assert min(counts) > 850 and max(counts) < 1150
+
+
 def test_victory_combinations():
     # normal cases
     high_card_hand = [
@@ -135,9 +187,126 @@ def test_full_game():
     for _ in range(3):
         assert len(game.table) == 3 + _
         for player in players:
+            assert game.hand_strength(player) == evaluator.evaluate(player.hand + game.table)
+            assert game.current_combination(player).value == evaluator.category(game.hand_strength(player))
             game.check(player)
 
+    assert game.table_set == CardSet(game.table)
     assert not game.active
     winner, tied = game.get_result()
     assert isinstance(winner, list) or isinstance(winner, Player)
-    assert isinstance(tied, bool)
\ No newline at end of file
+    assert isinstance(tied, bool)
+
+def test_rank_players():
+    assert evaluator.rank([5, 9, 5, 1, 9]) == [[1, 4], [0, 2], [3]]
+    assert evaluator.rank([]) == []
+    board = [Card(Suit.SPADES, 2), Card(Suit.HEARTS, 7), Card(Suit.CLUBS, 9),
+             Card(Suit.DIAMONDS, 11), Card(Suit.SPADES, 13)]
+    hands = [
+        [Card(Suit.HEARTS, 2), Card(Suit.CLUBS, 3)],
+        [Card(Suit.HEARTS, 13), Card(Suit.CLUBS, 4)],
+        [Card(Suit.DIAMONDS, 2), Card(Suit.CLUBS, 5)],
+        [Card(Suit.DIAMONDS, 13), Card(Suit.HEARTS, 4)]
+    ]
+    assert VictoryCombination.rank_hands([hand + board for hand in hands]) == [[1, 3], [0, 2]]
+
+    random.seed(3)
+    game = TexasHoldem()
+    for _ in range(TexasHoldem.MAXIMUM_PLAYERS):
+        game.add_player()
+    game.start()
+    game.fold(game.players_turn)
+    while game.active:
+        game.check(game.players_turn)
+    ranking = game.rank_players()
+    assert sum(len(group) for group in ranking) == TexasHoldem.MAXIMUM_PLAYERS - 1
+    strengths = [game.hand_strength(group[0]) for group in ranking]
+    assert strengths == sorted(strengths, reverse=True)
+    assert all(game.hand_strength(player) == strengths[idx] for idx, group in enumerate(ranking) for player in group)
+    winner, tie = game.get_result()
+    assert (winner if tie else [winner]) == ranking[0]
+
+def _state(game):
+    result = game.get_result() if not game.active else None
+    if result is not None:
+        winner, tie = result
+        result = [player.host for player in winner] if tie else winner.host, tie
+    return (game.active, game.table, [player.hand for player in game.players], game.actions,
+            [player.host for player in game.folded], game.players_turn and game.players_turn.host,
+            game.strength, result)
+
+def test_snapshot():
+    rng = random.Random(7)
+    for _ in range(50):
+        game = TexasHoldem(random.Random(rng.random()))
+        for _ in range(rng.randint(2, 4)):
+            game.add_player(None)
+        game.start()
+        while True:
+            data = game.snapshot()
+            assert len(data) == TexasHoldem.SNAPSHOT_SIZE < 128
+            restored = TexasHoldem.restore(data, [player.host for player in game.players])
+            assert _state(restored) == _state(game)
+            assert restored.snapshot() == data
+            if not game.active:
+                break
+            # Both continue with the same cards
+            action = 'fold' if rng.random() < 0.2 else 'check'
+            getattr(game, action)(game.players_turn)
+            getattr(restored, action)(restored.players_turn)
+            assert _state(restored) == _state(game)
+    with pytest.raises(ValueError):
+        TexasHoldem.restore(data[:-1], ['a', 'b'])
+    with pytest.raises(ValueError):
+        TexasHoldem.restore(data, ['a'])
+
+def test_events():
+    rng = random.Random(11)
+    for _ in range(50):
+        game = TexasHoldem(random.Random(rng.random()))
+        for _ in range(rng.randint(2, 4)):
+            game.add_player(None)
+        game.start()
+        while game.active:
+            if rng.random() < 0.2:
+                game.fold(game.players_turn)
+            else:
+                game.check(game.players_turn)
+        events = game.events
+        assert events[0] == GameEvent(EventType.START, len(game.players))
+        assert [event.type for event in events].count(EventType.BOARD) == len(game.table) - 2
+        hosts = [player.host for player in game.players]
+        replayed = TexasHoldem.replay(events, hosts)
+        assert _state(replayed) == _state(game) and replayed.events == events
+        assert _state(TexasHoldem.replay(events, hosts, rescore=True)) == _state(game)
+
+    # Views follow the game without copying and can not change it
+    game = TexasHoldem(random.Random(1))
+    game.add_player('a')
+    game.add_player('b')
+    table = game.table
+    game.start()
+    assert len(table) == 3 and table == game.table and list(table) + [] == table + []
+    with pytest.raises(TypeError):
+        table[0] = table[1]
+
+    # A replayed hand goes on with the cards not dealt
+    replayed = TexasHoldem.replay(game.events, ['a', 'b'])
+    replayed.check(replayed.players_turn)
+    replayed.check(replayed.players_turn)
+    dealt = CardSet(replayed.table) | replayed.players[0].hand_set | replayed.players[1].hand_set
+    assert len(replayed.table) == 4 and len(dealt) == 8
+
+    # Rescoring takes the result from the cards instead of the event
+    events = list(TexasHoldem.replay(game.events, ['a', 'b']).events)
+    while events[-1].type != EventType.SHOWDOWN:
+        replayed = TexasHoldem.replay(events, ['a', 'b'])
+        replayed.check(replayed.players_turn)
+        events = list(replayed.events)
+    forged = events[:-1] + [events[-1]._replace(seat=0b11, strength=1)]
+    assert TexasHoldem.replay(forged, ['a', 'b']).strength == 1
+    assert TexasHoldem.replay(forged, ['a', 'b'], rescore=True).events == events
+    with pytest.raises(ValueError):
+        TexasHoldem.replay(events[:1] + events[2:], ['a', 'b'])
+    with pytest.raises(ValueError):
+        TexasHoldem.replay(events + events[-1:], ['a', 'b'])
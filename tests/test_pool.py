@@ -0,0 +1,14 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from tcp_ip_poker import pool
+
+def test_ordered_results():
+    jobs = [(value, 3) for value in range(20)]
+    expected = [value ** 3 for value in range(20)]
+    assert list(pool.run(pow, jobs, processes=1)) == expected
+    with ProcessPoolExecutor(2) as executor:
+        assert list(pool.run(pow, iter(jobs), executor=executor)) == expected
+        results = pool.run(pow, iter(jobs), 2, executor)
+        assert next(results) == 0
+        results.close()
+        assert list(pool.run(pow, jobs[:3], 2, executor)) == [0, 1, 8]
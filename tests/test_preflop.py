@@ -0,0 +1,97 @@
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import pytest
+
+from tcp_ip_poker import Card, Suit
+from tcp_ip_poker import preflop, tables
+
+def test_hand_classes():
+    classes = {}
+    for first, second in itertools.combinations(range(Card.IDS), 2):
+        index = preflop.hand_class([Card.from_id(first), Card.from_id(second)])
+        classes.setdefault(index, set()).add((first, second))
+    assert len(classes) == preflop.CLASSES
+    for index, combinations in classes.items():
+        assert combinations == set(tuple(sorted(c)) for c in preflop.class_combinations(index))
+    assert preflop.class_name(preflop.hand_class([Card(Suit.SPADES, 1), Card(Suit.SPADES, 13)])) == 'AKs'
+    assert preflop.class_name(preflop.hand_class([Card(Suit.SPADES, 7), Card(Suit.HEARTS, 2)])) == '72o'
+    assert preflop.class_name(preflop.hand_class([Card(Suit.CLUBS, 10), Card(Suit.HEARTS, 10)])) == 'TT'
+
+def test_table_file(tmp_path):
+    assert preflop.DEFAULT_PATH.parent == tables.DIRECTORY
+    path = tmp_path / 'tables' / 'preflop.bin'
+    values = [idx % (preflop.SCALE + 1) for idx in range(preflop.CLASSES * preflop.CLASSES)]
+    preflop.write(path, values)
+    assert [entry.name for entry in path.parent.iterdir()] == ['preflop.bin']
+    aces = [Card(Suit.SPADES, 1), Card(Suit.HEARTS, 1)]
+    kings = [Card(Suit.SPADES, 13), Card(Suit.HEARTS, 13)]
+    with preflop.PreflopTable(path) as table:
+        hero, villain = preflop.hand_class(aces), preflop.hand_class(kings)
+        assert table.equity(aces, kings) == values[hero * preflop.CLASSES + villain] / preflop.SCALE
+        assert table.equity(5, 7) == values[5 * preflop.CLASSES + 7] / preflop.SCALE
+    path.write_bytes(path.read_bytes()[:-2])
+    with pytest.raises(ValueError):
+        preflop.PreflopTable(path)
+
+def test_matchup_equity():
+    pytest.importorskip('numpy')
+    aces = (Card(Suit.SPADES, 1).id, Card(Suit.HEARTS, 1).id)
+    kings = (Card(Suit.CLUBS, 13).id, Card(Suit.DIAMONDS, 13).id)
+    assert preflop.matchup_equity(aces, kings) == pytest.approx(0.8126, abs=0.0005)
+
+def test_range():
+    assert preflop.class_index('aks') == preflop.class_index('AKs')
+    with pytest.raises(ValueError):
+        preflop.class_index('AAs')
+    hands = preflop.Range('QQ+, ATs+, KQ:0.5, 72o')
+    assert {preflop.class_name(index) for index in hands.classes} == {
+        'AA', 'KK', 'QQ', 'AKs', 'AQs', 'AJs', 'ATs', 'KQs', 'KQo', '72o'}
+    assert 'KQo' in hands and 'KJo' not in hands
+    assert hands.combinations == 3 * 6 + 4 * 4 + 0.5 * 16 + 12
+    with pytest.raises(ValueError):
+        preflop.Range({'AA': 2})
+
+def test_range_equity(tmp_path):
+    path = tmp_path / 'preflop.bin'
+    values = [round(preflop.SCALE / 2)] * (preflop.CLASSES * preflop.CLASSES)
+    aces, kings, ak = preflop.class_index('AA'), preflop.class_index('KK'), preflop.class_index('AKo')
+    for hero, villain, equity in ((aces, kings, 0.8), (aces, ak, 0.9), (kings, ak, 0.7)):
+        values[hero * preflop.CLASSES + villain] = round(equity * preflop.SCALE)
+        values[villain * preflop.CLASSES + hero] = round((1 - equity) * preflop.SCALE)
+    preflop.write(path, values)
+    with preflop.PreflopTable(path) as table:
+        assert table.range_equity(preflop.Range('AA'), preflop.Range('KK')) == pytest.approx(0.8, abs=1e-4)
+        # Aces block AK: 6 * 6 KK matchups and 6 * 6 AKo matchups of the 6 * 12 possible
+        assert table.range_equity(preflop.Range('AA'), preflop.Range('KK, AKo')) == pytest.approx(
+            (36 * 0.8 + 36 * 0.9) / 72, abs=1e-4)
+        assert table.range_equity(preflop.Range('AA, KK'), preflop.Range('AA:0.5')) == pytest.approx(
+            (6 * 0.5 + 36 * 0.2) / 42, abs=1e-4)
+        with pytest.raises(ValueError):
+            table.range_equity(preflop.Range('AA'), preflop.Range())
+
+def test_build_resume(tmp_path, monkeypatch):
+    path = tmp_path / 'preflop.bin'
+    calls = []
+    interrupt = [1000]
+
+    def fake(pair):
+        if len(calls) == interrupt[0]:
+            raise RuntimeError('interrupted')
+        calls.append(pair)
+        return (pair[0] + pair[1]) / (2 * preflop.CLASSES)
+
+    monkeypatch.setattr(preflop, '_class_equity', fake)
+    with ThreadPoolExecutor(1) as executor:
+        with pytest.raises(RuntimeError):
+            preflop.build(path, executor=executor)
+    assert not path.exists()
+    assert (tmp_path / 'preflop.bin.partial').stat().st_size == 1000 * preflop.CHECKPOINT.size
+    with ThreadPoolExecutor(1) as executor:
+        calls.clear()
+        interrupt[0] = None
+        preflop.build(path, executor=executor)
+    assert len(calls) == preflop.CLASSES * (preflop.CLASSES - 1) // 2 - 1000
+    assert not (tmp_path / 'preflop.bin.partial').exists()
+    with preflop.PreflopTable(path) as table:
+        assert table.equity(3, 100) == pytest.approx(103 / (2 * preflop.CLASSES), abs=1e-4)
+        assert table.equity(100, 3) == pytest.approx(1 - 103 / (2 * preflop.CLASSES), abs=1e-4)
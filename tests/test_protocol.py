@@ -0,0 +1,125 @@
+import asyncio
+import pytest
+
+from tcp_ip_poker import Card, Suit, protocol
+from tcp_ip_poker.protocol import Decoder, Encoder, FrameType
+from tcp_ip_poker.lobby import Lobby
+from tcp_ip_poker.server import Server
+
+def test_codec():
+    cards = [Card(Suit.SPADES, 1), Card(Suit.HEARTS, 10), Card(Suit.CLUBS, 2)]
+    encoder = Encoder()
+    encoder.hello()
+    encoder.players(['127.0.0.1:1', 'NPC0'])
+    encoder.deal(1, cards[:2])
+    encoder.board(cards)
+    encoder.turn(1)
+    encoder.result(True, [0, 1])
+    encoder.ok(FrameType.JOIN, 70000)
+    data = encoder.flush()
+    assert len(encoder) == 0
+
+    decoder = Decoder(64)
+    frames = []
+    # Feed one byte at a time so frames are split everywhere
+    for idx in range(len(data)):
+        decoder.feed(data[idx:idx + 1])
+        for frame_type, body in decoder.frames():
+            frames.append((frame_type, bytes(body)))
+    assert len(decoder) == 0
+    assert [frame_type for frame_type, _ in frames] == [
+        FrameType.HELLO, FrameType.PLAYERS, FrameType.DEAL, FrameType.BOARD,
+        FrameType.TURN, FrameType.RESULT, FrameType.OK]
+    bodies = [memoryview(body) for _, body in frames]
+    assert protocol.decode_hello(bodies[0]) == protocol.VERSION
+    assert protocol.decode_players(bodies[1]) == ['127.0.0.1:1', 'NPC0']
+    assert protocol.decode_deal(bodies[2]) == (1, cards[:2])
+    assert protocol.decode_cards(bodies[3]) == cards
+    assert protocol.decode_seat(bodies[4]) == 1
+    assert protocol.decode_result(bodies[5]) == (True, [0, 1])
+    assert protocol.decode_ok(bodies[6]) == (FrameType.JOIN, 70000)
+
+    decoder.feed(b'JOIN 1\nCHE')
+    assert [bytes(line) for line in decoder.lines()] == [b'JOIN 1']
+    decoder.feed(b'CK\n')
+    assert [bytes(line) for line in decoder.lines()] == [b'CHECK']
+
+    decoder = Decoder(16)
+    decoder.feed(protocol.HEADER.pack(100))
+    with pytest.raises(protocol.ProtocolError):
+        list(decoder.frames())
+
+async def _play_binary():
+    server = Server()
+    listener = await server.serve('127.0.0.1', 0)
+    port = listener.sockets[0].getsockname()[1]
+    clients = [await asyncio.open_connection('127.0.0.1', port) for _ in range(2)]
+    decoders = [Decoder(), Decoder()]
+
+    async def receive(idx, wanted, body=None):
+        reader = clients[idx][0]
+        while True:
+            for frame_type, received in decoders[idx].frames():
+                if frame_type == wanted and body in (None, bytes(received)):
+                    return bytes(received)
+            decoders[idx].feed(await asyncio.wait_for(reader.read(4096), 5))
+
+    def send(idx, *frames):
+        encoder = Encoder()
+        for frame_type, *args in frames:
+            getattr(encoder, frame_type)(*args)
+        clients[idx][1].write(encoder.flush())
+
+    send(0, ('hello',), ('join',))
+    assert protocol.decode_hello(memoryview(await receive(0, FrameType.HELLO))) == protocol.VERSION
+    table_id = protocol.decode_ok(memoryview(await receive(0, FrameType.OK)))[1]
+    send(1, ('hello',), ('join', table_id), ('command', FrameType.START))
+    seat, hand = protocol.decode_deal(memoryview(await receive(1, FrameType.DEAL)))
+    assert seat == 1 and len(hand) == 2
+    for _ in range(3):
+        for idx in range(2):
+            await receive(idx, FrameType.TURN, bytes((idx,)))
+            send(idx, ('command', FrameType.CHECK))
+    tie, winners = protocol.decode_result(memoryview(await receive(0, FrameType.RESULT)))
+    assert winners and set(winners) <= {0, 1}
+    for _, writer in clients:
+        writer.close()
+    listener.close()
+    await listener.wait_closed()
+
+def test_binary_server_game():
+    asyncio.run(_play_binary())
+
+def test_malformed_bodies():
+    for decode, body in ((protocol.decode_hello, b''), (protocol.decode_join, b'\x01\x02'),
+                         (protocol.decode_ok, b'\x02'), (protocol.decode_players, b'\x02\x03ab'),
+                         (protocol.decode_cards, b'\x40'), (protocol.decode_deal, b'\x01\x02'),
+                         (protocol.decode_seat, b''), (protocol.decode_result, b'')):
+        with pytest.raises(protocol.ProtocolError):
+            decode(memoryview(body))
+
+async def _send_malformed(server):
+    errors = []
+    asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context))
+    listener = await server.serve('127.0.0.1', 0)
+    port = listener.sockets[0].getsockname()[1]
+    for frame in (bytes((FrameType.HELLO,)), bytes((FrameType.JOIN, 1, 2))):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(protocol.HEADER.pack(len(frame)) + frame)
+        # The connection is closed as a protocol error, not by an unhandled exception
+        assert await asyncio.wait_for(reader.read(), 5) == b''
+        writer.close()
+    assert not errors
+    listener.close()
+    await listener.wait_closed()
+
+async def _send_malformed_lobby():
+    lobby = Lobby(1)
+    try:
+        await _send_malformed(lobby)
+    finally:
+        lobby.close()
+
+def test_malformed_frames():
+    asyncio.run(_send_malformed(Server()))
+    asyncio.run(_send_malformed_lobby())
@@ -0,0 +1,59 @@
+import asyncio
+
+from tcp_ip_poker.server import Server
+
+class _Client:
+    async def connect(self, port):
+        self.reader, self.writer = await asyncio.open_connection('127.0.0.1', port)
+        host, port = self.writer.get_extra_info('sockname')[:2]
+        self.host = f'{host}:{port}'
+        return self
+
+    async def send(self, line):
+        self.writer.write(line.encode() + b'\n')
+        await self.writer.drain()
+
+    async def expect(self, prefix):
+        while True:
+            line = (await asyncio.wait_for(self.reader.readline(), 5)).decode().strip()
+            if line.startswith(prefix):
+                return line
+
+async def _play():
+    server = Server()
+    listener = await server.serve('127.0.0.1', 0)
+    port = listener.sockets[0].getsockname()[1]
+    first, second = await _Client().connect(port), await _Client().connect(port)
+    await first.send('JOIN')
+    assert await first.expect('OK') == 'OK JOIN 1'
+    await second.send('CHECK')
+    assert await second.expect('ERROR') == 'ERROR Not at a table'
+    await second.send('JOIN 1')
+    await second.expect('OK')
+    await first.send('START')
+    assert (await first.expect('HAND ')).count('[') == 2
+    for _ in range(3):
+        await first.expect(f'TURN {first.host}')
+        await first.send('CHECK')
+        await second.expect(f'TURN {second.host}')
+        await second.send('CHECK')
+    result = await first.expect('RESULT')
+    assert result.startswith('RESULT WIN') or result.startswith('RESULT TIE')
+
+    await first.send('START')
+    await second.expect(f'TURN {first.host}')
+    second.writer.close()
+    await first.send('CHECK')
+    assert await first.expect('RESULT') == f'RESULT WIN {first.host}'
+    assert len(server.tables) == 1
+
+    await first.send('QUIT')
+    await first.reader.read()
+    assert first.reader.at_eof()
+    listener.close()
+    await listener.wait_closed()
+    assert server.connections == 0
+    assert len(server.tables) == 0
+
+def test_server_game():
+    asyncio.run(_play())
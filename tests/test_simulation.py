@@ -0,0 +1,36 @@
+from concurrent.futures import ProcessPoolExecutor
+import random
+
+from tcp_ip_poker import CardSet, Card, TexasHoldem, evaluator, simulation
+
+def test_simulation_matches_engine():
+    first = next(simulation.hands(1, players=3, seed=5, processes=1))
+    game = TexasHoldem(random.Random('5/0'))
+    for _ in range(3):
+        game.add_player()
+    game.start()
+    while game.active:
+        game.check(game.players_turn)
+    assert tuple(card.id for card in game.table) == first.board
+    assert [tuple(card.id for card in player.hand) for player in game.players] == list(first.holes)
+    winner, tie = game.get_result()
+    winners = winner if tie else [winner]
+    assert tuple(game.players.index(player) for player in winners) == first.winners
+
+def test_simulation_stream(tmp_path):
+    local = list(simulation.hands(500, players=4, seed=3, processes=1, chunk_size=64))
+    with ProcessPoolExecutor(2) as executor:
+        pooled = list(simulation.hands(500, players=4, seed=3, executor=executor, chunk_size=64))
+    assert local == pooled
+    assert [result.hand for result in local] == list(range(500))
+    for result in local[:50]:
+        cards = [card_id for hole in result.holes for card_id in hole] + list(result.board)
+        assert len(set(cards)) == 13
+        strengths = [evaluator.evaluate_mask(CardSet(Card.from_id(card_id) for card_id in hole + result.board).mask)
+                     for hole in result.holes]
+        assert result.strength == max(strengths)
+        assert result.tie == (strengths.count(result.strength) > 1)
+
+    path = tmp_path / 'hands.tsv'
+    assert simulation.write(path, iter(local)) == 500
+    assert path.read_text(encoding='utf-8').splitlines()[0].split('\t')[0] == '0'
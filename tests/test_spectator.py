@@ -0,0 +1,105 @@
+import asyncio, random
+
+from tcp_ip_poker import Player, TexasHoldem, protocol, spectator
+from tcp_ip_poker.protocol import FrameType
+from tcp_ip_poker.server import Server
+from tcp_ip_poker.spectator import Spectators
+
+from test_server import _Client
+
+class _Watcher:
+    def __init__(self, binary=True):
+        self.binary = binary
+        self.player = Player('watcher')
+        self.buffered = 0
+        self.closed = False
+        self.written = []
+
+    def write(self, data):
+        self.written.append(data)
+
+    def close(self):
+        self.closed = True
+
+def _frames(data):
+    decoder = protocol.Decoder(1 << 16)
+    decoder.feed(data)
+    return [(frame_type, bytes(body)) for frame_type, body in decoder.frames()]
+
+async def _watch():
+    game = TexasHoldem(random.Random(3))
+    game.add_player('a')
+    game.add_player('b')
+    watchers = Spectators(game, tick=60)
+    fast, other, slow, text = _Watcher(), _Watcher(), _Watcher(), _Watcher(False)
+    for watcher in (fast, other, slow, text):
+        watchers.add(watcher)
+    game.start()
+    watchers.tick()
+    # Everyone starts from a snapshot of the running hand
+    assert [frame_type for frame_type, _ in _frames(fast.written[0])] == [
+        FrameType.PLAYERS, FrameType.BOARD, FrameType.TURN]
+    assert text.written[0].decode().splitlines()[0] == 'PLAYERS a,b'
+
+    slow.buffered = spectator.RESYNC_BUFFER + 1
+    game.check(game.players_turn)
+    game.check(game.players_turn)
+    watchers.tick()
+    # Two checks, the turn card and the turn encoded once for every watcher
+    assert fast.written[1] is other.written[1] and len(slow.written) == 1
+    assert [frame_type for frame_type, _ in _frames(fast.written[1])] == [
+        FrameType.CHECKED, FrameType.CHECKED, FrameType.BOARD, FrameType.TURN]
+    assert len(_frames(fast.written[1])[2][1]) == 4
+    assert text.written[1].decode().splitlines()[0] == 'CHECK a'
+
+    # A slow watcher is resynced once it has caught up
+    game.check(game.players_turn)
+    watchers.tick()
+    assert len(slow.written) == 1
+    slow.buffered = 0
+    watchers.tick()
+    assert len(slow.written) == 2 and _frames(slow.written[1])[0][0] == FrameType.PLAYERS
+
+    # or dropped if it does not
+    slow.buffered = spectator.RESYNC_BUFFER + 1
+    game.fold(game.players_turn)
+    watchers.tick()
+    assert not game.active and _frames(fast.written[-1])[-1] == (FrameType.RESULT, bytes((0, 0)))
+    watchers._watchers[slow].since -= spectator.RESYNC_TIMEOUT + 1
+    watchers.tick()
+    assert slow.closed and len(watchers) == 3
+    assert watchers.close() == [fast, other, text] and len(watchers) == 0
+
+def test_spectators():
+    asyncio.run(_watch())
+
+async def _play():
+    server = Server()
+    listener = await server.serve('127.0.0.1', 0)
+    port = listener.sockets[0].getsockname()[1]
+    player, other, watcher = [await _Client().connect(port) for _ in range(3)]
+    await watcher.send('WATCH 1')
+    assert await watcher.expect('ERROR') == 'ERROR No such table'
+    await player.send('JOIN')
+    await player.expect('OK JOIN')
+    await watcher.send('WATCH 1')
+    assert await watcher.expect('OK') == 'OK WATCH 1'
+    assert await watcher.expect('PLAYERS') == f'PLAYERS {player.host}'
+    await other.send('JOIN 1')
+    await other.expect('OK JOIN')
+    assert await watcher.expect('PLAYERS') == f'PLAYERS {player.host},{other.host}'
+    await player.send('START')
+    table = await player.expect('TABLE')
+    await player.expect(f'TURN {player.host}')
+    await player.send('FOLD')
+    assert await watcher.expect('TABLE') == table
+    assert await watcher.expect('FOLD') == f'FOLD {player.host}'
+    assert await watcher.expect('RESULT') == f'RESULT WIN {other.host}'
+    await watcher.send('LEAVE')
+    await watcher.expect('OK LEAVE')
+    assert not server.tables[0].spectators
+    listener.close()
+    await listener.wait_closed()
+
+def test_server_watch():
+    asyncio.run(_play())
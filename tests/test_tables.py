@@ -0,0 +1,46 @@
+import array, subprocess, sys, os
+
+import pytest
+
+from tcp_ip_poker import tables
+
+IMPORT_BUDGET = 0.05
+
+def test_load(tmp_path):
+    builds = []
+
+    def build():
+        builds.append(1)
+        return {'small': array.array('i', [1, -2, 3]), 'large': array.array('q', [1 << 40, 5])}
+
+    arrays = tables.load('test', 1, build, tmp_path)
+    assert list(arrays['small']) == [1, -2, 3] and list(arrays['large']) == [1 << 40, 5]
+    assert arrays['small'].readonly
+    assert list(tables.load('test', 1, build, tmp_path)['large']) == [1 << 40, 5]
+    assert len(builds) == 1
+    tables.load('test', 2, build, tmp_path)
+    assert len(builds) == 2
+    (tmp_path / 'test.bin').write_bytes(b'garbage')
+    assert list(tables.load('test', 2, build, tmp_path)['small']) == [1, -2, 3]
+    assert len(builds) == 3
+    unwritable = tmp_path / 'file'
+    unwritable.write_bytes(b'')
+    assert list(tables.load('test', 1, build, unwritable)['small']) == [1, -2, 3]
+    with pytest.raises(ValueError):
+        tables.write(tmp_path / 'bad.bin', 1, {'x' * 17: array.array('i')})
+
+def test_import_budget():
+    """ Importing the package root loads nothing else and stays within the budget """
+    script = ('import sys, time; start = time.perf_counter(); import tcp_ip_poker; '
+              'print(time.perf_counter() - start, "tcp_ip_poker.poker" in sys.modules)')
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    runs = [subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, env=env, check=True)
+            .stdout.split() for _ in range(3)]
+    assert min(float(seconds) for seconds, _ in runs) < IMPORT_BUDGET
+    assert all(loaded == 'False' for _, loaded in runs)
+
+    import tcp_ip_poker
+    assert tcp_ip_poker.Card is tcp_ip_poker.poker.Card
+    assert 'TexasHoldem' in dir(tcp_ip_poker)
+    with pytest.raises(AttributeError):
+        tcp_ip_poker.Nothing
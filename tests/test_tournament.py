@@ -0,0 +1,38 @@
+from concurrent.futures import ProcessPoolExecutor
+import math
+
+import pytest
+
+from tcp_ip_poker import TexasHoldem, tournament
+from tcp_ip_poker.tournament import Tournament
+
+def test_tournament_balances_tables():
+    event = Tournament(97, stack=100, ante=5, level_rounds=3, seed=2)
+    assert sorted(len(seats) for seats in event.tables.values()) == [3] * 3 + [4] * 22
+    busted = []
+    while not event.finished:
+        busted += event.play_round()
+        sizes = [len(seats) for seats in event.tables.values()]
+        assert len(sizes) == math.ceil(event.remaining / TexasHoldem.MAXIMUM_PLAYERS)
+        assert max(sizes) - min(sizes) <= 1
+        assert min(sizes) >= TexasHoldem.MINIMUM_PLAYERS or event.finished
+        chips = event.chips
+        assert len(chips) == event.remaining == 97 - len(busted)
+        assert sum(chips.values()) == 97 * 100 and all(chips.values())
+    result = event.result()
+    assert result.standings[1:] == tuple(reversed(busted)) and len(set(result.standings)) == 97
+    assert result.hands > result.rounds and result.broken == 24
+    with pytest.raises(Exception):
+        event.play_round()
+
+def test_tournament_pool():
+    local = Tournament(600, seed=4).run(processes=1)
+    with ProcessPoolExecutor(2) as executor:
+        pooled = Tournament(600, seed=4).run(executor=executor)
+    assert local == pooled
+
+def test_side_pots():
+    # The short stack wins the main pot only, the side pot goes to the next best hand
+    assert tournament._settle([5, 10, 10], [9, 5, 1], 10) == [15, 10, 0]
+    assert tournament._settle([10, 10, 10], [3, 3, 1], 10) == [15, 15, 0]
+    assert tournament._settle([10, 10, 25], [1, 1, 1], 20) == [10, 10, 25]